@@ -0,0 +1,789 @@
+"""
+In-process Lux AI 2021 game engine, a port of the rules of the Node.js engine
+that kaggle_environments runs (kaggle_environments/envs/lux_ai_2021/dimensions).
+
+The map, the roads and the city tiles are held in (height, width) numpy arrays
+and the units in padded numpy arrays, so that a turn is simulated without
+starting a Node process or serialising the state to strings. The engine still
+produces the same `updates` as the Kaggle observations, for lux.game.Game._update.
+
+The random maps of the Node engine cannot be generated here, an engine is
+started from an observation instead, e.g. the first step of a recorded episode:
+
+    engine = LuxEngine.from_observation(episode["steps"][0][0]["observation"])
+    updates = engine.step([actions_of_player_0, actions_of_player_1])
+
+The engine is checked turn by turn against the recorded episodes with
+
+    python -m env.lux_engine ../imitation-learning/lux-episodes
+"""
+
+import glob
+import json
+import logging
+import math
+import os
+import re
+import time
+
+import numpy as np
+
+from typing import Callable, Dict, List, Optional, Tuple
+
+from lux.game_constants import GAME_CONSTANTS
+
+logger = logging.getLogger(__name__)
+
+PARAMETERS = GAME_CONSTANTS["PARAMETERS"]
+
+TEAMS = (0, 1)
+WORKER, CART = 0, 1
+RESOURCE_NAMES = ("wood", "coal", "uranium")
+WOOD, COAL, URANIUM = 0, 1, 2
+
+# the order of the adjacent cells in the Node engine, the resources are also collected from the cell of the worker
+DIRECTION_DELTAS = {"n": (0, -1), "e": (1, 0), "s": (0, 1), "w": (-1, 0), "c": (0, 0)}
+ADJACENT_DELTAS = [(0, -1), (1, 0), (0, 1), (-1, 0)]
+
+UNIT_CAPACITY = np.array([PARAMETERS["RESOURCE_CAPACITY"]["WORKER"], PARAMETERS["RESOURCE_CAPACITY"]["CART"]])
+UNIT_LIGHT_UPKEEP = (PARAMETERS["LIGHT_UPKEEP"]["WORKER"], PARAMETERS["LIGHT_UPKEEP"]["CART"])
+UNIT_ACTION_COOLDOWN = (PARAMETERS["UNIT_ACTION_COOLDOWN"]["WORKER"], PARAMETERS["UNIT_ACTION_COOLDOWN"]["CART"])
+COLLECTION_RATE = [PARAMETERS["WORKER_COLLECTION_RATE"][name.upper()] for name in RESOURCE_NAMES]
+FUEL_RATE = np.array([PARAMETERS["RESOURCE_TO_FUEL_RATE"][name.upper()] for name in RESOURCE_NAMES])
+RESEARCH_REQUIREMENT = [0, PARAMETERS["RESEARCH_REQUIREMENTS"]["COAL"], PARAMETERS["RESEARCH_REQUIREMENTS"]["URANIUM"]]
+
+UNIT_ARRAYS = ["unit_team", "unit_type", "unit_x", "unit_y", "unit_cooldown", "unit_cargo", "unit_alive"]
+
+# the number of steps of a Kaggle episode, the first step is the initial observation
+EPISODE_STEPS = 361
+
+
+def format_number(value) -> str:
+    # as javascript prints numbers, without a trailing .0 for integers
+    value = float(value)
+    if value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def parse_int(string: str) -> Optional[int]:
+    # as javascript parseInt, None for NaN
+    match = re.match(r"\s*[+-]?\d+", string)
+    return int(match.group()) if match else None
+
+
+class City:
+    def __init__(self, team: int, fuel: float = 0):
+        self.team = team
+        self.fuel = fuel
+        self.cells: List[Tuple[int, int]] = []
+
+
+class LuxEngine:
+    """
+    State of a game and the rules to advance it by a turn.
+
+    The grids are indexed [y, x]
+    - resource_type: -1 where there is no resource, else an index of RESOURCE_NAMES
+    - resource_amount, road
+    - city_number: the number N of the city c_N that the city tile belongs to, 0 where there is no city tile
+    - city_team: -1 where there is no city tile
+    - city_cooldown
+
+    The units are held in arrays of unit_capacity rows, in the order they were created,
+    only the rows with unit_alive set are units of the game.
+    """
+
+    def __init__(self, width: int, height: int, turn: int = 0,
+                 global_unit_id_count: int = 0, global_city_id_count: int = 0,
+                 episode_steps: int = EPISODE_STEPS, unit_capacity: int = 64):
+        self.width = width
+        self.height = height
+        self.turn = turn
+        self.global_unit_id_count = global_unit_id_count
+        self.global_city_id_count = global_city_id_count
+        self.episode_steps = episode_steps
+        self.done = False
+
+        self.research_points = [0, 0]
+        # cities by number, in the order they were founded
+        self.cities: Dict[int, City] = {}
+        self.allocate_grids()
+
+        self.unit_count = 0
+        self.unit_ids: List[str] = []
+        self.unit_index: Dict[str, int] = {}
+        self.allocate_units(unit_capacity)
+
+    def allocate_grids(self):
+        shape = (self.height, self.width)
+        self.resource_type = np.full(shape, -1, dtype=np.int8)
+        self.resource_amount = np.zeros(shape, dtype=np.int64)
+        self.road = np.zeros(shape, dtype=np.float64)
+        self.city_number = np.zeros(shape, dtype=np.int64)
+        self.city_team = np.full(shape, -1, dtype=np.int8)
+        self.city_cooldown = np.zeros(shape, dtype=np.float64)
+
+    def allocate_units(self, capacity: int):
+        self.unit_team = np.zeros(capacity, dtype=np.int8)
+        self.unit_type = np.zeros(capacity, dtype=np.int8)
+        self.unit_x = np.zeros(capacity, dtype=np.int64)
+        self.unit_y = np.zeros(capacity, dtype=np.int64)
+        self.unit_cooldown = np.zeros(capacity, dtype=np.float64)
+        self.unit_cargo = np.zeros((capacity, 3), dtype=np.int64)
+        self.unit_alive = np.zeros(capacity, dtype=bool)
+
+    @classmethod
+    def from_observation(cls, observation: dict, episode_steps: int = EPISODE_STEPS, **kwargs) -> "LuxEngine":
+        updates = observation["updates"]
+        if observation["step"] == 0:
+            updates = updates[2:]
+        engine = cls(observation["width"], observation["height"], observation["step"],
+                     observation["globalUnitIDCount"], observation["globalCityIDCount"], episode_steps, **kwargs)
+        engine.load_updates(updates)
+        return engine
+
+    def load_updates(self, updates: List[str]):
+        # sets the state from the updates of an observation, as the reset of the Node engine
+        for update in updates:
+            if update == "D_DONE":
+                break
+            strs = update.split(" ")
+            if strs[0] == "rp":
+                self.research_points[int(strs[1])] = int(strs[2])
+            elif strs[0] == "r":
+                x, y = int(strs[2]), int(strs[3])
+                self.resource_type[y, x] = RESOURCE_NAMES.index(strs[1])
+                self.resource_amount[y, x] = int(strs[4])
+            elif strs[0] == "u":
+                index = self.add_unit(int(strs[2]), int(strs[1]), int(strs[4]), int(strs[5]), strs[3])
+                self.unit_cooldown[index] = float(strs[6])
+                self.unit_cargo[index] = [int(strs[7]), int(strs[8]), int(strs[9])]
+            elif strs[0] == "c":
+                self.cities[int(strs[2][2:])] = City(int(strs[1]), float(strs[3]))
+            elif strs[0] == "ct":
+                x, y = int(strs[3]), int(strs[4])
+                number = int(strs[2][2:])
+                self.cities[number].cells.append((x, y))
+                self.city_number[y, x] = number
+                self.city_team[y, x] = int(strs[1])
+                self.city_cooldown[y, x] = float(strs[5])
+            elif strs[0] == "ccd":
+                self.road[int(strs[2]), int(strs[1])] = float(strs[3])
+
+    # units
+
+    def add_unit(self, team: int, unit_type: int, x: int, y: int, unit_id: str = None) -> int:
+        if self.unit_count == len(self.unit_alive):
+            self._grow_units()
+        if unit_id is None:
+            self.global_unit_id_count += 1
+            unit_id = "u_{}".format(self.global_unit_id_count)
+
+        index = self.unit_count
+        self.unit_count += 1
+        self.unit_team[index] = team
+        self.unit_type[index] = unit_type
+        self.unit_x[index] = x
+        self.unit_y[index] = y
+        self.unit_cooldown[index] = 0
+        self.unit_cargo[index] = 0
+        self.unit_alive[index] = True
+        self.unit_ids.append(unit_id)
+        self.unit_index[unit_id] = index
+        return index
+
+    def _grow_units(self):
+        for name in UNIT_ARRAYS:
+            array = getattr(self, name)
+            grown = np.zeros((2 * len(array),) + array.shape[1:], dtype=array.dtype)
+            grown[:len(array)] = array
+            setattr(self, name, grown)
+
+    def destroy_unit(self, index: int):
+        self.unit_alive[index] = False
+        del self.unit_index[self.unit_ids[index]]
+
+    def team_units(self, team: int) -> np.ndarray:
+        # indices of the units of the team, in the order they were created
+        count = self.unit_count
+        return np.flatnonzero(self.unit_alive[:count] & (self.unit_team[:count] == team))
+
+    def get_unit(self, team: int, unit_id: str) -> Optional[int]:
+        index = self.unit_index.get(unit_id)
+        if index is None or self.unit_team[index] != team:
+            return None
+        return index
+
+    def cargo_space_left(self, index: int) -> int:
+        return int(UNIT_CAPACITY[self.unit_type[index]] - self.unit_cargo[index].sum())
+
+    # cities
+
+    def in_map(self, x: int, y: int) -> bool:
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def is_city_tile(self, x: int, y: int) -> bool:
+        return self.city_team[y, x] >= 0
+
+    def get_road(self, x: int, y: int) -> float:
+        if self.city_team[y, x] >= 0:
+            return PARAMETERS["MAX_ROAD"]
+        return self.road[y, x]
+
+    def city_tile_count(self, team: int) -> int:
+        return int(np.count_nonzero(self.city_team == team))
+
+    def spawn_city_tile(self, team: int, x: int, y: int):
+        # joins the city of the first adjacent city tile of the team, and merges the other adjacent cities into it
+        adjacent_numbers = []
+        for dx, dy in ADJACENT_DELTAS:
+            if self.in_map(x + dx, y + dy) and self.city_team[y + dy, x + dx] == team:
+                number = int(self.city_number[y + dy, x + dx])
+                if number not in adjacent_numbers:
+                    adjacent_numbers.append(number)
+
+        if not adjacent_numbers:
+            self.global_city_id_count += 1
+            number = self.global_city_id_count
+            self.cities[number] = City(team)
+        else:
+            number = adjacent_numbers[0]
+        city = self.cities[number]
+        city.cells.append((x, y))
+        self.city_number[y, x] = number
+        self.city_team[y, x] = team
+        self.city_cooldown[y, x] = 0
+
+        for merged_number in adjacent_numbers[1:]:
+            merged_city = self.cities.pop(merged_number)
+            for cell_x, cell_y in merged_city.cells:
+                self.city_number[cell_y, cell_x] = number
+            city.cells.extend(merged_city.cells)
+            city.fuel += merged_city.fuel
+
+    def destroy_city(self, number: int):
+        for x, y in self.cities.pop(number).cells:
+            self.city_number[y, x] = 0
+            self.city_team[y, x] = -1
+            self.city_cooldown[y, x] = 0
+            self.road[y, x] = PARAMETERS["MIN_ROAD"]
+
+    def light_upkeep(self) -> np.ndarray:
+        # light upkeep of every city by number, reduced for every pair of adjacent city tiles of the city
+        same_team = np.zeros((self.height, self.width), dtype=np.int64)
+        city_team = self.city_team
+        vertical = (city_team[1:, :] >= 0) & (city_team[1:, :] == city_team[:-1, :])
+        horizontal = (city_team[:, 1:] >= 0) & (city_team[:, 1:] == city_team[:, :-1])
+        same_team[1:, :] += vertical
+        same_team[:-1, :] += vertical
+        same_team[:, 1:] += horizontal
+        same_team[:, :-1] += horizontal
+
+        size = self.global_city_id_count + 1
+        city_number = self.city_number.ravel()
+        tile_counts = np.bincount(city_number, minlength=size)
+        adjacency_counts = np.bincount(city_number, weights=same_team.ravel(), minlength=size).astype(np.int64)
+        return (tile_counts * PARAMETERS["LIGHT_UPKEEP"]["CITY"]
+                - adjacency_counts * PARAMETERS["CITY_ADJACENCY_BONUS"])
+
+    # turn
+
+    def is_night(self) -> bool:
+        day_length = PARAMETERS["DAY_LENGTH"]
+        return self.turn % (day_length + PARAMETERS["NIGHT_LENGTH"]) >= day_length
+
+    def step(self, actions: List[Optional[List[str]]]) -> List[str]:
+        """
+        Runs a turn with the actions of both players, as the update of the Node engine.
+        Returns the updates of the observation of the next turn.
+        """
+        self.run_turn(actions)
+        self.regenerate_trees()
+        self.end_turn()
+        self.run_cooldowns()
+        return self.updates()
+
+    def run_turn(self, actions: List[Optional[List[str]]]):
+        # the actions, the resources and the night, up to the growth of the trees
+        actions_by_type = self.validate_actions(actions)
+
+        unit_actions = {}
+        city_tile_actions = {}
+        for action_type in ["bcity", "bw", "bc", "p", "r", "t"]:
+            for action in actions_by_type[action_type]:
+                if action_type in ["bw", "bc", "r"]:
+                    city_tile_actions[action[2]] = action
+                else:
+                    unit_actions[action[2]] = action
+        for action in self.resolve_movement(actions_by_type["m"]):
+            if action[3] != "c":
+                unit_actions[action[2]] = action
+
+        self.run_city_tiles(city_tile_actions)
+        self.run_units(unit_actions)
+        self.distribute_all_resources()
+        self.deposit_resources()
+        if self.is_night():
+            self.handle_night()
+
+    def end_turn(self):
+        match_over = self.turn == self.episode_steps - 1 or any(
+            len(self.team_units(team)) + sum(city.team == team for city in self.cities.values()) == 0
+            for team in TEAMS)
+        self.turn += 1
+        self.done = match_over or self.turn >= self.episode_steps - 1
+
+    def validate_actions(self, actions: List[Optional[List[str]]]) -> Dict[str, list]:
+        # the invalid commands are dropped, as the Node engine does with a warning
+        actions_by_type = {action_type: [] for action_type in ["m", "r", "bw", "bc", "bcity", "t", "p"]}
+        unit_counts = [len(self.team_units(team)) for team in TEAMS]
+        city_tile_counts = [self.city_tile_count(team) for team in TEAMS]
+        built_counts = [0, 0]
+        placed = [set(), set()]
+
+        for team in TEAMS:
+            for command in actions[team] or []:
+                # the annotations are filtered out by kaggle_environments
+                if len(command) == 0 or command[0] == "d":
+                    continue
+                action = self.validate_command(team, command, placed[team])
+                if action is None:
+                    logger.debug("turn %d: invalid command of player %d: %s", self.turn, team, command)
+                    continue
+                if action[0] in ["bw", "bc"]:
+                    if unit_counts[team] + built_counts[team] >= city_tile_counts[team]:
+                        logger.debug("turn %d: unit cap reached for player %d: %s", self.turn, team, command)
+                        continue
+                    built_counts[team] += 1
+                placed[team].add(action[2])
+                actions_by_type[action[0]].append(action)
+        return actions_by_type
+
+    def validate_command(self, team: int, command: str, placed: set) -> Optional[tuple]:
+        # returns (type, team, key, ...) where key is the unit index or the (x, y) of the city tile
+        strs = command.split(" ")
+        action_type, args = strs[0], strs[1:]
+
+        if action_type in ["p", "bcity"]:
+            if len(args) != 1:
+                return None
+            index = self.get_unit(team, args[0])
+            if index is None or self.unit_cooldown[index] >= 1 or index in placed:
+                return None
+            if action_type == "bcity":
+                x, y = self.unit_x[index], self.unit_y[index]
+                if self.is_city_tile(x, y) or self.resource_amount[y, x] > 0:
+                    return None
+                if self.unit_cargo[index].sum() < PARAMETERS["CITY_BUILD_COST"]:
+                    return None
+            return (action_type, team, index)
+
+        if action_type in ["bw", "bc", "r"]:
+            if len(args) != 2:
+                return None
+            x, y = parse_int(args[0]), parse_int(args[1])
+            if x is None or y is None or not self.in_map(x, y) or self.city_team[y, x] != team:
+                return None
+            if (x, y) in placed or self.city_cooldown[y, x] >= 1:
+                return None
+            return (action_type, team, (x, y))
+
+        if action_type == "m":
+            if len(args) != 2:
+                return None
+            index = self.get_unit(team, args[0])
+            direction = args[1]
+            if index is None or self.unit_cooldown[index] >= 1 or index in placed:
+                return None
+            if direction not in DIRECTION_DELTAS:
+                return None
+            dx, dy = DIRECTION_DELTAS[direction]
+            x, y = int(self.unit_x[index]) + dx, int(self.unit_y[index]) + dy
+            if not self.in_map(x, y) or (self.is_city_tile(x, y) and self.city_team[y, x] != team):
+                return None
+            return (action_type, team, index, direction, (x, y))
+
+        if action_type == "t":
+            if len(args) != 4:
+                return None
+            source, destination = self.get_unit(team, args[0]), self.get_unit(team, args[1])
+            amount = parse_int(args[3])
+            if source is None or destination is None or self.unit_cooldown[source] >= 1 or source in placed:
+                return None
+            if source == destination:
+                return None
+            distance = (abs(self.unit_x[source] - self.unit_x[destination])
+                        + abs(self.unit_y[source] - self.unit_y[destination]))
+            if distance > 1 or amount is None or amount < 0 or args[2] not in RESOURCE_NAMES:
+                return None
+            return (action_type, team, source, destination, RESOURCE_NAMES.index(args[2]), amount)
+
+        return None
+
+    def resolve_movement(self, moves: List[tuple]) -> List[tuple]:
+        """
+        Cancels the moves that collide, as handleMovementActions of the Node engine.
+        Units collide when they move to the same cell, or to a cell of a unit that stays, unless it is a city tile.
+        A cancelled unit stays, so the moves to its cell are cancelled in turn.
+        """
+        moves_by_cell: Dict[Tuple[int, int], List[tuple]] = {}
+        for move in moves:
+            moves_by_cell.setdefault(move[4], []).append(move)
+        moving = {move[2] for move in moves}
+
+        units_by_cell: Dict[Tuple[int, int], List[int]] = {}
+        for index in np.flatnonzero(self.unit_alive[:self.unit_count]):
+            units_by_cell.setdefault((int(self.unit_x[index]), int(self.unit_y[index])), []).append(index)
+
+        def cancel(move):
+            cell = (int(self.unit_x[move[2]]), int(self.unit_y[move[2]]))
+            if not self.is_city_tile(*cell):
+                for cancelled_move in moves_by_cell.pop(cell, []):
+                    cancel(cancelled_move)
+
+        for cell in list(moves_by_cell):
+            cell_moves = moves_by_cell.get(cell)
+            if cell_moves is None:
+                continue
+            collided = []
+            if not self.is_city_tile(*cell):
+                if len(cell_moves) > 1:
+                    collided = cell_moves
+                else:
+                    staying = units_by_cell.get(cell, [])
+                    if len(staying) == 1 and staying[0] not in moving:
+                        collided = cell_moves
+            for move in collided:
+                cancel(move)
+            for move in collided:
+                moves_by_cell.pop(move[4], None)
+
+        return [move for cell_moves in moves_by_cell.values() for move in cell_moves]
+
+    def run_city_tiles(self, city_tile_actions: Dict[Tuple[int, int], tuple]):
+        for city in list(self.cities.values()):
+            for x, y in city.cells:
+                action = city_tile_actions.get((x, y))
+                if action is not None:
+                    if action[0] == "bw":
+                        self.add_unit(city.team, WORKER, x, y)
+                    elif action[0] == "bc":
+                        self.add_unit(city.team, CART, x, y)
+                    else:
+                        self.research_points[city.team] += 1
+                    self.city_cooldown[y, x] = PARAMETERS["CITY_ACTION_COOLDOWN"]
+                if self.city_cooldown[y, x] > 0:
+                    self.city_cooldown[y, x] -= 1
+
+    def run_units(self, unit_actions: Dict[int, tuple]):
+        night_multiplier = 2 if self.is_night() else 1
+        for team in TEAMS:
+            for index in self.team_units(team):
+                action = unit_actions.get(index)
+                unit_type = self.unit_type[index]
+                x, y = int(self.unit_x[index]), int(self.unit_y[index])
+
+                acted = False
+                if action is not None:
+                    if action[0] == "m":
+                        self.unit_x[index], self.unit_y[index] = action[4]
+                        acted = True
+                    elif action[0] == "t":
+                        self.transfer_resources(*action[2:])
+                        acted = True
+                    elif unit_type == WORKER and action[0] == "bcity":
+                        self.spawn_city_tile(team, x, y)
+                        self.expend_resources_for_city(index)
+                        acted = True
+                    elif unit_type == WORKER and action[0] == "p":
+                        self.road[y, x] = max(self.road[y, x] - PARAMETERS["PILLAGE_RATE"], PARAMETERS["MIN_ROAD"])
+                        acted = True
+                if acted:
+                    self.unit_cooldown[index] += UNIT_ACTION_COOLDOWN[unit_type] * night_multiplier
+
+                if unit_type == CART:
+                    x, y = int(self.unit_x[index]), int(self.unit_y[index])
+                    if self.get_road(x, y) < PARAMETERS["MAX_ROAD"]:
+                        self.road[y, x] = min(self.road[y, x] + PARAMETERS["CART_ROAD_DEVELOPMENT_RATE"],
+                                              PARAMETERS["MAX_ROAD"])
+
+    def transfer_resources(self, source: int, destination: int, resource: int, amount: int):
+        amount = min(amount, int(self.unit_cargo[source, resource]), self.cargo_space_left(destination))
+        self.unit_cargo[source, resource] -= amount
+        self.unit_cargo[destination, resource] += amount
+
+    def expend_resources_for_city(self, index: int):
+        spent = 0
+        for resource in [WOOD, COAL, URANIUM]:
+            cargo = int(self.unit_cargo[index, resource])
+            if spent + cargo > PARAMETERS["CITY_BUILD_COST"]:
+                self.unit_cargo[index, resource] -= PARAMETERS["CITY_BUILD_COST"] - spent
+                break
+            spent += cargo
+            self.unit_cargo[index, resource] = 0
+
+    def distribute_all_resources(self):
+        for resource in [URANIUM, COAL, WOOD]:
+            self.resolve_resource_requests(resource, self.create_resource_requests(resource))
+
+    def create_resource_requests(self, resource: int) -> Dict[Tuple[int, int], List[tuple]]:
+        # (amount, worker index or None, city number or None) for every cell, by cell in the order they were requested
+        requests: Dict[Tuple[int, int], List[tuple]] = {}
+        rate = COLLECTION_RATE[resource]
+        for team in TEAMS:
+            if self.research_points[team] < RESEARCH_REQUIREMENT[resource]:
+                continue
+            for index in self.team_units(team):
+                if self.unit_type[index] != WORKER:
+                    continue
+                x, y = int(self.unit_x[index]), int(self.unit_y[index])
+                cells = []
+                for dx, dy in DIRECTION_DELTAS.values():
+                    cell_x, cell_y = x + dx, y + dy
+                    if (self.in_map(cell_x, cell_y) and self.resource_type[cell_y, cell_x] == resource
+                            and self.resource_amount[cell_y, cell_x] > 0):
+                        cells.append((cell_x, cell_y))
+                if not cells:
+                    continue
+
+                amount = min(math.ceil(self.cargo_space_left(index) / len(cells)), rate)
+                # a worker on a city tile collects for the city, identical requests for a city are merged
+                if self.is_city_tile(x, y):
+                    request = ((x, y), amount, None, int(self.city_number[y, x]))
+                else:
+                    request = ((x, y), amount, index, None)
+                for cell in cells:
+                    cell_requests = requests.setdefault(cell, [])
+                    if request not in cell_requests:
+                        cell_requests.append(request)
+        return requests
+
+    def resolve_resource_requests(self, resource: int, requests: Dict[Tuple[int, int], List[tuple]]):
+        # the resource of a cell is shared evenly, what cannot be shared evenly is lost
+        for (x, y), cell_requests in requests.items():
+            amount_left = int(self.resource_amount[y, x])
+            pending = [[request[1], request] for request in cell_requests]
+            while pending and sum(entry[0] for entry in pending) > 0 and amount_left > 0:
+                share = min(min(entry[0] for entry in pending), amount_left // len(pending))
+                for _, (_, _, index, city_number) in pending:
+                    if city_number is not None:
+                        self.cities[city_number].fuel += share * FUEL_RATE[resource]
+                    else:
+                        self.unit_cargo[index, resource] += min(self.cargo_space_left(index), share)
+                for entry in pending:
+                    entry[0] -= share
+                amount_left -= share * len(pending)
+                if amount_left < len(pending):
+                    amount_left = 0
+                pending = [entry for entry in pending if entry[0] > 0]
+            self.resource_amount[y, x] = amount_left
+
+    def deposit_resources(self):
+        # the units on a city tile of their team turn their cargo into fuel
+        count = self.unit_count
+        xs, ys = self.unit_x[:count], self.unit_y[:count]
+        on_city_tile = self.unit_alive[:count] & (self.city_team[ys, xs] == self.unit_team[:count])
+        for index in np.flatnonzero(on_city_tile):
+            number = int(self.city_number[ys[index], xs[index]])
+            self.cities[number].fuel += int(self.unit_cargo[index] @ FUEL_RATE)
+            self.unit_cargo[index] = 0
+
+    def handle_night(self):
+        light_upkeep = self.light_upkeep()
+        for number, city in list(self.cities.items()):
+            if city.fuel < light_upkeep[number]:
+                self.destroy_city(number)
+            else:
+                city.fuel -= int(light_upkeep[number])
+
+        for team in TEAMS:
+            for index in self.team_units(team):
+                if not self.is_city_tile(self.unit_x[index], self.unit_y[index]) and not self.spend_fuel_to_survive(index):
+                    self.destroy_unit(index)
+
+    def spend_fuel_to_survive(self, index: int) -> bool:
+        upkeep = UNIT_LIGHT_UPKEEP[self.unit_type[index]]
+        for resource in [WOOD, COAL, URANIUM]:
+            spent = min(int(self.unit_cargo[index, resource]), math.ceil(upkeep / FUEL_RATE[resource]))
+            upkeep -= spent * FUEL_RATE[resource]
+            self.unit_cargo[index, resource] -= spent
+            if upkeep <= 0:
+                return True
+        return False
+
+    def regenerate_trees(self):
+        amount = self.resource_amount
+        growing = (self.resource_type == WOOD) & (amount > 0) & (amount < PARAMETERS["MAX_WOOD_AMOUNT"])
+        grown = np.ceil(np.minimum(amount[growing] * PARAMETERS["WOOD_GROWTH_RATE"], PARAMETERS["MAX_WOOD_AMOUNT"]))
+        amount[growing] = grown.astype(np.int64)
+
+    def run_cooldowns(self):
+        count = self.unit_count
+        alive = self.unit_alive[:count]
+        xs, ys = self.unit_x[:count], self.unit_y[:count]
+        roads = np.where(self.city_team[ys, xs] >= 0, PARAMETERS["MAX_ROAD"], self.road[ys, xs])
+        cooldown = np.maximum(self.unit_cooldown[:count] - roads - 1, 0)
+        self.unit_cooldown[:count] = np.where(alive, cooldown, self.unit_cooldown[:count])
+
+    # observations
+
+    def updates(self) -> List[str]:
+        # as sendAllAgentsGameInformation of the Node engine
+        updates = ["rp {} {}".format(team, self.research_points[team]) for team in TEAMS]
+
+        xs, ys = np.nonzero(self.resource_amount.T > 0)
+        for x, y in zip(xs.tolist(), ys.tolist()):
+            updates.append("r {} {} {} {}".format(
+                RESOURCE_NAMES[self.resource_type[y, x]], x, y, self.resource_amount[y, x]))
+
+        for team in TEAMS:
+            for index in self.team_units(team):
+                wood, coal, uranium = self.unit_cargo[index].tolist()
+                updates.append("u {} {} {} {} {} {} {} {} {}".format(
+                    self.unit_type[index], team, self.unit_ids[index], self.unit_x[index], self.unit_y[index],
+                    format_number(self.unit_cooldown[index]), wood, coal, uranium))
+
+        light_upkeep = self.light_upkeep()
+        for number, city in self.cities.items():
+            updates.append("c {} c_{} {} {}".format(
+                city.team, number, format_number(city.fuel), format_number(light_upkeep[number])))
+        for number, city in self.cities.items():
+            for x, y in city.cells:
+                updates.append("ct {} c_{} {} {} {}".format(
+                    city.team, number, x, y, format_number(self.city_cooldown[y, x])))
+
+        roads = np.where(self.city_team >= 0, PARAMETERS["MAX_ROAD"], self.road)
+        ys, xs = np.nonzero(roads)
+        for x, y in zip(xs.tolist(), ys.tolist()):
+            updates.append("ccd {} {} {}".format(x, y, format_number(roads[y, x])))
+
+        updates.append("D_DONE")
+        return updates
+
+    def rewards(self) -> List[int]:
+        # the reward of kaggle_environments, city tiles then units
+        return [self.city_tile_count(team) * 10000 + len(self.team_units(team)) for team in TEAMS]
+
+    def observation(self, player: int, updates: List[str] = None) -> dict:
+        # an observation as kaggle_environments gives it to the agents
+        if updates is None:
+            updates = self.updates()
+        if self.turn == 0:
+            updates = ["0", "{} {}".format(self.width, self.height)] + updates
+        return {
+            "remainingOverageTime": 60,
+            "step": self.turn,
+            "width": self.width,
+            "height": self.height,
+            "reward": self.rewards()[player],
+            "globalUnitIDCount": self.global_unit_id_count,
+            "globalCityIDCount": self.global_city_id_count,
+            "player": player,
+            "updates": updates,
+        }
+
+
+class Observation(dict):
+    # the kaggle observation allows attribute access, e.g. observation.player
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+class LuxEngineTrainer:
+    """
+    The trainer of kaggle_environments, env.train(agents), on a LuxEngine.
+    A game starts from the observation returned by start_observation, which can be of any turn.
+
+    :param agents: the agents of both players, the trained player is None. An agent is a function of
+                   the observation and the configuration, or the name of an agent of kaggle_environments.
+    """
+
+    def __init__(self, start_observation: Callable[[], dict], agents=(None, "simple_agent")):
+        self.start_observation = start_observation
+        self.position = list(agents).index(None)
+        self.agents = [self.resolve_agent(agent) for agent in agents]
+        self.configuration = Observation({"episodeSteps": EPISODE_STEPS, "actTimeout": 3})
+        self.engine: Optional[LuxEngine] = None
+        self.last_reward = 0
+
+    @staticmethod
+    def resolve_agent(agent):
+        if isinstance(agent, str):
+            from kaggle_environments.envs.lux_ai_2021.agents import agents
+            return agents[agent]
+        return agent
+
+    def reset(self) -> Observation:
+        self.engine = LuxEngine.from_observation(self.start_observation())
+        self.last_reward = self.engine.rewards()[self.position]
+        return Observation(self.engine.observation(self.position))
+
+    def step(self, action: List[str]):
+        updates = self.engine.updates()
+        actions = [action if agent is None else agent(Observation(self.engine.observation(player, updates)),
+                                                      self.configuration)
+                   for player, agent in enumerate(self.agents)]
+        updates = self.engine.step(actions)
+
+        observation = Observation(self.engine.observation(self.position, updates))
+        # as kaggle_environments, the reward is the change of the reward of the player
+        reward = observation["reward"] - self.last_reward
+        self.last_reward = observation["reward"]
+        return observation, reward, self.engine.done, {}
+
+
+def validate_episode(episode: dict) -> List[Tuple[int, List[str], List[str]]]:
+    """
+    Replays the actions of a recorded episode from its first observation.
+    Returns the turns where the updates differ from the recorded observation,
+    with the updates missing from the simulation and the updates that were not recorded.
+    """
+    steps = episode["steps"]
+    engine = LuxEngine.from_observation(steps[0][0]["observation"], len(steps))
+    mismatches = []
+    for step in range(1, len(steps)):
+        updates = engine.step([steps[step][player]["action"] for player in TEAMS])
+        recorded = steps[step][0]["observation"]["updates"]
+        if updates != recorded:
+            missing = [update for update in recorded if update not in updates]
+            unexpected = [update for update in updates if update not in recorded]
+            mismatches.append((step, missing, unexpected))
+            # continue from the recorded state, so that a mismatch is reported once
+            engine = LuxEngine.from_observation(steps[step][0]["observation"], len(steps))
+        if engine.done != (steps[step][0]["status"] != "ACTIVE"):
+            mismatches.append((step, ["status {}".format(steps[step][0]["status"])], ["done {}".format(engine.done)]))
+    return mismatches
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Replay recorded episodes with the engine and compare the updates")
+    parser.add_argument("episodes", nargs="+", help="episode json files or directories of them")
+    args = parser.parse_args()
+
+    paths = []
+    for path in args.episodes:
+        paths.extend(sorted(glob.glob(os.path.join(path, "*.json"))) if os.path.isdir(path) else [path])
+
+    total_steps = total_time = 0
+    failed = 0
+    for path in paths:
+        with open(path) as f:
+            episode = json.load(f)
+        start_time = time.perf_counter()
+        mismatches = validate_episode(episode)
+        total_time += time.perf_counter() - start_time
+        total_steps += len(episode["steps"]) - 1
+
+        failed += bool(mismatches)
+        print("{} {} steps, {} mismatches".format(path, len(episode["steps"]) - 1, len(mismatches)))
+        for step, missing, unexpected in mismatches[:3]:
+            print("  step {} missing {} unexpected {}".format(step, missing[:5], unexpected[:5]))
+
+    print("{} of {} episodes match, {:.0f} steps per second".format(
+        len(paths) - failed, len(paths), total_steps / max(total_time, 1e-9)))
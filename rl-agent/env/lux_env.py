@@ -8,8 +8,11 @@ logger = logging.getLogger(__name__)
 
 from ray.rllib.env.multi_agent_env import MultiAgentEnv
 
+import numpy as np
+
 from kaggle_environments import make
 
+from env.lux_engine import LuxEngineTrainer
 from env.lux_interface import LuxDefaultInterface
 
 
@@ -34,18 +37,29 @@ class LuxEnv(MultiAgentEnv):
                        converted to per-actor observations, and such.
     :param agents: (Iterable) The two agents to run in the environment. Set the one training to None.
     :param train: (Bool)  Not sure, I think it needs to always be True?
+    :param replay_store: (ReplayStore) If given, the games are played on a local LuxEngine and start
+                          from a step of a recorded episode, instead of the first turn on kaggle_environments.
+                          The opponent must then accept a first observation of any turn.
+    :param curriculum: The distribution of the start steps, see env.replay_store
     """
     def __init__(self, configuration, debug,
                  interface=LuxDefaultInterface,
-                 agents=(None, "simple_agent")):
+                 agents=(None, "simple_agent"),
+                 replay_store=None,
+                 curriculum="uniform"):
         super().__init__()
 
         logger.debug('Init LuxEnv')
 
-        self._env = make("lux_ai_2021",
-                         configuration=configuration, debug=debug)
+        if replay_store is None:
+            self._env = make("lux_ai_2021",
+                             configuration=configuration, debug=debug)
 
-        self.env = self._env.train(agents)
+            self.env = self._env.train(agents)
+        else:
+            random = np.random.RandomState(configuration.get("seed"))
+            self.env = LuxEngineTrainer(lambda: replay_store.sample(random, self.curriculum), agents)
+        self.curriculum = curriculum
 
         self.interface_class = interface
         self.interface = None  # will be instantiated in self.reset()
@@ -3,17 +3,24 @@ Wrapper for lux.game.Game to hold state and provide helper methods to shape
 observations/actions/rewards.
 """
 
+import numpy as np
+
+from typing import List, NamedTuple, Optional
+
 from lux.game import Game
+from env.lux_engine import LuxEngine
 
 
 class LuxGame:
 
     def __init__(self, observation):
-        if observation["step"] == 0:
-            self.game_state = Game()
-            self.game_state._initialize(observation["updates"])
-            self.game_state.id = observation.player
-            self.player_id = observation.player
+        # the first observation is not of the first turn when the game starts from a replay
+        self.game_state = Game()
+        self.game_state._initialize([str(observation["player"]),
+                                     "{} {}".format(observation["width"], observation["height"])])
+        self.game_state.turn = observation["step"] - 1
+        self.game_state.id = observation["player"]
+        self.player_id = observation["player"]
 
     def update(self, observation: dict) -> Game:
         if observation["step"] == 0:
@@ -48,3 +55,53 @@ class LuxGame:
             return units + citytiles
 
         return {'units': units, 'citytiles': citytiles}
+
+
+class Actors(NamedTuple):
+    """
+    The actors of a team as parallel arrays, ids[i] is the id of the actor in row i.
+    The units come first, in the order they were created, then the city tiles by row of the map.
+    """
+    ids: List[str]
+    is_citytile: np.ndarray
+    x: np.ndarray
+    y: np.ndarray
+    cooldown: np.ndarray
+    # the row of the unit in the unit arrays of the engine, -1 for a city tile
+    unit_index: np.ndarray
+
+
+class LuxArrayGame:
+    """
+    LuxGame on the arrays of a LuxEngine rather than on lux.game objects,
+    the actors are returned as arrays instead of being tagged one by one.
+    """
+
+    def __init__(self, observation):
+        self.player_id = observation["player"]
+        self.engine: Optional[LuxEngine] = None
+
+    def update(self, observation: dict) -> LuxEngine:
+        # the updates of an observation hold the whole state
+        self.engine = LuxEngine.from_observation(observation)
+        return self.engine
+
+    def get_state(self):
+        return self.engine
+
+    def get_team_actors(self, teams=(0,)) -> Actors:
+        engine = self.engine
+        count = engine.unit_count
+        unit_index = np.flatnonzero(engine.unit_alive[:count] & np.isin(engine.unit_team[:count], teams))
+        city_y, city_x = np.nonzero(np.isin(engine.city_team, teams))
+
+        ids = [engine.unit_ids[index] for index in unit_index]
+        ids += ['ct_{}_{}'.format(x, y) for x, y in zip(city_x.tolist(), city_y.tolist())]
+        return Actors(
+            ids=ids,
+            is_citytile=np.concatenate([np.zeros(len(unit_index), dtype=bool), np.ones(len(city_x), dtype=bool)]),
+            x=np.concatenate([engine.unit_x[unit_index], city_x]),
+            y=np.concatenate([engine.unit_y[unit_index], city_y]),
+            cooldown=np.concatenate([engine.unit_cooldown[unit_index], engine.city_cooldown[city_y, city_x]]),
+            unit_index=np.concatenate([unit_index, np.full(len(city_x), -1)]),
+        )
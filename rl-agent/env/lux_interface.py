@@ -3,15 +3,26 @@ Interface between LuxEnv (mostly lists, vectors) and rllib Trainer (dicts of act
 
 To change the logic and do feature/reward engineering, create a new class that
 inherits from this one and pass it to LuxEnv when instantiating it.
+
+LuxVectorInterface does the same on arrays, and LuxSpatialInterface gives one map observation
+and takes one action map per team instead of one per actor. Their per-step overhead is compared with
+
+    python -m env.lux_interface ../imitation-learning/lux-episodes
 """
 
+import glob
+import json
+import os
+import time
+
 import numpy as np
 import logging
 logger = logging.getLogger(__name__)
 
 from typing import Tuple
 from gym import spaces
-from env.lux_game import LuxGame
+from env.lux_game import Actors, LuxArrayGame, LuxGame
+from env.lux_vec_env import LuxBatchEngine, MAP_SIZE, observation_space, team_action_space
 
 
 class LuxDefaultInterface:
@@ -76,3 +87,127 @@ class LuxDefaultInterface:
         """
         # use self.game_state
         return []
+
+
+class LuxVectorInterface(LuxDefaultInterface):
+    """
+    LuxDefaultInterface on the arrays of a LuxEngine: the observations of the actors are
+    the rows of one (n_actors, ...) array, the rewards and dones are vectors, all parallel
+    to actors.ids. ordv returns the arrays, the dicts of RLlib are only built by ordi.
+
+    To do feature/reward engineering, override the *_array methods.
+    """
+
+    def __init__(self, obs):
+        self.game = LuxArrayGame(obs)
+        self.game_state = self.game.update(obs)
+        self.actors = self.game.get_team_actors(teams=(self.game.player_id,))
+
+    def ordv(self, *joint_data) -> Tuple[Actors, np.ndarray, np.ndarray, np.ndarray, dict]:
+        """
+        :param joint_data: (obs, reward, done, info) as LuxAI (kaggle env) format
+        :return: (actors, obs, reward, done, info), the first dimension of the arrays is the actor
+        """
+        obs, reward, done, info = joint_data
+        self.game_state = self.game.update(obs)
+        self.actors = self.game.get_team_actors(teams=(self.game.player_id,))
+        return (self.actors,
+                self.observation_array(obs, self.actors),
+                self.reward_array(reward, self.actors),
+                self.done_array(done, self.actors),
+                info)
+
+    def ordi(self, *joint_data) -> Tuple[dict]:
+        actors, obs, reward, done, info = self.ordv(*joint_data)
+        done = dict(zip(actors.ids, done.tolist()))
+        done['__all__'] = True  # turn completion
+        return (dict(zip(actors.ids, obs)),
+                dict(zip(actors.ids, reward.tolist())),
+                done,
+                {actor_id: {} for actor_id in actors.ids})
+
+    def observation(self, joint_obs, actors=None) -> dict:
+        actors = self.actors if actors is None else actors
+        return dict(zip(actors.ids, self.observation_array(joint_obs, actors)))
+
+    def observation_array(self, joint_obs, actors: Actors) -> np.ndarray:
+        # use self.game_state
+        position = np.stack([actors.x / self.game_state.width, actors.y / self.game_state.height], axis=1)
+        return position.astype(self.obs_spaces['default'].dtype)
+
+    def reward_array(self, joint_reward, actors: Actors) -> np.ndarray:
+        # use self.game_state
+        return np.zeros(len(actors.ids), dtype=np.float32)
+
+    def done_array(self, joint_done, actors: Actors) -> np.ndarray:
+        # use self.game_state
+        return np.ones(len(actors.ids), dtype=bool)
+
+
+class LuxSpatialInterface(LuxDefaultInterface):
+    """
+    One observation and one action per team instead of one per actor, keyed by 'team_<player id>'.
+    The observation is the (18, 32, 32) planes of LuxBatchEngine.observations. The action is a (2, 32, 32) map
+    of the UNIT_ACTIONS index of the units on each [x, y] cell and the CITY_TILE_ACTIONS index of the city tile
+    on it, decoded for every actor at once, so that one forward pass of a conv policy plays the whole team.
+    """
+
+    obs_spaces = {'default': observation_space()}
+    act_spaces = {'default': team_action_space()}
+
+    def __init__(self, obs):
+        self.player_id = obs["player"]
+        self.agent_id = 'team_{}'.format(self.player_id)
+        self.engine = LuxBatchEngine(1)
+        self.game_state = self.engine.load(0, obs)
+
+    def ordi(self, *joint_data) -> Tuple[dict]:
+        obs, reward, done, info = joint_data
+        self.game_state = self.engine.load(0, obs)
+        return (self.observation(obs),
+                {self.agent_id: reward or 0},
+                {self.agent_id: done, '__all__': done},
+                {self.agent_id: info})
+
+    def observation(self, joint_obs, actors=None) -> dict:
+        return {self.agent_id: self.engine.observations(self.player_id)[0]}
+
+    def actions(self, action_dict) -> list:
+        action_map = np.asarray(action_dict[self.agent_id]).reshape(2, 1, MAP_SIZE * MAP_SIZE)
+        return self.engine.decode_actions(action_map[0], self.player_id, action_map[1])[0]
+
+
+def benchmark(episode_paths, interfaces=(LuxDefaultInterface, LuxVectorInterface, LuxSpatialInterface)):
+    # replays the observations of player 0 of the recorded episodes through the interfaces
+    episodes = []
+    for path in episode_paths:
+        for episode_path in sorted(glob.glob(os.path.join(path, "*.json"))) if os.path.isdir(path) else [path]:
+            with open(episode_path) as f:
+                episode = json.load(f)
+            episodes.append([step[0]["observation"] for step in episode["steps"]])
+
+    for interface_class in interfaces:
+        methods = ["ordi", "ordv"] if hasattr(interface_class, "ordv") else ["ordi"]
+        for method in methods:
+            steps = 0
+            actors = 0
+            start_time = time.perf_counter()
+            for observations in episodes:
+                interface = interface_class(observations[0])
+                for obs in observations[1:]:
+                    output = getattr(interface, method)(obs, 0, False, {})
+                    # dict entries or rows of the observation, one per team for LuxSpatialInterface
+                    actors += len(output[0]) if method == "ordi" else len(output[0].ids)
+                    steps += 1
+            duration = time.perf_counter() - start_time
+            print("{}.{}: {:.3f}ms per step, {:.1f} observations per step".format(
+                interface_class.__name__, method, duration / steps * 1000, actors / steps))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Time the interfaces on the recorded episodes")
+    parser.add_argument("episodes", nargs="+", help="episode json files or directories of them")
+    args = parser.parse_args()
+    benchmark(args.episodes)
@@ -0,0 +1,449 @@
+"""
+Batched Lux simulator behind the VecEnv interface of stable_baselines3.
+
+LuxBatchEngine holds B games in arrays with a leading game dimension, (B, 32, 32)
+planes with every map centred as in the inputs of the imitation model, and
+(B, unit_capacity) unit tables padded with dead units. Every game is a LuxEngine
+whose arrays are views into the batch, so the rules that depend on the order of
+the units (collisions, sharing of resources) run game by game, while the tree
+growth, the cooldowns, the observations and the decoding of the actions run on
+the whole batch at once.
+
+LuxVecEnv steps B games per call and resets a finished game from a random
+start observation, e.g. the first steps of the recorded episodes, or from
+any step of a ReplayStore. LuxKaggleEnv is the same environment on
+kaggle_environments, to compare with
+
+    python -m env.lux_vec_env ../imitation-learning/lux-episodes --num-envs 64
+"""
+
+import glob
+import json
+import os
+import time
+
+import gym
+import numpy as np
+
+from gym import spaces
+from typing import Callable, List, Optional
+
+from stable_baselines3.common.vec_env.base_vec_env import VecEnv
+
+from env.lux_engine import (
+    LuxEngine, PARAMETERS, WORKER, UNIT_ARRAYS, EPISODE_STEPS,
+)
+from env.replay_store import Curriculum, ReplayStore
+
+MAP_SIZE = 32
+OBSERVATION_CHANNELS = 18
+
+# actions of the units, by the cell of the unit
+UNIT_ACTIONS = [None, "n", "s", "w", "e", "bcity"]
+# actions of the city tiles, by the cell of the city tile
+CITY_TILE_ACTIONS = [None, "bw", "bc", "r"]
+
+# an opponent is called with a kaggle observation and configuration and returns a list of commands
+Agent = Callable[[dict, dict], List[str]]
+
+
+def load_start_observations(paths: List[str], step: int = 0) -> List[dict]:
+    # the observations of the given step of the recorded episodes, in episode json files or directories of them
+    observations = []
+    for path in paths:
+        for episode_path in sorted(glob.glob(os.path.join(path, "*.json"))) if os.path.isdir(path) else [path]:
+            with open(episode_path) as f:
+                episode = json.load(f)
+            if len(episode["steps"]) > step:
+                observations.append(episode["steps"][step][0]["observation"])
+    return observations
+
+
+class BatchedGame(LuxEngine):
+    """
+    A LuxEngine whose arrays are views into a slot of a LuxBatchEngine.
+    """
+
+    def __init__(self, *args, batch: "LuxBatchEngine" = None, slot: int = 0, **kwargs):
+        self.batch = batch
+        self.slot = slot
+        super().__init__(*args, **kwargs)
+
+    def allocate_grids(self):
+        self.batch.clear_grids(self.slot)
+        self.bind_grids()
+
+    def bind_grids(self):
+        x_offset, y_offset = self.batch.x_offset[self.slot], self.batch.y_offset[self.slot]
+        region = (self.slot, slice(y_offset, y_offset + self.height), slice(x_offset, x_offset + self.width))
+        for name in ["resource_type", "resource_amount", "road", "city_number", "city_team", "city_cooldown"]:
+            setattr(self, name, getattr(self.batch, name)[region])
+
+    def allocate_units(self, capacity: int):
+        while self.batch.unit_capacity < capacity:
+            self.batch.grow_units()
+        self.batch.clear_units(self.slot)
+        self.bind_units()
+
+    def bind_units(self):
+        for name in UNIT_ARRAYS:
+            setattr(self, name, getattr(self.batch, name)[self.slot])
+
+    def _grow_units(self):
+        self.batch.grow_units()
+        # a game being loaded is not in the batch yet
+        self.bind_units()
+
+
+class LuxBatchEngine:
+    """
+    B games of at most 32x32, the grids are indexed [game, y, x] and the unit tables [game, unit].
+    """
+
+    def __init__(self, num_games: int, unit_capacity: int = 64):
+        self.num_games = num_games
+        shape = (num_games, MAP_SIZE, MAP_SIZE)
+        self.resource_type = np.full(shape, -1, dtype=np.int8)
+        self.resource_amount = np.zeros(shape, dtype=np.int64)
+        self.road = np.zeros(shape, dtype=np.float64)
+        self.city_number = np.zeros(shape, dtype=np.int64)
+        self.city_team = np.full(shape, -1, dtype=np.int8)
+        self.city_cooldown = np.zeros(shape, dtype=np.float64)
+        self.map_mask = np.zeros(shape, dtype=bool)
+        self.x_offset = np.zeros(num_games, dtype=np.int64)
+        self.y_offset = np.zeros(num_games, dtype=np.int64)
+
+        self.unit_capacity = unit_capacity
+        self.unit_team = np.zeros((num_games, unit_capacity), dtype=np.int8)
+        self.unit_type = np.zeros((num_games, unit_capacity), dtype=np.int8)
+        self.unit_x = np.zeros((num_games, unit_capacity), dtype=np.int64)
+        self.unit_y = np.zeros((num_games, unit_capacity), dtype=np.int64)
+        self.unit_cooldown = np.zeros((num_games, unit_capacity), dtype=np.float64)
+        self.unit_cargo = np.zeros((num_games, unit_capacity, 3), dtype=np.int64)
+        self.unit_alive = np.zeros((num_games, unit_capacity), dtype=bool)
+
+        self.games: List[Optional[BatchedGame]] = [None] * num_games
+
+    def load(self, slot: int, observation: dict, episode_steps: int = EPISODE_STEPS) -> BatchedGame:
+        # puts the game of the observation in the slot, centred on the 32x32 planes
+        width, height = observation["width"], observation["height"]
+        self.x_offset[slot] = (MAP_SIZE - width) // 2
+        self.y_offset[slot] = (MAP_SIZE - height) // 2
+        self.map_mask[slot] = False
+        self.map_mask[slot, self.y_offset[slot]:self.y_offset[slot] + height,
+                      self.x_offset[slot]:self.x_offset[slot] + width] = True
+
+        game = BatchedGame.from_observation(observation, episode_steps, batch=self, slot=slot)
+        self.games[slot] = game
+        return game
+
+    def clear_grids(self, slot: int):
+        self.resource_type[slot] = -1
+        self.resource_amount[slot] = 0
+        self.road[slot] = 0
+        self.city_number[slot] = 0
+        self.city_team[slot] = -1
+        self.city_cooldown[slot] = 0
+
+    def clear_units(self, slot: int):
+        for name in UNIT_ARRAYS:
+            getattr(self, name)[slot] = 0
+
+    def grow_units(self):
+        # doubles the unit tables of every game, the games are bound to the new tables
+        for name in UNIT_ARRAYS:
+            array = getattr(self, name)
+            grown = np.zeros((self.num_games, 2 * self.unit_capacity) + array.shape[2:], dtype=array.dtype)
+            grown[:, :self.unit_capacity] = array
+            setattr(self, name, grown)
+        self.unit_capacity *= 2
+        for game in self.games:
+            if game is not None:
+                game.bind_units()
+
+    def step(self, actions: List[List[Optional[List[str]]]]) -> np.ndarray:
+        """
+        Runs a turn of every game with the commands of both players of each game.
+        Returns whether each game is over.
+        """
+        for game, game_actions in zip(self.games, actions):
+            game.run_turn(game_actions)
+        self.regenerate_trees()
+        for game in self.games:
+            game.end_turn()
+        self.run_cooldowns()
+        return np.array([game.done for game in self.games])
+
+    def regenerate_trees(self):
+        amount = self.resource_amount
+        growing = (self.resource_type == 0) & (amount > 0) & (amount < PARAMETERS["MAX_WOOD_AMOUNT"])
+        grown = np.ceil(np.minimum(amount[growing] * PARAMETERS["WOOD_GROWTH_RATE"], PARAMETERS["MAX_WOOD_AMOUNT"]))
+        amount[growing] = grown.astype(np.int64)
+
+    def unit_cells(self):
+        # the game, y and x indices of every unit slot in the planes
+        games = np.broadcast_to(np.arange(self.num_games)[:, None], self.unit_x.shape)
+        return games, self.unit_y + self.y_offset[:, None], self.unit_x + self.x_offset[:, None]
+
+    def run_cooldowns(self):
+        games, ys, xs = self.unit_cells()
+        roads = np.where(self.city_team[games, ys, xs] >= 0, PARAMETERS["MAX_ROAD"], self.road[games, ys, xs])
+        np.copyto(self.unit_cooldown, np.maximum(self.unit_cooldown - roads - 1, 0), where=self.unit_alive)
+
+    def observations(self, player: int = 0) -> np.ndarray:
+        """
+        (B, 18, 32, 32) planes from the point of view of the player, indexed [game, channel, x, y]
+        0-2 units of the player, cooldown / 6 and cargo / 100, 3-5 the same for the opponent
+        6-7 city tiles of the player and the nights their city can last / 10, 8-9 the same for the opponent
+        10-12 wood, coal and uranium / 800, 13-14 research points / 200 of the player and the opponent
+        15 time of the day, 16 turn / 360, 17 the map
+        """
+        planes = np.zeros((self.num_games, OBSERVATION_CHANNELS, MAP_SIZE, MAP_SIZE), dtype=np.float32)
+
+        games, ys, xs = self.unit_cells()
+        alive = self.unit_alive
+        channel = np.where(self.unit_team == player, 0, 3)
+        planes[games[alive], channel[alive], xs[alive], ys[alive]] = 1
+        planes[games[alive], channel[alive] + 1, xs[alive], ys[alive]] = self.unit_cooldown[alive] / 6
+        planes[games[alive], channel[alive] + 2, xs[alive], ys[alive]] = self.unit_cargo[alive].sum(axis=1) / 100
+
+        city_team = self.city_team.transpose(0, 2, 1)
+        planes[:, 6] = city_team == player
+        planes[:, 8] = (city_team >= 0) & (city_team != player)
+        nights = np.zeros(self.city_number.shape, dtype=np.float32)
+        for slot, game in enumerate(self.games):
+            light_upkeep = game.light_upkeep()
+            ratio = np.zeros(len(light_upkeep), dtype=np.float32)
+            for number, city in game.cities.items():
+                ratio[number] = min(city.fuel / light_upkeep[number], 10) / 10
+            nights[slot] = ratio[self.city_number[slot]]
+        nights = nights.transpose(0, 2, 1)
+        planes[:, 7] = nights * planes[:, 6]
+        planes[:, 9] = nights * planes[:, 8]
+
+        amount = self.resource_amount.transpose(0, 2, 1) / 800
+        resource_type = self.resource_type.transpose(0, 2, 1)
+        for resource in range(3):
+            planes[:, 10 + resource] = np.where(resource_type == resource, amount, 0)
+
+        research_points = np.array([game.research_points for game in self.games])
+        turns = np.array([game.turn for game in self.games])
+        planes[:, 13] = (np.minimum(research_points[:, player], 200) / 200)[:, None, None]
+        planes[:, 14] = (np.minimum(research_points[:, 1 - player], 200) / 200)[:, None, None]
+        planes[:, 15] = (turns % 40 / 40)[:, None, None]
+        planes[:, 16] = (turns / 360)[:, None, None]
+        planes[:, 17] = self.map_mask.transpose(0, 2, 1)
+        return planes
+
+    def decode_actions(self, action_maps: np.ndarray, player: int = 0,
+                       city_tile_maps: Optional[np.ndarray] = None) -> List[List[str]]:
+        """
+        Turns (B, 32 * 32) unit action indices, indexed by the [x, y] cell of the unit, into the commands of the player.
+        city_tile_maps are (B, 32 * 32) indices of CITY_TILE_ACTIONS by the [x, y] cell of the city tile. Without them,
+        every city tile that can act builds a worker while under the unit cap, and researches otherwise.
+        """
+        action_maps = np.asarray(action_maps).reshape(self.num_games, MAP_SIZE, MAP_SIZE)
+        games, ys, xs = self.unit_cells()
+        acting = self.unit_alive & (self.unit_team == player) & (self.unit_cooldown < 1)
+        unit_actions = np.zeros(self.unit_x.shape, dtype=np.int64)
+        unit_actions[acting] = action_maps[games[acting], xs[acting], ys[acting]]
+        # a cart cannot build a city tile
+        unit_actions[(unit_actions == len(UNIT_ACTIONS) - 1) & (self.unit_type != WORKER)] = 0
+
+        commands = [[] for _ in range(self.num_games)]
+        for slot, index in zip(*np.nonzero(unit_actions)):
+            game = self.games[slot]
+            action = UNIT_ACTIONS[unit_actions[slot, index]]
+            if action == "bcity":
+                commands[slot].append("bcity {}".format(game.unit_ids[index]))
+            else:
+                commands[slot].append("m {} {}".format(game.unit_ids[index], action))
+
+        if city_tile_maps is not None:
+            city_tile_maps = np.asarray(city_tile_maps).reshape(self.num_games, MAP_SIZE, MAP_SIZE)
+            acting = (self.city_team == player) & (self.city_cooldown < 1)
+            city_tile_actions = np.where(acting, city_tile_maps.transpose(0, 2, 1), 0)
+            for slot, y, x in zip(*np.nonzero(city_tile_actions)):
+                commands[slot].append("{} {} {}".format(CITY_TILE_ACTIONS[city_tile_actions[slot, y, x]],
+                                                        x - self.x_offset[slot], y - self.y_offset[slot]))
+            return commands
+
+        for slot, game in enumerate(self.games):
+            unit_count = int(np.count_nonzero(self.unit_alive[slot] & (self.unit_team[slot] == player)))
+            city_tile_count = game.city_tile_count(player)
+            research_points = game.research_points[player]
+            for city in game.cities.values():
+                if city.team != player:
+                    continue
+                for x, y in city.cells:
+                    if game.city_cooldown[y, x] >= 1:
+                        continue
+                    if unit_count < city_tile_count:
+                        commands[slot].append("bw {} {}".format(x, y))
+                        unit_count += 1
+                    elif research_points < PARAMETERS["RESEARCH_REQUIREMENTS"]["URANIUM"]:
+                        commands[slot].append("r {} {}".format(x, y))
+                        research_points += 1
+        return commands
+
+    def outcomes(self, player: int = 0) -> np.ndarray:
+        # 1 if the player leads, -1 if the opponent leads, by city tiles then units, 0 for a draw
+        rewards = np.array([game.rewards() for game in self.games])
+        return np.sign(rewards[:, player] - rewards[:, 1 - player]).astype(np.float32)
+
+
+def observation_space() -> spaces.Box:
+    return spaces.Box(low=0, high=np.inf, shape=(OBSERVATION_CHANNELS, MAP_SIZE, MAP_SIZE), dtype=np.float32)
+
+
+def action_space() -> spaces.MultiDiscrete:
+    return spaces.MultiDiscrete([len(UNIT_ACTIONS)] * MAP_SIZE * MAP_SIZE)
+
+
+def team_action_space() -> spaces.MultiDiscrete:
+    # the unit action and the city tile action of every cell, indexed [0 for units or 1 for city tiles, x, y]
+    return spaces.MultiDiscrete(np.stack([np.full((MAP_SIZE, MAP_SIZE), len(UNIT_ACTIONS)),
+                                          np.full((MAP_SIZE, MAP_SIZE), len(CITY_TILE_ACTIONS))]))
+
+
+class LuxVecEnv(VecEnv):
+    """
+    B Lux games stepped by a LuxBatchEngine, as player 0 against the opponent.
+
+    The observations are the planes of LuxBatchEngine.observations and the actions are a unit action
+    index per cell, see LuxBatchEngine.decode_actions. The reward is given at the end of a game,
+    1 for a win, -1 for a loss. A finished game is reset from a random start observation,
+    its last observation is in the info of the step as terminal_observation.
+
+    :param start_observations: kaggle observations to start the games from, e.g. from load_start_observations
+    :param num_envs: the number of games B
+    :param opponent: called with the observation of player 1 of every game, the opponent stays idle if None.
+                     It is called for all the games in turn, so it should not keep state between calls.
+    :param replay_store: if given, the games start from a step of a recorded episode drawn from the curriculum,
+                         instead of from start_observations. The curriculum can be changed with set_attr.
+    """
+
+    def __init__(self, start_observations: Optional[List[dict]], num_envs: int, opponent: Optional[Agent] = None,
+                 seed: Optional[int] = None, replay_store: Optional[ReplayStore] = None,
+                 curriculum: Curriculum = "uniform"):
+        super().__init__(num_envs, observation_space(), action_space())
+        self.start_observations = start_observations
+        self.replay_store = replay_store
+        self.curriculum = curriculum
+        self.opponent = opponent
+        self.configuration = {"episodeSteps": EPISODE_STEPS, "actTimeout": 3}
+        self.engine = LuxBatchEngine(num_envs)
+        self.random = np.random.RandomState(seed)
+        self.actions = None
+
+    def reset_game(self, slot: int):
+        if self.replay_store is not None:
+            observation = self.replay_store.sample(self.random, self.curriculum)
+        else:
+            observation = self.start_observations[self.random.randint(len(self.start_observations))]
+        self.engine.load(slot, observation)
+
+    def reset(self) -> np.ndarray:
+        for slot in range(self.num_envs):
+            self.reset_game(slot)
+        return self.engine.observations()
+
+    def step_async(self, actions: np.ndarray) -> None:
+        self.actions = actions
+
+    def step_wait(self):
+        commands = self.engine.decode_actions(self.actions)
+        opponent_commands = [[] for _ in range(self.num_envs)]
+        if self.opponent is not None:
+            opponent_commands = [self.opponent(game.observation(1), self.configuration) for game in self.engine.games]
+
+        dones = self.engine.step([[own, opponent] for own, opponent in zip(commands, opponent_commands)])
+        rewards = np.where(dones, self.engine.outcomes(), 0).astype(np.float32)
+        observations = self.engine.observations()
+
+        infos = [{} for _ in range(self.num_envs)]
+        for slot in np.flatnonzero(dones):
+            infos[slot]["terminal_observation"] = observations[slot].copy()
+            self.reset_game(slot)
+        if dones.any():
+            observations = self.engine.observations()
+        return observations, rewards, dones, infos
+
+    def seed(self, seed: Optional[int] = None) -> List[Optional[int]]:
+        self.random = np.random.RandomState(seed)
+        return [seed] * self.num_envs
+
+    def close(self) -> None:
+        pass
+
+    def get_attr(self, attr_name, indices=None):
+        return [getattr(self, attr_name) for _ in self._get_indices(indices)]
+
+    def set_attr(self, attr_name, value, indices=None):
+        setattr(self, attr_name, value)
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        return [getattr(self, method_name)(*method_args, **method_kwargs) for _ in self._get_indices(indices)]
+
+    def env_is_wrapped(self, wrapper_class, indices=None) -> List[bool]:
+        return [False for _ in self._get_indices(indices)]
+
+
+class LuxKaggleEnv(gym.Env):
+    """
+    The game of LuxVecEnv on kaggle_environments, with the same observations, actions and rewards.
+    kaggle_environments runs a single Node match per process, so there should be one LuxKaggleEnv per process.
+    """
+
+    def __init__(self, configuration: dict = None, opponent: Optional[Agent] = None):
+        from kaggle_environments import make
+
+        self.observation_space = observation_space()
+        self.action_space = action_space()
+        self.env = make("lux_ai_2021", configuration=configuration or {"loglevel": 0, "annotations": False},
+                        debug=False)
+        self.trainer = self.env.train([None, opponent or (lambda observation, configuration: [])])
+        # the observations are mirrored into a batch of one game to build the planes and decode the actions
+        self.engine = LuxBatchEngine(1)
+
+    def reset(self) -> np.ndarray:
+        self.engine.load(0, self.trainer.reset())
+        return self.engine.observations()[0]
+
+    def step(self, action: np.ndarray):
+        commands = self.engine.decode_actions(np.asarray(action)[None])[0]
+        observation, _, done, info = self.trainer.step(commands)
+        self.engine.load(0, observation)
+        reward = float(self.engine.outcomes()[0]) if done else 0.0
+        return self.engine.observations()[0], reward, done, info
+
+
+def benchmark(env: VecEnv, steps: int, seed: int = 0) -> float:
+    # environment steps per second with random actions
+    random = np.random.RandomState(seed)
+    env.reset()
+    start_time = time.perf_counter()
+    for _ in range(steps):
+        env.step(random.randint(len(UNIT_ACTIONS), size=(env.num_envs, MAP_SIZE * MAP_SIZE)))
+    return steps * env.num_envs / (time.perf_counter() - start_time)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from stable_baselines3.common.vec_env import DummyVecEnv
+
+    parser = argparse.ArgumentParser(description="Steps per second of LuxVecEnv and of DummyVecEnv over kaggle_environments")
+    parser.add_argument("episodes", nargs="+", help="episode json files or directories of them, to start the games from")
+    parser.add_argument("--num-envs", type=int, default=64)
+    parser.add_argument("--steps", type=int, default=100)
+    parser.add_argument("--kaggle-steps", type=int, default=100)
+    args = parser.parse_args()
+
+    start_observations = load_start_observations(args.episodes)
+    steps_per_second = benchmark(LuxVecEnv(start_observations, args.num_envs, seed=0), args.steps)
+    print("LuxVecEnv {} envs: {:.0f} steps/s".format(args.num_envs, steps_per_second))
+
+    if args.kaggle_steps:
+        steps_per_second = benchmark(DummyVecEnv([LuxKaggleEnv]), args.kaggle_steps)
+        print("DummyVecEnv of LuxKaggleEnv: {:.0f} steps/s".format(steps_per_second))
@@ -0,0 +1,98 @@
+"""
+Memory and throughput of the replay buffers of stable_baselines3 on Lux sized map observations,
+half binary planes (units, resources) and half planes of values in [0, 1].
+
+    python -m env.replay_buffer_benchmark --channels 20 --binary-channels 10
+
+ReplayBuffer stores the observations as float32, CompressedReplayBuffer bit-packs the binary planes,
+quantizes the others to uint8 and shares the storage of the observations and next observations.
+MemmapReplayBuffer stores them as CompressedReplayBuffer, in memory-mapped files of --memmap-path.
+"""
+
+import tempfile
+import time
+
+import numpy as np
+
+from gym import spaces
+
+from stable_baselines3.common.buffers import CompressedReplayBuffer, MemmapReplayBuffer, ReplayBuffer
+from stable_baselines3.common.codecs import BitPackCodec, ChannelCodec, QuantizeCodec
+
+from env.lux_vec_env import MAP_SIZE
+
+
+def map_observations(n_observations: int, channels: int, binary_channels: int) -> np.ndarray:
+    rng = np.random.RandomState(0)
+    observations = np.zeros((n_observations, channels, MAP_SIZE, MAP_SIZE), dtype=np.float32)
+    observations[:, :binary_channels] = rng.random_sample((n_observations, binary_channels, MAP_SIZE, MAP_SIZE)) < 0.1
+    observations[:, binary_channels:] = rng.random_sample((n_observations, channels - binary_channels, MAP_SIZE, MAP_SIZE))
+    return observations
+
+
+def benchmark(
+    channels: int, binary_channels: int, buffer_size: int, adds: int, samples: int, batch_size: int, memmap_path: str
+):
+    observation_space = spaces.Box(low=0, high=1, shape=(channels, MAP_SIZE, MAP_SIZE), dtype=np.float32)
+    action_space = spaces.Discrete(6)
+    codec = ChannelCodec({range(binary_channels): BitPackCodec(), range(binary_channels, channels): QuantizeCodec(0, 1)})
+    buffers = {
+        "ReplayBuffer": ReplayBuffer(buffer_size, observation_space, action_space),
+        "CompressedReplayBuffer": CompressedReplayBuffer(
+            buffer_size, observation_space, action_space, codecs={"observations": codec}
+        ),
+        "MemmapReplayBuffer": MemmapReplayBuffer(
+            buffer_size, observation_space, action_space, codecs={"observations": codec}, path=memmap_path
+        ),
+    }
+    observations = map_observations(64, channels, binary_channels)
+    for name, buffer in buffers.items():
+        arrays = [buffer.observations, buffer.next_observations, buffer.actions, buffer.rewards, buffer.dones]
+        transition_bytes = sum(array.nbytes for array in arrays if array is not None) / buffer_size
+
+        start_time = time.perf_counter()
+        for step in range(adds):
+            obs, next_obs = observations[step % 63 : step % 63 + 1], observations[step % 63 + 1 : step % 63 + 2]
+            buffer.add(obs, next_obs, np.array([[step % 6]]), np.array([0.0]), np.array([False]))
+        add_duration = (time.perf_counter() - start_time) / adds
+
+        start_time = time.perf_counter()
+        for _ in range(samples):
+            buffer.sample(batch_size)
+        sample_duration = (time.perf_counter() - start_time) / samples
+
+        print("{}: {:.1f}KB per transition, {:.2f}GB for 1M transitions, add {:.1f}us, sample({}) {:.2f}ms".format(
+            name, transition_bytes / 1e3, transition_bytes * 1e6 / 1e9, add_duration * 1e6, batch_size, sample_duration * 1e3))
+
+    # the decoded observations of the compressed buffer, compared to the stored ones,
+    # except at the current position where the next observation of the last transition is stored
+    compressed = buffers["CompressedReplayBuffer"]
+    inds = np.arange(compressed.size())
+    inds = inds[inds != compressed.pos]
+    expected = buffers["ReplayBuffer"]._get_samples(inds).observations.numpy()
+    decoded = compressed._get_samples(inds).observations.numpy()
+    print("max decoding error: {:.5f}".format(np.abs(decoded - expected).max()))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compare the memory and throughput of the replay buffers")
+    parser.add_argument("--channels", type=int, default=20)
+    parser.add_argument("--binary-channels", type=int, default=10)
+    parser.add_argument("--buffer-size", type=int, default=10000)
+    parser.add_argument("--adds", type=int, default=10000)
+    parser.add_argument("--samples", type=int, default=100)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--memmap-path", type=str, default=None, help="directory of the files, a temporary one by default")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp_path:
+        benchmark(
+            args.channels,
+            args.binary_channels,
+            args.buffer_size,
+            args.adds,
+            args.samples,
+            args.batch_size,
+            args.memmap_path or tmp_path,
+        )
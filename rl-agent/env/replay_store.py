@@ -0,0 +1,175 @@
+"""
+Store of the observations of every step of the recorded episodes, to start games from the middle of an episode.
+
+The observations are compressed one by one into a single file, and indexed by episode and step,
+so that one is read with a single seek whatever the size of the store. Build it once with
+
+    python -m env.replay_store ../imitation-learning/lux-episodes replays
+
+The step to start from is drawn from a curriculum, a distribution over the steps of an episode
+- "initial": always the first step, as kaggle_environments
+- "uniform": any step
+- "linear": the weight of a step grows with the step, so the late game is seen more
+- {"name": "beta", "alpha": a, "beta": b}: a beta distribution over the episode
+- an array of a weight for every step
+"""
+
+import glob
+import json
+import os
+import time
+import zlib
+
+import numpy as np
+
+from typing import List, Union
+
+from env.lux_engine import EPISODE_STEPS
+
+OBSERVATION_KEYS = ["step", "width", "height", "globalUnitIDCount", "globalCityIDCount", "updates"]
+
+Curriculum = Union[str, dict, np.ndarray, List[float]]
+
+
+def step_weights(curriculum: Curriculum, episode_steps: int = EPISODE_STEPS) -> np.ndarray:
+    # the weight of every step of an episode
+    if not isinstance(curriculum, (str, dict)):
+        weights = np.asarray(curriculum, dtype=np.float64)
+        assert len(weights) == episode_steps, "a weight is needed for each of the {} steps".format(episode_steps)
+        return weights
+
+    name = curriculum if isinstance(curriculum, str) else curriculum["name"]
+    steps = np.arange(episode_steps, dtype=np.float64)
+    if name == "initial":
+        return (steps == 0).astype(np.float64)
+    if name == "uniform":
+        return np.ones(episode_steps)
+    if name == "linear":
+        return steps + 1
+    if name == "beta":
+        # density at the middle of each step, so that the end points are finite
+        position = (steps + 0.5) / episode_steps
+        return position ** (curriculum.get("alpha", 1) - 1) * (1 - position) ** (curriculum.get("beta", 1) - 1)
+    raise ValueError("unknown curriculum {}".format(name))
+
+
+def build_replay_store(episode_paths: List[str], store_dir: str):
+    """
+    Writes observations.bin, the compressed observations of every step of the episodes, and index.npz.
+    The episodes are json files or directories of them.
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    index = {"episode": [], "step": [], "last_step": [], "offset": [], "length": []}
+    offset = 0
+    episode_number = 0
+    with open(os.path.join(store_dir, "observations.bin"), "wb") as f:
+        for path in episode_paths:
+            for episode_path in sorted(glob.glob(os.path.join(path, "*.json"))) if os.path.isdir(path) else [path]:
+                with open(episode_path) as episode_file:
+                    episode = json.load(episode_file)
+                steps = episode["steps"]
+                for step, step_states in enumerate(steps):
+                    observation = step_states[0]["observation"]
+                    data = zlib.compress(json.dumps({key: observation[key] for key in OBSERVATION_KEYS}).encode())
+                    f.write(data)
+                    index["episode"].append(episode_number)
+                    index["step"].append(step)
+                    index["last_step"].append(len(steps) - 1)
+                    index["offset"].append(offset)
+                    index["length"].append(len(data))
+                    offset += len(data)
+                episode_number += 1
+
+    np.savez(os.path.join(store_dir, "index.npz"), **{key: np.array(value, dtype=np.int64) for key, value in index.items()})
+
+
+class ReplayStore:
+    """
+    Reads the observations of a store written by build_replay_store, see sample for a start observation.
+    """
+
+    def __init__(self, store_dir: str):
+        index = np.load(os.path.join(store_dir, "index.npz"))
+        self.episode = index["episode"]
+        self.step = index["step"]
+        self.last_step = index["last_step"]
+        self.offset = index["offset"]
+        self.length = index["length"]
+        self.path = os.path.join(store_dir, "observations.bin")
+        self.file_descriptor = os.open(self.path, os.O_RDONLY)
+        # cumulative weights by curriculum, as a curriculum is usually sampled many times
+        self.cumulative_weights = {}
+
+    def __len__(self) -> int:
+        return len(self.step)
+
+    def __getstate__(self):
+        # the file is reopened when the store is sent to a subprocess
+        state = self.__dict__.copy()
+        del state["file_descriptor"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.file_descriptor = os.open(self.path, os.O_RDONLY)
+
+    def observation(self, row: int) -> dict:
+        data = os.pread(self.file_descriptor, int(self.length[row]), int(self.offset[row]))
+        observation = json.loads(zlib.decompress(data))
+        observation.update({"player": 0, "reward": 0, "remainingOverageTime": 60})
+        return observation
+
+    def row_weights(self, curriculum: Curriculum) -> np.ndarray:
+        # the last step of an episode is over, so a game is never started from it
+        weights = step_weights(curriculum)[np.minimum(self.step, EPISODE_STEPS - 1)]
+        return np.where(self.step < self.last_step, weights, 0)
+
+    def sample_row(self, random: np.random.RandomState, curriculum: Curriculum = "uniform") -> int:
+        key = curriculum if isinstance(curriculum, str) else json.dumps(curriculum, default=list)
+        if key not in self.cumulative_weights:
+            self.cumulative_weights[key] = np.cumsum(self.row_weights(curriculum))
+        cumulative_weights = self.cumulative_weights[key]
+        return int(np.searchsorted(cumulative_weights, random.random_sample() * cumulative_weights[-1], side="right"))
+
+    def sample(self, random: np.random.RandomState, curriculum: Curriculum = "uniform") -> dict:
+        # an observation of player 0 at a step drawn from the curriculum
+        return self.observation(self.sample_row(random, curriculum))
+
+    def close(self):
+        os.close(self.file_descriptor)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Index the observations of the recorded episodes")
+    parser.add_argument("episodes", nargs="+", help="episode json files or directories of them")
+    parser.add_argument("store_dir", type=str)
+    parser.add_argument("--resets", type=int, default=1000, help="number of resets to time")
+    args = parser.parse_args()
+
+    start_time = time.perf_counter()
+    build_replay_store(args.episodes, args.store_dir)
+    store = ReplayStore(args.store_dir)
+    print("{} observations of {} episodes indexed in {:.1f}s".format(
+        len(store), len(np.unique(store.episode)), time.perf_counter() - start_time))
+
+    from env.lux_engine import LuxEngine
+
+    random = np.random.RandomState(0)
+    for curriculum in ["initial", "uniform", "linear"]:
+        start_time = time.perf_counter()
+        steps = []
+        for _ in range(args.resets):
+            row = store.sample_row(random, curriculum)
+            LuxEngine.from_observation(store.observation(row))
+            steps.append(store.step[row])
+        duration = (time.perf_counter() - start_time) / args.resets
+
+        # share of the transitions after turn 120, if the games started at these steps were played to the end
+        last_turn = EPISODE_STEPS - 1
+        steps = np.array(steps)
+        transitions = last_turn - steps
+        late_transitions = last_turn - np.maximum(steps, 120)
+        print("{}: reset {:.2f}ms, mean start step {:.0f}, {:.0%} of the transitions after turn 120".format(
+            curriculum, duration * 1000, steps.mean(), late_transitions.sum() / transitions.sum()))
@@ -0,0 +1,79 @@
+"""
+Steps per second of the multiprocess vec envs of stable_baselines3 on an environment
+that returns Lux sized map observations, to measure the cost of moving them between processes.
+
+    python -m env.vec_env_benchmark --num-envs 8 --channels 20
+
+GroupedSubprocVecEnv is measured for each number of envs per worker of --envs-per-worker.
+"""
+
+import functools
+import time
+
+import gym
+import numpy as np
+
+from gym import spaces
+
+from stable_baselines3.common.vec_env import GroupedSubprocVecEnv, ShmemVecEnv, SubprocVecEnv
+
+from env.lux_vec_env import MAP_SIZE
+
+
+class MapEnv(gym.Env):
+    """
+    An environment with (channels, 32, 32) float32 observations that spends work_ms per step,
+    the rest of a step is the transport of the vec env.
+    """
+
+    def __init__(self, channels: int = 20, episode_steps: int = 360, work_ms: float = 0.0):
+        self.observation_space = spaces.Box(low=0, high=1, shape=(channels, MAP_SIZE, MAP_SIZE), dtype=np.float32)
+        self.action_space = spaces.MultiDiscrete([6] * MAP_SIZE * MAP_SIZE)
+        self.episode_steps = episode_steps
+        self.work_ms = work_ms
+        self.observations = np.random.RandomState(0).random_sample((8,) + self.observation_space.shape).astype(np.float32)
+        self.steps = 0
+
+    def reset(self):
+        self.steps = 0
+        return self.observations[0]
+
+    def step(self, action):
+        if self.work_ms:
+            end_time = time.perf_counter() + self.work_ms / 1000
+            while time.perf_counter() < end_time:
+                pass
+        self.steps += 1
+        return self.observations[self.steps % len(self.observations)], 0.0, self.steps >= self.episode_steps, {}
+
+
+def benchmark(vec_env_classes, num_envs: int, channels: int, steps: int, work_ms: float, start_method: str = None):
+    for vec_env_class in vec_env_classes:
+        env = vec_env_class([lambda: MapEnv(channels, work_ms=work_ms) for _ in range(num_envs)], start_method=start_method)
+        actions = np.zeros((num_envs,) + env.action_space.shape, dtype=np.int64)
+        env.reset()
+        start_time = time.perf_counter()
+        for _ in range(steps):
+            env.step(actions)
+        duration = time.perf_counter() - start_time
+        workers = len(env.processes)
+        env.close()
+        name = getattr(vec_env_class, "__name__", None) or vec_env_class.func.__name__
+        print("{} ({} workers): {:.0f} env steps/s, {:.3f}ms per step of the {} envs".format(
+            name, workers, steps * num_envs / duration, duration / steps * 1000, num_envs))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compare the transport of the multiprocess vec envs")
+    parser.add_argument("--num-envs", type=int, default=8)
+    parser.add_argument("--channels", type=int, default=20)
+    parser.add_argument("--steps", type=int, default=1000)
+    parser.add_argument("--work-ms", type=float, default=0.0, help="time spent by the environment per step")
+    parser.add_argument("--envs-per-worker", type=int, nargs="*", default=[2, 4, 8])
+    parser.add_argument("--start-method", type=str, default=None)
+    args = parser.parse_args()
+    grouped = [functools.partial(GroupedSubprocVecEnv, n_envs_per_worker=k) for k in args.envs_per_worker]
+    benchmark([SubprocVecEnv, ShmemVecEnv] + grouped,
+              args.num_envs, args.channels, args.steps, args.work_ms, args.start_method)
@@ -1,6 +1,8 @@
+import json
+import os
 import warnings
 from abc import ABC, abstractmethod
-from typing import Dict, Generator, Optional, Union
+from typing import Any, Dict, Generator, Optional, Tuple, Union
 
 import numpy as np
 import torch as th
@@ -12,8 +14,11 @@ try:
 except ImportError:
     psutil = None
 
+from stable_baselines3.common.codecs import Codec, IdentityCodec
 from stable_baselines3.common.preprocessing import get_action_dim, get_obs_shape
-from stable_baselines3.common.type_aliases import ReplayBufferSamples, RolloutBufferSamples
+from stable_baselines3.common.segment_tree import MinSegmentTree, SumSegmentTree
+from stable_baselines3.common.type_aliases import PrioritizedReplayBufferSamples, ReplayBufferSamples, RolloutBufferSamples
+from stable_baselines3.common.utils import to_device
 from stable_baselines3.common.vec_env import VecNormalize
 
 
@@ -157,6 +162,8 @@ class ReplayBuffer(BaseBuffer):
         at a cost of more complexity.
         See https://github.com/DLR-RM/stable-baselines3/issues/37#issuecomment-637501195
         and https://github.com/DLR-RM/stable-baselines3/pull/28#issuecomment-637559274
+    :param n_steps: Number of steps of the returns of the samples, see ``_n_step_transitions()``
+    :param gamma: Discount factor of the n-step returns
     """
 
     def __init__(
@@ -167,10 +174,15 @@ class ReplayBuffer(BaseBuffer):
         device: Union[th.device, str] = "cpu",
         n_envs: int = 1,
         optimize_memory_usage: bool = False,
+        n_steps: int = 1,
+        gamma: float = 0.99,
     ):
         super(ReplayBuffer, self).__init__(buffer_size, observation_space, action_space, device, n_envs=n_envs)
 
         assert n_envs == 1, "Replay buffer only support single environment for now"
+        assert n_steps >= 1, "The returns must have at least one step"
+        self.n_steps = n_steps
+        self.gamma = gamma
 
         # Check that the replay buffer can fit into the memory
         if psutil is not None:
@@ -188,30 +200,38 @@ class ReplayBuffer(BaseBuffer):
         self.dones = np.zeros((self.buffer_size, self.n_envs), dtype=np.float32)
 
         if psutil is not None:
-            total_memory_usage = self.observations.nbytes + self.actions.nbytes + self.rewards.nbytes + self.dones.nbytes
-            if self.next_observations is not None:
-                total_memory_usage += self.next_observations.nbytes
-
-            if total_memory_usage > mem_available:
-                # Convert to GB
-                total_memory_usage /= 1e9
-                mem_available /= 1e9
-                warnings.warn(
-                    "This system does not have apparently enough memory to store the complete "
-                    f"replay buffer {total_memory_usage:.2f}GB > {mem_available:.2f}GB"
-                )
+            self._check_memory_usage(mem_available)
+
+    def _check_memory_usage(self, mem_available: int) -> None:
+        """
+        Warn if the arrays of the buffer do not fit into the memory available before their allocation.
+
+        :param mem_available: the memory available in bytes
+        """
+        total_memory_usage = self.observations.nbytes + self.actions.nbytes + self.rewards.nbytes + self.dones.nbytes
+        if self.next_observations is not None:
+            total_memory_usage += self.next_observations.nbytes
+
+        if total_memory_usage > mem_available:
+            # Convert to GB
+            total_memory_usage /= 1e9
+            mem_available /= 1e9
+            warnings.warn(
+                "This system does not have apparently enough memory to store the complete "
+                f"replay buffer {total_memory_usage:.2f}GB > {mem_available:.2f}GB"
+            )
 
     def add(self, obs: np.ndarray, next_obs: np.ndarray, action: np.ndarray, reward: np.ndarray, done: np.ndarray) -> None:
-        # Copy to avoid modification by reference
-        self.observations[self.pos] = np.array(obs).copy()
+        # The assignment copies the values into the buffer, which avoids modification by reference
+        self.observations[self.pos] = obs
         if self.optimize_memory_usage:
-            self.observations[(self.pos + 1) % self.buffer_size] = np.array(next_obs).copy()
+            self.observations[(self.pos + 1) % self.buffer_size] = next_obs
         else:
-            self.next_observations[self.pos] = np.array(next_obs).copy()
+            self.next_observations[self.pos] = next_obs
 
-        self.actions[self.pos] = np.array(action).copy()
-        self.rewards[self.pos] = np.array(reward).copy()
-        self.dones[self.pos] = np.array(done).copy()
+        self.actions[self.pos] = action
+        self.rewards[self.pos] = reward
+        self.dones[self.pos] = done
 
         self.pos += 1
         if self.pos == self.buffer_size:
@@ -240,20 +260,435 @@ class ReplayBuffer(BaseBuffer):
             batch_inds = np.random.randint(0, self.pos, size=batch_size)
         return self._get_samples(batch_inds, env=env)
 
+    def _n_step_transitions(
+        self, batch_inds: np.ndarray, env: Optional[VecNormalize] = None
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, Optional[np.ndarray]]:
+        """
+        The n-step returns of the sampled transitions: the discounted sum of the rewards of the ``n_steps``
+        transitions from each of them, stopped at the end of the episode and before the current position
+        of the buffer, where the next transitions are not written yet or belong to an older trajectory.
+        All the samples are computed at once, by indexing the ``(batch_size, n_steps)`` following transitions.
+
+        :param batch_inds: the indices of the sampled transitions
+        :param env: associated gym VecEnv to normalize the rewards
+        :return: the indices of the last transitions of the returns, whose next observations bootstrap them,
+            the returns, the dones of the last transitions, and the discounts of the bootstrap values
+            (None for 1-step returns, the discount is then gamma)
+        """
+        if self.n_steps == 1:
+            return batch_inds, self._normalize_reward(self.rewards[batch_inds], env), self.dones[batch_inds], None
+
+        steps = np.arange(self.n_steps)
+        inds = (batch_inds.reshape(-1, 1) + steps) % self.buffer_size
+        rewards = self._normalize_reward(self.rewards[inds, 0], env)
+        dones = self.dones[inds, 0]
+        # a step is included if the episode did not end at the previous steps,
+        # and if it was written after the sampled transition
+        included = np.ones_like(dones)
+        included[:, 1:] = np.cumprod(1 - dones[:, :-1], axis=1)
+        n_available = (self.pos - 1 - batch_inds) % self.buffer_size + 1
+        included *= steps < n_available.reshape(-1, 1)
+        n_included = included.sum(axis=1).astype(np.int64)
+
+        returns = (rewards * included * self.gamma ** steps).sum(axis=1, dtype=np.float32)
+        last_inds = inds[np.arange(len(inds)), n_included - 1]
+        discounts = (self.gamma ** n_included).astype(np.float32)
+        return last_inds, returns.reshape(-1, 1), self.dones[last_inds], discounts.reshape(-1, 1)
+
     def _get_samples(self, batch_inds: np.ndarray, env: Optional[VecNormalize] = None) -> ReplayBufferSamples:
+        next_inds, rewards, dones, discounts = self._n_step_transitions(batch_inds, env)
         if self.optimize_memory_usage:
-            next_obs = self._normalize_obs(self.observations[(batch_inds + 1) % self.buffer_size, 0, :], env)
+            next_obs = self._normalize_obs(self.observations[(next_inds + 1) % self.buffer_size, 0, :], env)
         else:
-            next_obs = self._normalize_obs(self.next_observations[batch_inds, 0, :], env)
+            next_obs = self._normalize_obs(self.next_observations[next_inds, 0, :], env)
 
         data = (
             self._normalize_obs(self.observations[batch_inds, 0, :], env),
             self.actions[batch_inds, 0, :],
             next_obs,
-            self.dones[batch_inds],
-            self._normalize_reward(self.rewards[batch_inds], env),
+            dones,
+            rewards,
+        )
+        return ReplayBufferSamples(
+            *tuple(map(self.to_torch, data)), discounts=None if discounts is None else self.to_torch(discounts)
+        )
+
+
+class CompressedReplayBuffer(ReplayBuffer):
+    """
+    Replay buffer storing the observations and actions encoded by codecs (see ``common.codecs``),
+    e.g. quantized to uint8 or bit-packed, and decoded when sampled.
+    The codecs encode straight into the buffer, without intermediate copies.
+    When the buffer is created directly, the next observations share the storage of the observations by default
+    (see ``optimize_memory_usage``). The off-policy algorithms pass their own ``optimize_memory_usage``,
+    which is False by default, unless it is given in their ``replay_buffer_kwargs``.
+
+    :param buffer_size: Max number of element in the buffer
+    :param observation_space: Observation space
+    :param action_space: Action space
+    :param device:
+    :param n_envs: Number of parallel environments
+    :param optimize_memory_usage: Store the next observation of a transition as the observation of the next one,
+        which halves the memory used by the observations
+    :param codecs: the codec of the ``"observations"`` and of the ``"actions"``,
+        the values are stored as they are by default
+    :param n_steps: Number of steps of the returns of the samples, see ``ReplayBuffer._n_step_transitions()``
+    :param gamma: Discount factor of the n-step returns
+    """
+
+    def __init__(
+        self,
+        buffer_size: int,
+        observation_space: spaces.Space,
+        action_space: spaces.Space,
+        device: Union[th.device, str] = "cpu",
+        n_envs: int = 1,
+        optimize_memory_usage: bool = True,
+        codecs: Optional[Dict[str, Codec]] = None,
+        n_steps: int = 1,
+        gamma: float = 0.99,
+    ):
+        BaseBuffer.__init__(self, buffer_size, observation_space, action_space, device, n_envs=n_envs)
+
+        assert n_envs == 1, "Replay buffer only support single environment for now"
+        assert n_steps >= 1, "The returns must have at least one step"
+        self.n_steps = n_steps
+        self.gamma = gamma
+        codecs = {} if codecs is None else codecs
+        assert set(codecs) <= {"observations", "actions"}, "Only the observations and actions can be encoded"
+        self.observation_codec = codecs.get("observations", IdentityCodec(observation_space.dtype))
+        self.action_codec = codecs.get("actions", IdentityCodec(action_space.dtype))
+
+        # Check that the replay buffer can fit into the memory
+        if psutil is not None:
+            mem_available = psutil.virtual_memory().available
+
+        self.optimize_memory_usage = optimize_memory_usage
+        self._allocate_arrays()
+
+        if psutil is not None:
+            self._check_memory_usage(mem_available)
+
+    def _allocate_arrays(self) -> None:
+        self.observations = self._allocate("observations", self.observation_codec, self.obs_shape)
+        if self.optimize_memory_usage:
+            # `observations` contains also the next observation
+            self.next_observations = None
+        else:
+            self.next_observations = self._allocate("next_observations", self.observation_codec, self.obs_shape)
+        self.actions = self._allocate("actions", self.action_codec, (self.action_dim,))
+        self.rewards = self._allocate("rewards", IdentityCodec(np.float32), ())
+        self.dones = self._allocate("dones", IdentityCodec(np.float32), ())
+
+    def _allocate(self, name: str, codec: Codec, shape: Tuple[int, ...]) -> np.ndarray:
+        """
+        :param name: the name of the field
+        :param codec: the codec of the field
+        :param shape: the shape of a value of the field
+        :return: the array storing the encoded values of the field
+        """
+        return np.zeros((self.buffer_size, self.n_envs) + codec.encoded_shape(shape), dtype=codec.encoded_dtype)
+
+    def add(self, obs: np.ndarray, next_obs: np.ndarray, action: np.ndarray, reward: np.ndarray, done: np.ndarray) -> None:
+        obs_shape = (self.n_envs,) + self.obs_shape
+        self.observation_codec.encode(np.reshape(obs, obs_shape), self.observations[self.pos])
+        if self.optimize_memory_usage:
+            next_obs_out = self.observations[(self.pos + 1) % self.buffer_size]
+        else:
+            next_obs_out = self.next_observations[self.pos]
+        self.observation_codec.encode(np.reshape(next_obs, obs_shape), next_obs_out)
+        self.action_codec.encode(np.reshape(action, (self.n_envs, self.action_dim)), self.actions[self.pos])
+        self.rewards[self.pos] = reward
+        self.dones[self.pos] = done
+
+        self.pos += 1
+        if self.pos == self.buffer_size:
+            self.full = True
+            self.pos = 0
+
+    def _read(self, array: np.ndarray, batch_inds: np.ndarray) -> np.ndarray:
+        """
+        :param array: an array of the buffer
+        :param batch_inds: indices of transitions
+        :return: the encoded values of the transitions, of the first env
+        """
+        return array[batch_inds, 0]
+
+    def _get_samples(self, batch_inds: np.ndarray, env: Optional[VecNormalize] = None) -> ReplayBufferSamples:
+        next_inds, rewards, dones, discounts = self._n_step_transitions(batch_inds, env)
+        if self.optimize_memory_usage:
+            next_obs = self._read(self.observations, (next_inds + 1) % self.buffer_size)
+        else:
+            next_obs = self._read(self.next_observations, next_inds)
+
+        data = (
+            self._normalize_obs(self.observation_codec.decode(self._read(self.observations, batch_inds), self.obs_shape), env),
+            self.action_codec.decode(self._read(self.actions, batch_inds), (self.action_dim,)),
+            self._normalize_obs(self.observation_codec.decode(next_obs, self.obs_shape), env),
+            dones,
+            rewards,
+        )
+        # the indexing and decoding already made copies of the values
+        return ReplayBufferSamples(
+            *tuple(self.to_torch(array, copy=False) for array in data),
+            discounts=None if discounts is None else self.to_torch(discounts, copy=False),
+        )
+
+
+class MemmapReplayBuffer(CompressedReplayBuffer):
+    """
+    Compressed replay buffer whose arrays are ``np.memmap`` files of a directory, for buffers larger than the memory.
+    The position of the buffer is saved with the arrays every ``flush_freq`` transitions, along with the configuration
+    of the buffer. With ``resume=True``, a buffer created on a directory that holds one reopens it where it was last
+    flushed, e.g. to resume a crashed run, provided that it has the same configuration.
+    Pickling the buffer (``save_replay_buffer()``) flushes it and only saves the path of the directory.
+
+    The samples are read from the files in the order of their indices, which avoids random accesses on the disk.
+
+    :param buffer_size: Max number of element in the buffer
+    :param observation_space: Observation space
+    :param action_space: Action space
+    :param device:
+    :param n_envs: Number of parallel environments
+    :param optimize_memory_usage: Store the next observation of a transition as the observation of the next one,
+        which halves the memory used by the observations
+    :param codecs: the codec of the ``"observations"`` and of the ``"actions"``,
+        the values are stored as they are by default
+    :param path: the directory of the files of the buffer, created if needed
+    :param flush_freq: number of transitions between two flushes of the buffer
+    :param resume: whether to reopen the buffer held by the directory, if any.
+        Otherwise, the directory must not hold a buffer.
+    :param n_steps: Number of steps of the returns of the samples, see ``ReplayBuffer._n_step_transitions()``
+    :param gamma: Discount factor of the n-step returns
+    """
+
+    def __init__(
+        self,
+        buffer_size: int,
+        observation_space: spaces.Space,
+        action_space: spaces.Space,
+        device: Union[th.device, str] = "cpu",
+        n_envs: int = 1,
+        optimize_memory_usage: bool = True,
+        codecs: Optional[Dict[str, Codec]] = None,
+        path: Optional[str] = None,
+        flush_freq: int = 1000,
+        n_steps: int = 1,
+        gamma: float = 0.99,
+        resume: bool = False,
+    ):
+        if path is None:
+            raise ValueError("The directory of the files of the MemmapReplayBuffer must be given with `path`")
+        self.path = path
+        self.flush_freq = flush_freq
+        os.makedirs(path, exist_ok=True)
+        # the files are reopened when the directory holds a buffer
+        self.resumed = os.path.exists(self._state_path())
+        if self.resumed and not resume:
+            raise ValueError(
+                f"{path} already holds a replay buffer, pass `resume=True` to reopen it, or use another directory"
+            )
+        super(MemmapReplayBuffer, self).__init__(
+            buffer_size,
+            observation_space,
+            action_space,
+            device,
+            n_envs=n_envs,
+            optimize_memory_usage=optimize_memory_usage,
+            codecs=codecs,
+            n_steps=n_steps,
+            gamma=gamma,
+        )
+        if self.resumed:
+            self._load_state()
+        else:
+            self.flush()
+
+    def _state_path(self) -> str:
+        return os.path.join(self.path, "state.json")
+
+    def _config(self) -> Dict[str, Any]:
+        """
+        :return: what the files of the buffer depend on, as saved in JSON
+        """
+        config = {
+            "buffer_size": self.buffer_size,
+            "n_envs": self.n_envs,
+            "obs_shape": list(self.obs_shape),
+            "action_dim": self.action_dim,
+            "optimize_memory_usage": self.optimize_memory_usage,
+            "n_steps": self.n_steps,
+            "codecs": {"observations": self.observation_codec.get_config(), "actions": self.action_codec.get_config()},
+        }
+        return json.loads(json.dumps(config))
+
+    def _allocate_arrays(self) -> None:
+        if self.resumed:
+            with open(self._state_path()) as file_handler:
+                saved_config = json.load(file_handler).get("config")
+            config = self._config()
+            if saved_config != config:
+                different = sorted(key for key in config if saved_config is None or saved_config.get(key) != config[key])
+                raise ValueError(
+                    f"The replay buffer of {self.path} was created with a different configuration ({', '.join(different)}), "
+                    "create the buffer with the same parameters, or use another directory"
+                )
+        super(MemmapReplayBuffer, self)._allocate_arrays()
+
+    def _allocate(self, name: str, codec: Codec, shape: Tuple[int, ...]) -> np.ndarray:
+        file_path = os.path.join(self.path, f"{name}.npy")
+        shape = (self.buffer_size, self.n_envs) + codec.encoded_shape(shape)
+        if self.resumed:
+            array = np.lib.format.open_memmap(file_path, mode="r+")
+            assert array.shape == shape and array.dtype == codec.encoded_dtype, f"{file_path} does not match the buffer"
+            return array
+        return np.lib.format.open_memmap(file_path, mode="w+", dtype=codec.encoded_dtype, shape=shape)
+
+    def _check_memory_usage(self, mem_available: int) -> None:
+        # the arrays are on the disk, and are only partially loaded in memory
+        pass
+
+    def _load_state(self) -> None:
+        with open(self._state_path()) as file_handler:
+            state = json.load(file_handler)
+        self.pos, self.full = state["pos"], state["full"]
+
+    def flush(self) -> None:
+        """
+        Write the arrays to the disk, then the position of the buffer.
+        """
+        for array in [self.observations, self.next_observations, self.actions, self.rewards, self.dones]:
+            if array is not None:
+                array.flush()
+        # replace the state at once, a crash leaves the previous one
+        tmp_path = self._state_path() + ".tmp"
+        with open(tmp_path, "w") as file_handler:
+            json.dump({"pos": self.pos, "full": self.full, "config": self._config()}, file_handler)
+        os.replace(tmp_path, self._state_path())
+
+    def add(self, obs: np.ndarray, next_obs: np.ndarray, action: np.ndarray, reward: np.ndarray, done: np.ndarray) -> None:
+        super(MemmapReplayBuffer, self).add(obs, next_obs, action, reward, done)
+        if self.pos % self.flush_freq == 0:
+            self.flush()
+
+    def _read(self, array: np.ndarray, batch_inds: np.ndarray) -> np.ndarray:
+        # read the encoded transitions in the order of the file, then put them back in the order of the indices
+        order = np.argsort(batch_inds, kind="stable")
+        values = np.empty((len(batch_inds),) + array.shape[2:], dtype=array.dtype)
+        values[order] = np.asarray(array[batch_inds[order], 0])
+        return values
+
+    def __getstate__(self) -> Dict[str, Any]:
+        self.flush()
+        state = self.__dict__.copy()
+        # the arrays are reopened from the files
+        for name in ["observations", "next_observations", "actions", "rewards", "dones"]:
+            state[name] = None
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self.resumed = True
+        self._allocate_arrays()
+        self._load_state()
+
+
+class PrioritizedReplayBuffer(ReplayBuffer):
+    """
+    Prioritized replay buffer, used by DQN to sample the transitions in proportion to their priority ** alpha,
+    the absolute TD error of their last update (https://arxiv.org/abs/1511.05952).
+    The priorities are in a sum segment tree and a min segment tree, sampled and updated by batches.
+    The samples come with their importance sampling weights, normalized by the maximum weight,
+    and their indices to update their priorities.
+
+    :param buffer_size: Max number of element in the buffer
+    :param observation_space: Observation space
+    :param action_space: Action space
+    :param device:
+    :param n_envs: Number of parallel environments
+    :param optimize_memory_usage: Not supported, the transition at the current position would be invalid
+    :param alpha: how much the priorities are used, 0 corresponds to uniform sampling
+    :param beta: initial exponent of the importance sampling weights, 1 fully compensates the prioritization
+    :param final_beta: exponent of the importance sampling weights at the end of the training, see ``update_beta()``
+    :param epsilon: added to the absolute TD errors, so that every transition can be sampled
+    :param n_steps: Number of steps of the returns of the samples, see ``ReplayBuffer._n_step_transitions()``
+    :param gamma: Discount factor of the n-step returns
+    """
+
+    def __init__(
+        self,
+        buffer_size: int,
+        observation_space: spaces.Space,
+        action_space: spaces.Space,
+        device: Union[th.device, str] = "cpu",
+        n_envs: int = 1,
+        optimize_memory_usage: bool = False,
+        alpha: float = 0.6,
+        beta: float = 0.4,
+        final_beta: float = 1.0,
+        epsilon: float = 1e-6,
+        n_steps: int = 1,
+        gamma: float = 0.99,
+    ):
+        assert not optimize_memory_usage, "The prioritized replay buffer does not support optimize_memory_usage"
+        super(PrioritizedReplayBuffer, self).__init__(
+            buffer_size, observation_space, action_space, device, n_envs=n_envs, n_steps=n_steps, gamma=gamma
+        )
+        self.alpha = alpha
+        self.beta = beta
+        self.initial_beta = beta
+        self.final_beta = final_beta
+        self.epsilon = epsilon
+        self.sum_tree = SumSegmentTree(buffer_size)
+        self.min_tree = MinSegmentTree(buffer_size)
+        # the new transitions get the highest priority seen so far, so that they are sampled at least once
+        self.max_priority = 1.0
+
+    def add(self, obs: np.ndarray, next_obs: np.ndarray, action: np.ndarray, reward: np.ndarray, done: np.ndarray) -> None:
+        pos = self.pos
+        super(PrioritizedReplayBuffer, self).add(obs, next_obs, action, reward, done)
+        self.sum_tree[pos] = self.max_priority ** self.alpha
+        self.min_tree[pos] = self.max_priority ** self.alpha
+
+    def update_beta(self, progress_remaining: float) -> None:
+        """
+        Anneal the exponent of the importance sampling weights linearly from ``beta`` to ``final_beta``.
+
+        :param progress_remaining: the progress remaining of the training, from 1 to 0
+        """
+        self.beta = self.final_beta + (self.initial_beta - self.final_beta) * progress_remaining
+
+    def sample(self, batch_size: int, env: Optional[VecNormalize] = None) -> PrioritizedReplayBufferSamples:
+        """
+        Sample elements from the replay buffer in proportion to their priority,
+        one from each of ``batch_size`` segments of equal total priority.
+
+        :param batch_size: Number of element to sample
+        :param env: associated gym VecEnv
+            to normalize the observations/rewards when sampling
+        :return: the samples, with their importance sampling weights and their indices
+        """
+        total_priority = self.sum_tree.sum()
+        prefixsums = (np.arange(batch_size) + np.random.random_sample(batch_size)) * (total_priority / batch_size)
+        # rounding errors may lead past the last transition
+        batch_inds = np.minimum(self.sum_tree.find_prefixsum_idx(prefixsums), self.size() - 1)
+
+        # (N * P(i)) ** -beta, divided by the maximum weight (N * min P) ** -beta
+        weights = (self.sum_tree[batch_inds] / self.min_tree.min()) ** -self.beta
+        samples = self._get_samples(batch_inds, env=env)
+        return PrioritizedReplayBufferSamples(
+            *samples, weights=self.to_torch(weights.astype(np.float32).reshape(-1, 1)), indices=batch_inds
         )
-        return ReplayBufferSamples(*tuple(map(self.to_torch, data)))
+
+    def update_priorities(self, batch_inds: np.ndarray, td_errors: np.ndarray) -> None:
+        """
+        :param batch_inds: the indices of sampled transitions
+        :param td_errors: their new TD errors
+        """
+        priorities = np.abs(td_errors).reshape(-1) + self.epsilon
+        self.sum_tree[batch_inds] = priorities ** self.alpha
+        self.min_tree[batch_inds] = priorities ** self.alpha
+        self.max_priority = max(self.max_priority, float(priorities.max()))
 
 
 class RolloutBuffer(BaseBuffer):
@@ -295,6 +730,8 @@ class RolloutBuffer(BaseBuffer):
         self.gamma = gamma
         self.observations, self.actions, self.rewards, self.advantages = None, None, None, None
         self.returns, self.dones, self.values, self.log_probs = None, None, None, None
+        # the flattened rollout on the device, uploaded once by ``get()``
+        self.device_tensors = {}
         self.generator_ready = False
         self.reset()
 
@@ -307,6 +744,9 @@ class RolloutBuffer(BaseBuffer):
         self.values = np.zeros((self.buffer_size, self.n_envs), dtype=np.float32)
         self.log_probs = np.zeros((self.buffer_size, self.n_envs), dtype=np.float32)
         self.advantages = np.zeros((self.buffer_size, self.n_envs), dtype=np.float32)
+        # next position of each env, when the envs are stepped independently
+        self.env_pos = np.zeros(self.n_envs, dtype=np.int64)
+        self.device_tensors = {}
         self.generator_ready = False
         super(RolloutBuffer, self).reset()
 
@@ -342,7 +782,14 @@ class RolloutBuffer(BaseBuffer):
         self.returns = self.advantages + self.values
 
     def add(
-        self, obs: np.ndarray, action: np.ndarray, reward: np.ndarray, done: np.ndarray, value: th.Tensor, log_prob: th.Tensor
+        self,
+        obs: np.ndarray,
+        action: np.ndarray,
+        reward: np.ndarray,
+        done: np.ndarray,
+        value: th.Tensor,
+        log_prob: th.Tensor,
+        env_ids: Optional[np.ndarray] = None,
     ) -> None:
         """
         :param obs: Observation
@@ -353,11 +800,17 @@ class RolloutBuffer(BaseBuffer):
             following the current policy.
         :param log_prob: log probability of the action
             following the current policy.
+        :param env_ids: the envs of the transitions, when only some of the envs were stepped
+            (e.g. with an ``AsyncVecEnv``). Each env then fills its own column of the buffer.
         """
         if len(log_prob.shape) == 0:
             # Reshape 0-d tensor to avoid error
             log_prob = log_prob.reshape(-1, 1)
 
+        if env_ids is not None:
+            self._add_to_envs(obs, action, reward, done, value, log_prob, env_ids)
+            return
+
         self.observations[self.pos] = np.array(obs).copy()
         self.actions[self.pos] = np.array(action).copy()
         self.rewards[self.pos] = np.array(reward).copy()
@@ -365,9 +818,37 @@ class RolloutBuffer(BaseBuffer):
         self.values[self.pos] = value.clone().cpu().numpy().flatten()
         self.log_probs[self.pos] = log_prob.clone().cpu().numpy()
         self.pos += 1
+        self.env_pos[:] = self.pos
         if self.pos == self.buffer_size:
             self.full = True
 
+    def _add_to_envs(
+        self,
+        obs: np.ndarray,
+        action: np.ndarray,
+        reward: np.ndarray,
+        done: np.ndarray,
+        value: th.Tensor,
+        log_prob: th.Tensor,
+        env_ids: np.ndarray,
+    ) -> None:
+        """
+        Add a transition of each of the given envs at the next position of its column.
+        """
+        env_ids = np.asarray(env_ids)
+        rows = self.env_pos[env_ids]
+        assert (rows < self.buffer_size).all(), "The rollout of an env is already full"
+        self.observations[rows, env_ids] = np.array(obs)
+        self.actions[rows, env_ids] = np.array(action).reshape(len(env_ids), self.action_dim)
+        self.rewards[rows, env_ids] = np.array(reward)
+        self.dones[rows, env_ids] = np.array(done)
+        self.values[rows, env_ids] = value.clone().cpu().numpy().flatten()
+        self.log_probs[rows, env_ids] = log_prob.clone().cpu().numpy().flatten()
+        self.env_pos[env_ids] += 1
+        # the buffer is full when every env has filled its column
+        self.pos = int(self.env_pos.min())
+        self.full = self.pos == self.buffer_size
+
     def get(self, batch_size: Optional[int] = None) -> Generator[RolloutBufferSamples, None, None]:
         assert self.full, ""
         indices = np.random.permutation(self.buffer_size * self.n_envs)
@@ -375,7 +856,10 @@ class RolloutBuffer(BaseBuffer):
         if not self.generator_ready:
             for tensor in ["observations", "actions", "values", "log_probs", "advantages", "returns"]:
                 self.__dict__[tensor] = self.swap_and_flatten(self.__dict__[tensor])
+                # the minibatches are then sliced on the device, without a copy from the host for each of them
+                self.device_tensors[tensor] = to_device(self.__dict__[tensor], th.device(self.device))
             self.generator_ready = True
+        indices = to_device(indices, th.device(self.device))
 
         # Return everything, don't create minibatches
         if batch_size is None:
@@ -386,13 +870,146 @@ class RolloutBuffer(BaseBuffer):
             yield self._get_samples(indices[start_idx : start_idx + batch_size])
             start_idx += batch_size
 
-    def _get_samples(self, batch_inds: np.ndarray, env: Optional[VecNormalize] = None) -> RolloutBufferSamples:
-        data = (
-            self.observations[batch_inds],
-            self.actions[batch_inds],
-            self.values[batch_inds].flatten(),
-            self.log_probs[batch_inds].flatten(),
-            self.advantages[batch_inds].flatten(),
-            self.returns[batch_inds].flatten(),
+    def _get_samples(self, batch_inds: th.Tensor, env: Optional[VecNormalize] = None) -> RolloutBufferSamples:
+        tensors = self.device_tensors
+        return RolloutBufferSamples(
+            tensors["observations"][batch_inds],
+            tensors["actions"][batch_inds],
+            tensors["values"][batch_inds].flatten(),
+            tensors["log_probs"][batch_inds].flatten(),
+            tensors["advantages"][batch_inds].flatten(),
+            tensors["returns"][batch_inds].flatten(),
+            batch_inds,
         )
-        return RolloutBufferSamples(*tuple(map(self.to_torch, data)))
+
+
+class DeviceRolloutBuffer(RolloutBuffer):
+    """
+    Rollout buffer that holds the rollout in PyTorch tensors on the training device.
+    The transitions are copied to the device as they are added, the GAE is computed on the device
+    with a parallel reverse scan, and ``get()`` samples the minibatches with index tensors,
+    so that nothing goes back to the host between collecting the rollout and training on it.
+
+    :param buffer_size: Max number of element in the buffer
+    :param observation_space: Observation space
+    :param action_space: Action space
+    :param device:
+    :param gae_lambda: Factor for trade-off of bias vs variance for Generalized Advantage Estimator
+        Equivalent to classic advantage when set to 1.
+    :param gamma: Discount factor
+    :param n_envs: Number of parallel environments
+    """
+
+    def reset(self) -> None:
+        device = th.device(self.device)
+        size = (self.buffer_size, self.n_envs)
+        self.observations = th.zeros(size + self.obs_shape, dtype=th.float32, device=device)
+        self.actions = th.zeros(size + (self.action_dim,), dtype=th.float32, device=device)
+        self.rewards = th.zeros(size, dtype=th.float32, device=device)
+        self.returns = th.zeros(size, dtype=th.float32, device=device)
+        self.dones = th.zeros(size, dtype=th.float32, device=device)
+        self.values = th.zeros(size, dtype=th.float32, device=device)
+        self.log_probs = th.zeros(size, dtype=th.float32, device=device)
+        self.advantages = th.zeros(size, dtype=th.float32, device=device)
+        self.env_pos = np.zeros(self.n_envs, dtype=np.int64)
+        self.device_tensors = {}
+        self.generator_ready = False
+        BaseBuffer.reset(self)
+
+    def _as_tensor(self, array: Union[np.ndarray, th.Tensor]) -> th.Tensor:
+        # observations may already be on the device, e.g. the batch given to the policy
+        if isinstance(array, th.Tensor):
+            return array.to(self.device, dtype=th.float32)
+        return to_device(np.asarray(array, dtype=np.float32), th.device(self.device))
+
+    def add(
+        self,
+        obs: Union[np.ndarray, th.Tensor],
+        action: np.ndarray,
+        reward: np.ndarray,
+        done: np.ndarray,
+        value: th.Tensor,
+        log_prob: th.Tensor,
+        env_ids: Optional[np.ndarray] = None,
+    ) -> None:
+        """
+        :param obs: Observation, a NumPy array or a tensor
+        :param action: Action
+        :param reward:
+        :param done: End of episode signal.
+        :param value: estimated value of the current state
+            following the current policy.
+        :param log_prob: log probability of the action
+            following the current policy.
+        :param env_ids: the envs of the transitions, when only some of the envs were stepped
+            (e.g. with an ``AsyncVecEnv``). Each env then fills its own column of the buffer.
+        """
+        if env_ids is None:
+            rows, columns, n_transitions = self.pos, slice(None), self.n_envs
+        else:
+            env_ids = np.asarray(env_ids)
+            assert (self.env_pos[env_ids] < self.buffer_size).all(), "The rollout of an env is already full"
+            rows = th.as_tensor(self.env_pos[env_ids], device=self.device)
+            columns, n_transitions = th.as_tensor(env_ids, device=self.device), len(env_ids)
+
+        self.observations[rows, columns] = self._as_tensor(obs).reshape((n_transitions,) + self.obs_shape)
+        self.actions[rows, columns] = self._as_tensor(action).reshape(n_transitions, self.action_dim)
+        self.rewards[rows, columns] = self._as_tensor(reward)
+        self.dones[rows, columns] = self._as_tensor(done)
+        self.values[rows, columns] = value.detach().to(self.device).flatten()
+        self.log_probs[rows, columns] = log_prob.detach().to(self.device).flatten()
+
+        if env_ids is None:
+            self.pos += 1
+            self.env_pos[:] = self.pos
+        else:
+            self.env_pos[env_ids] += 1
+            # the buffer is full when every env has filled its column
+            self.pos = int(self.env_pos.min())
+        self.full = self.pos == self.buffer_size
+
+    def compute_returns_and_advantage(self, last_values: th.Tensor, dones: np.ndarray) -> None:
+        """
+        Compute the returns and the GAE advantage as ``RolloutBuffer.compute_returns_and_advantage``,
+        with the recursion ``A_t = delta_t + gamma * lambda * (1 - done_{t+1}) * A_{t+1}`` solved by a
+        reverse scan in ``log2(buffer_size)`` vectorized steps instead of a loop over the steps.
+
+        :param last_values:
+        :param dones:
+        """
+        last_values = last_values.detach().to(self.device).flatten()
+        next_non_terminal = th.cat([1.0 - self.dones[1:], 1.0 - self._as_tensor(dones).reshape(1, -1)])
+        next_values = th.cat([self.values[1:], last_values.reshape(1, -1)])
+        deltas = self.rewards + self.gamma * next_values * next_non_terminal - self.values
+
+        # A_t = a_t + c_t * A_{t+k}, with k doubling at each step until it spans the buffer
+        advantages = deltas
+        coefficients = self.gamma * self.gae_lambda * next_non_terminal
+        shift = 1
+        while shift < self.buffer_size:
+            advantages = th.cat([advantages[:-shift] + coefficients[:-shift] * advantages[shift:], advantages[-shift:]])
+            coefficients = th.cat([coefficients[:-shift] * coefficients[shift:], th.zeros_like(coefficients[-shift:])])
+            shift *= 2
+        self.advantages = advantages
+        self.returns = self.advantages + self.values
+
+    def get(self, batch_size: Optional[int] = None) -> Generator[RolloutBufferSamples, None, None]:
+        assert self.full, ""
+        n_transitions = self.buffer_size * self.n_envs
+        indices = th.randperm(n_transitions, device=self.device)
+        # Prepare the data
+        if not self.generator_ready:
+            for tensor in ["observations", "actions", "values", "log_probs", "advantages", "returns"]:
+                # swap and flatten the steps and envs dimensions, as swap_and_flatten
+                array = self.__dict__[tensor]
+                self.device_tensors[tensor] = array.transpose(0, 1).reshape((n_transitions,) + array.shape[2:])
+            self.generator_ready = True
+
+        # Return everything, don't create minibatches
+        if batch_size is None:
+            batch_size = n_transitions
+
+        start_idx = 0
+        while start_idx < n_transitions:
+            yield self._get_samples(indices[start_idx : start_idx + batch_size])
+            start_idx += batch_size
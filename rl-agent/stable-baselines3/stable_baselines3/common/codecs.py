@@ -0,0 +1,201 @@
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Sequence, Tuple, Union
+
+import numpy as np
+
+
+class Codec(ABC):
+    """
+    Base class of the encodings of a field of the ``CompressedReplayBuffer``.
+    A codec encodes a batch of values of shape (batch_size,) + shape into an array
+    of shape (batch_size,) + encoded_shape(shape) and dtype ``encoded_dtype``, and decodes it back.
+    """
+
+    encoded_dtype = np.uint8
+
+    @abstractmethod
+    def encoded_shape(self, shape: Tuple[int, ...]) -> Tuple[int, ...]:
+        """
+        :param shape: the shape of a value
+        :return: the shape of an encoded value
+        """
+        raise NotImplementedError()
+
+    @abstractmethod
+    def encode(self, array: np.ndarray, out: np.ndarray) -> None:
+        """
+        Encode a batch of values into ``out``, without an intermediate copy when possible.
+
+        :param array: the values, of shape (batch_size,) + shape
+        :param out: the encoded values, of shape (batch_size,) + encoded_shape(shape)
+        """
+        raise NotImplementedError()
+
+    @abstractmethod
+    def decode(self, encoded: np.ndarray, shape: Tuple[int, ...]) -> np.ndarray:
+        """
+        :param encoded: a batch of encoded values
+        :param shape: the shape of a value
+        :return: the decoded values, of shape (batch_size,) + shape
+        """
+        raise NotImplementedError()
+
+    def nbytes(self, shape: Tuple[int, ...]) -> int:
+        """
+        :param shape: the shape of a value
+        :return: the number of bytes of an encoded value
+        """
+        return int(np.prod(self.encoded_shape(shape))) * np.dtype(self.encoded_dtype).itemsize
+
+    def get_config(self) -> Dict[str, Any]:
+        """
+        :return: the class and the parameters of the codec, which can be saved as JSON,
+            e.g. to check that stored values are decoded by the codec that encoded them
+        """
+        config = {"class": type(self).__name__, "encoded_dtype": np.dtype(self.encoded_dtype).str}
+        for name, value in sorted(vars(self).items()):
+            config[name] = _as_json(value)
+        return config
+
+
+class IdentityCodec(Codec):
+    """
+    Stores the values as they are, in the given dtype.
+
+    :param dtype: the dtype of the stored values
+    """
+
+    def __init__(self, dtype: Union[np.dtype, type] = np.float32):
+        self.encoded_dtype = np.dtype(dtype)
+
+    def encoded_shape(self, shape: Tuple[int, ...]) -> Tuple[int, ...]:
+        return shape
+
+    def encode(self, array: np.ndarray, out: np.ndarray) -> None:
+        out[...] = array
+
+    def decode(self, encoded: np.ndarray, shape: Tuple[int, ...]) -> np.ndarray:
+        return encoded
+
+
+class QuantizeCodec(Codec):
+    """
+    Quantizes values bounded in [low, high] to 256 levels stored as uint8,
+    e.g. the planes of a map observation normalized to [0, 1]. The error is at most (high - low) / 510.
+
+    :param low: lower bound of the values, a scalar or an array broadcastable to their shape
+    :param high: upper bound of the values, a scalar or an array broadcastable to their shape
+    """
+
+    def __init__(self, low: Union[float, np.ndarray] = 0.0, high: Union[float, np.ndarray] = 1.0):
+        self.low = np.asarray(low, dtype=np.float32)
+        self.scale = np.asarray(high, dtype=np.float32) - self.low
+        assert (self.scale > 0).all(), "The upper bound must be greater than the lower bound"
+
+    def encoded_shape(self, shape: Tuple[int, ...]) -> Tuple[int, ...]:
+        return shape
+
+    def encode(self, array: np.ndarray, out: np.ndarray) -> None:
+        levels = (np.asarray(array, dtype=np.float32) - self.low) * (255 / self.scale)
+        np.rint(np.clip(levels, 0, 255, out=levels), out=levels)
+        out[...] = levels
+
+    def decode(self, encoded: np.ndarray, shape: Tuple[int, ...]) -> np.ndarray:
+        return encoded.astype(np.float32) * (self.scale / 255) + self.low
+
+
+class BitPackCodec(Codec):
+    """
+    Packs binary values eight per byte, e.g. the planes of a map observation marking the units or resources.
+    Any non-zero value is stored as 1, the values are decoded as float32.
+    """
+
+    def encoded_shape(self, shape: Tuple[int, ...]) -> Tuple[int, ...]:
+        return ((int(np.prod(shape)) + 7) // 8,)
+
+    def encode(self, array: np.ndarray, out: np.ndarray) -> None:
+        array = np.asarray(array)
+        out[...] = np.packbits(array.reshape(len(array), -1) != 0, axis=1)
+
+    def decode(self, encoded: np.ndarray, shape: Tuple[int, ...]) -> np.ndarray:
+        bits = np.unpackbits(encoded, axis=1, count=int(np.prod(shape)))
+        return bits.reshape((len(encoded),) + shape).astype(np.float32)
+
+
+class ChannelCodec(Codec):
+    """
+    Encodes groups of channels (indices of the first axis of a value) with different codecs,
+    e.g. bit-packing for the binary planes of a map observation and quantization for the others.
+    The encodings of the groups are stored side by side as bytes.
+
+    :param codecs: the codec of each group of channels, by channel indices. The groups must cover all the channels.
+    """
+
+    def __init__(self, codecs: Dict[Sequence[int], Codec]):
+        groups = [(np.asarray(channels, dtype=np.int64), codec) for channels, codec in codecs.items()]
+        channels = np.sort(np.concatenate([channels for channels, _ in groups]))
+        assert (channels == np.arange(len(channels))).all(), "Each channel must be in exactly one group"
+        self.n_channels = len(channels)
+        # consecutive channels are indexed by a slice, which avoids a copy when encoding
+        self.codecs = [(_as_slice(channels), len(channels), codec) for channels, codec in groups]
+
+    def _group_shapes(self, shape: Tuple[int, ...]):
+        assert shape[0] == self.n_channels, "The groups must cover all the channels"
+        for channels, n_channels, codec in self.codecs:
+            yield channels, codec, (n_channels,) + tuple(shape[1:])
+
+    def encoded_shape(self, shape: Tuple[int, ...]) -> Tuple[int, ...]:
+        return (sum(codec.nbytes(group_shape) for _, codec, group_shape in self._group_shapes(shape)),)
+
+    def encode(self, array: np.ndarray, out: np.ndarray) -> None:
+        array = np.asarray(array)
+        start = 0
+        for channels, codec, group_shape in self._group_shapes(array.shape[1:]):
+            end = start + codec.nbytes(group_shape)
+            encoded_shape = (len(array),) + codec.encoded_shape(group_shape)
+            if np.dtype(codec.encoded_dtype) == np.uint8:
+                # the bytes of the group are encoded in place
+                codec.encode(array[:, channels], out[:, start:end].reshape(encoded_shape))
+            else:
+                encoded = np.empty(encoded_shape, dtype=codec.encoded_dtype)
+                codec.encode(array[:, channels], encoded)
+                out[:, start:end] = encoded.reshape(len(array), -1).view(np.uint8)
+            start = end
+
+    def decode(self, encoded: np.ndarray, shape: Tuple[int, ...]) -> np.ndarray:
+        decoded = np.empty((len(encoded),) + tuple(shape), dtype=np.float32)
+        start = 0
+        for channels, codec, group_shape in self._group_shapes(shape):
+            end = start + codec.nbytes(group_shape)
+            group = np.ascontiguousarray(encoded[:, start:end]).view(codec.encoded_dtype)
+            decoded[:, channels] = codec.decode(group.reshape((len(encoded),) + codec.encoded_shape(group_shape)), group_shape)
+            start = end
+        return decoded
+
+
+def _as_json(value: Any) -> Any:
+    """
+    :param value: a parameter of a codec
+    :return: the value as lists, numbers and strings
+    """
+    if isinstance(value, Codec):
+        return value.get_config()
+    if isinstance(value, np.dtype):
+        return value.str
+    if isinstance(value, slice):
+        return [value.start, value.stop]
+    if isinstance(value, (np.ndarray, np.generic)):
+        return value.tolist()
+    if isinstance(value, (list, tuple)):
+        return [_as_json(item) for item in value]
+    return value
+
+
+def _as_slice(indices: np.ndarray) -> Union[slice, np.ndarray]:
+    """
+    :param indices: channel indices
+    :return: the equivalent slice if the indices are consecutive and increasing, the indices otherwise
+    """
+    if len(indices) > 0 and (np.diff(indices) == 1).all():
+        return slice(int(indices[0]), int(indices[-1]) + 1)
+    return indices
@@ -645,6 +645,41 @@ class TanhBijector(object):
         return th.log(1.0 - th.tanh(x) ** 2 + self.epsilon)
 
 
+def categorical_log_probs(distribution: Union[CategoricalDistribution, MultiCategoricalDistribution]) -> th.Tensor:
+    """
+    Log probabilities of all the actions of a categorical distribution, concatenated over the sub-spaces
+    of a multi categorical distribution. They are normalized logits: ``proba_distribution()`` gives the distribution back.
+
+    :param distribution: a categorical or multi categorical distribution
+    :return: the log probabilities, of shape (batch_size, number of actions or sum of the sizes of the sub-spaces)
+    """
+    if isinstance(distribution, MultiCategoricalDistribution):
+        return th.cat([dist.logits for dist in distribution.distributions], dim=1)
+    return distribution.distribution.logits
+
+
+def kl_divergence(dist_true: Distribution, dist_pred: Distribution) -> th.Tensor:
+    """
+    KL divergence KL(dist_true || dist_pred) between two categorical or multi categorical distributions
+    of the same action space, computed at once from the log probabilities of all the actions,
+    and summed over the sub-spaces of multi categorical distributions.
+
+    :param dist_true: the p distribution
+    :param dist_pred: the q distribution
+    :return: the KL divergence of each sample of the batch
+    """
+    assert dist_true.__class__ == dist_pred.__class__, "The distributions must be of the same type"
+    assert isinstance(
+        dist_true, (CategoricalDistribution, MultiCategoricalDistribution)
+    ), "Only categorical and multi categorical distributions are supported"
+    log_p, log_q = categorical_log_probs(dist_true), categorical_log_probs(dist_pred)
+    assert log_p.shape == log_q.shape, "The distributions must have the same action space"
+    probs = log_p.exp()
+    # the actions of probability 0 do not contribute (0 * log(0) = 0), without NaN gradients
+    log_ratio = (log_p - log_q).masked_fill(probs == 0, 0.0)
+    return (probs * log_ratio).sum(dim=1)
+
+
 def make_proba_distribution(
     action_space: gym.spaces.Space, use_sde: bool = False, dist_kwargs: Optional[Dict[str, Any]] = None
 ) -> Distribution:
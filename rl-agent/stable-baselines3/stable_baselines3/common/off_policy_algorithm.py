@@ -47,6 +47,11 @@ class OffPolicyAlgorithm(BaseAlgorithm):
     :param optimize_memory_usage: Enable a memory efficient variant of the replay buffer
         at a cost of more complexity.
         See https://github.com/DLR-RM/stable-baselines3/issues/37#issuecomment-637501195
+    :param replay_buffer_class: Replay buffer class to use (e.g. ``CompressedReplayBuffer``),
+        ``ReplayBuffer`` by default
+    :param replay_buffer_kwargs: Keyword arguments to pass to the replay buffer on creation
+    :param n_steps: number of steps of the returns of the TD targets, computed by the replay buffer
+        when sampled, the TD targets are 1-step by default
     :param policy_kwargs: Additional arguments to be passed to the policy on creation
     :param tensorboard_log: the log location for tensorboard (if None, no logging)
     :param verbose: The verbosity level: 0 none, 1 training information, 2 debug
@@ -87,6 +92,9 @@ class OffPolicyAlgorithm(BaseAlgorithm):
         n_episodes_rollout: int = -1,
         action_noise: Optional[ActionNoise] = None,
         optimize_memory_usage: bool = False,
+        replay_buffer_class: Optional[Type[ReplayBuffer]] = None,
+        replay_buffer_kwargs: Optional[Dict[str, Any]] = None,
+        n_steps: int = 1,
         policy_kwargs: Dict[str, Any] = None,
         tensorboard_log: Optional[str] = None,
         verbose: int = 0,
@@ -128,6 +136,9 @@ class OffPolicyAlgorithm(BaseAlgorithm):
         self.n_episodes_rollout = n_episodes_rollout
         self.action_noise = action_noise
         self.optimize_memory_usage = optimize_memory_usage
+        self.replay_buffer_class = ReplayBuffer if replay_buffer_class is None else replay_buffer_class
+        self.replay_buffer_kwargs = {} if replay_buffer_kwargs is None else replay_buffer_kwargs
+        self.n_steps = n_steps
 
         # Remove terminations (dones) that are due to time limit
         # see https://github.com/hill-a/stable-baselines/issues/863
@@ -154,12 +165,17 @@ class OffPolicyAlgorithm(BaseAlgorithm):
     def _setup_model(self) -> None:
         self._setup_lr_schedule()
         self.set_random_seed(self.seed)
-        self.replay_buffer = ReplayBuffer(
+        replay_buffer_kwargs = dict(self.replay_buffer_kwargs)
+        replay_buffer_kwargs.setdefault("optimize_memory_usage", self.optimize_memory_usage)
+        # the replay buffer computes the n-step returns and their discounts
+        replay_buffer_kwargs.setdefault("n_steps", self.n_steps)
+        replay_buffer_kwargs.setdefault("gamma", self.gamma)
+        self.replay_buffer = self.replay_buffer_class(
             self.buffer_size,
             self.observation_space,
             self.action_space,
             self.device,
-            optimize_memory_usage=self.optimize_memory_usage,
+            **replay_buffer_kwargs,
         )
         self.policy = self.policy_class(
             self.observation_space,
@@ -172,6 +188,7 @@ class OffPolicyAlgorithm(BaseAlgorithm):
     def save_replay_buffer(self, path: Union[str, pathlib.Path, io.BufferedIOBase]) -> None:
         """
         Save the replay buffer as a pickle file.
+        A ``MemmapReplayBuffer`` is flushed to its files, and only its path and position are pickled.
 
         :param path: Path to the file where the replay buffer should be saved.
             if path is a str or pathlib.Path, the path is automatically created if necessary.
@@ -182,6 +199,7 @@ class OffPolicyAlgorithm(BaseAlgorithm):
     def load_replay_buffer(self, path: Union[str, pathlib.Path, io.BufferedIOBase]) -> None:
         """
         Load a replay buffer from a pickle file.
+        A ``MemmapReplayBuffer`` reopens its files, at the position of their last flush.
 
         :param path: Path to the pickled replay buffer.
         """
@@ -206,9 +224,9 @@ class OffPolicyAlgorithm(BaseAlgorithm):
         # when using memory efficient replay buffer
         # see https://github.com/DLR-RM/stable-baselines3/issues/46
         truncate_last_traj = (
-            self.optimize_memory_usage
+            self.replay_buffer is not None
+            and self.replay_buffer.optimize_memory_usage
             and reset_num_timesteps
-            and self.replay_buffer is not None
             and (self.replay_buffer.full or self.replay_buffer.pos > 0)
         )
 
@@ -8,12 +8,12 @@ import collections
 
 from stable_baselines3.common import logger
 from stable_baselines3.common.base_class import BaseAlgorithm
-from stable_baselines3.common.buffers import RolloutBuffer
+from stable_baselines3.common.buffers import DeviceRolloutBuffer, RolloutBuffer
 from stable_baselines3.common.callbacks import BaseCallback
 from stable_baselines3.common.policies import ActorCriticPolicy
 from stable_baselines3.common.type_aliases import GymEnv, MaybeCallback
-from stable_baselines3.common.utils import safe_mean
-from stable_baselines3.common.vec_env import VecEnv
+from stable_baselines3.common.utils import DeviceTransfer, safe_mean
+from stable_baselines3.common.vec_env import AsyncVecEnv, VecEnv
 
 
 class OnPolicyAlgorithm(BaseAlgorithm):
@@ -99,6 +99,8 @@ class OnPolicyAlgorithm(BaseAlgorithm):
         self.vf_coef = vf_coef
         self.max_grad_norm = max_grad_norm
         self.rollout_buffer = None
+        # copies the observations of the envs to the device at each step
+        self.obs_transfer = None
 
         # Add customized datastructure to keep track of average rewards (last 100 games)
         self.scores = collections.deque([], maxlen=100)
@@ -131,7 +133,8 @@ class OnPolicyAlgorithm(BaseAlgorithm):
         self._setup_lr_schedule()
         self.set_random_seed(self.seed)
 
-        self.rollout_buffer = RolloutBuffer(
+        # the rollout is kept on the training device, and its GAE computed there
+        self.rollout_buffer = DeviceRolloutBuffer(
             self.n_steps,
             self.observation_space,
             self.action_space,
@@ -140,6 +143,8 @@ class OnPolicyAlgorithm(BaseAlgorithm):
             gae_lambda=self.gae_lambda,
             n_envs=self.n_envs,
         )
+        obs_batch_shape = (self.n_envs,) + self.observation_space.shape
+        self.obs_transfer = DeviceTransfer(obs_batch_shape, self.observation_space.dtype, self.device)
 
         # By Default OnPolicyAlgorithm uses "ActorCriticPolicy" as policy_class
         self.policy = self.policy_class(
@@ -191,6 +196,9 @@ class OnPolicyAlgorithm(BaseAlgorithm):
         :return: True if function returned with at least `n_rollout_steps`
             collected, False if callback terminated rollout prematurely.
         """
+        if isinstance(env, AsyncVecEnv) and env.batch_size < env.num_envs:
+            return self._collect_rollouts_async(env, callback, rollout_buffer, n_rollout_steps)
+
         assert self._last_obs is not None, "No previous observation was provided"
         n_steps = 0
         rollout_buffer.reset()
@@ -207,7 +215,7 @@ class OnPolicyAlgorithm(BaseAlgorithm):
 
             with th.no_grad():
                 # Convert to pytorch tensor
-                obs_tensor = th.as_tensor(self._last_obs).to(self.device)
+                obs_tensor = self.obs_transfer(self._last_obs)
                 actions, values, log_probs = self.policy.forward(obs_tensor)
             actions = actions.cpu().numpy()
 
@@ -220,21 +228,7 @@ class OnPolicyAlgorithm(BaseAlgorithm):
             new_obs, rewards, dones, infos = env.step(clipped_actions)
 
             if dones[0]:
-                for info in infos:
-                    goal_diff = info['l_score'] - info['r_score']
-                    print(f"Rewards: {goal_diff} | Score: [{info['l_score']} : {info['r_score']}]")
-                    self.scores.append(goal_diff)
-
-                avg_score = sum(self.scores) / len(self.scores)
-                print(f"Average Reward: {avg_score}")
-                print("")
-
-                if avg_score > self.best_score:
-                    self.best_score = avg_score
-                    self.save_best_model = True
-
-                if self.log_handler is not None:
-                    self.log_handler.log({"Average Reward": avg_score})
+                self._record_scores(infos)
 
             self.num_timesteps += env.num_envs
 
@@ -249,13 +243,15 @@ class OnPolicyAlgorithm(BaseAlgorithm):
             if isinstance(self.action_space, gym.spaces.Discrete):
                 # Reshape in case of discrete action
                 actions = actions.reshape(-1, 1)
-            rollout_buffer.add(self._last_obs, actions, rewards, self._last_dones, values, log_probs)
+            # a DeviceRolloutBuffer copies the observations from the tensor already on the device
+            obs = obs_tensor if isinstance(rollout_buffer, DeviceRolloutBuffer) else self._last_obs
+            rollout_buffer.add(obs, actions, rewards, self._last_dones, values, log_probs)
             self._last_obs = new_obs
             self._last_dones = dones
 
         with th.no_grad():
             # Compute value for the last timestep
-            obs_tensor = th.as_tensor(new_obs).to(self.device)
+            obs_tensor = self.obs_transfer(new_obs)
             _, values, _ = self.policy.forward(obs_tensor)
 
         rollout_buffer.compute_returns_and_advantage(last_values=values, dones=dones)
@@ -264,6 +260,124 @@ class OnPolicyAlgorithm(BaseAlgorithm):
 
         return True
 
+    def _collect_rollouts_async(
+        self, env: AsyncVecEnv, callback: BaseCallback, rollout_buffer: RolloutBuffer, n_rollout_steps: int
+    ) -> bool:
+        """
+        Collect experiences as ``collect_rollouts``, stepping the envs of an ``AsyncVecEnv`` independently:
+        the policy acts for the first ``env.batch_size`` envs to finish their step, and each env fills its own
+        column of the ``RolloutBuffer``. An env whose column is full waits for the next rollout.
+
+        :param env: The training environment
+        :param callback: Callback that will be called at each step
+            (and at the beginning and end of the rollout)
+        :param rollout_buffer: Buffer to fill with rollouts
+        :param n_steps: Number of experiences to collect per environment
+        :return: True if function returned with at least `n_rollout_steps`
+            collected, False if callback terminated rollout prematurely.
+        """
+        assert self._last_obs is not None, "No previous observation was provided"
+        assert not self.use_sde, "gSDE is not supported with an AsyncVecEnv"
+        assert isinstance(
+            self.observation_space, gym.spaces.Box
+        ), "Only Box observation spaces are supported with an AsyncVecEnv"
+        assert rollout_buffer.buffer_size == n_rollout_steps, "Each env fills a column of the buffer"
+        rollout_buffer.reset()
+        # the last observation of each env is replaced when its step finishes
+        self._last_obs = np.array(self._last_obs)
+        self._last_dones = np.array(self._last_dones)
+        # action, value and log probability of each env in flight
+        pending = {}
+
+        callback.on_rollout_start()
+
+        env_ids = np.arange(env.num_envs)
+        while True:
+            env_ids = env_ids[rollout_buffer.env_pos[env_ids] < n_rollout_steps]
+            if len(env_ids) > 0:
+                with th.no_grad():
+                    # Convert to pytorch tensor
+                    obs_tensor = self.obs_transfer(self._last_obs[env_ids])
+                    actions, values, log_probs = self.policy.forward(obs_tensor)
+                actions = actions.cpu().numpy()
+
+                # Rescale and perform action
+                clipped_actions = actions
+                # Clip the actions to avoid out of bound error
+                if isinstance(self.action_space, gym.spaces.Box):
+                    clipped_actions = np.clip(actions, self.action_space.low, self.action_space.high)
+
+                env.send(clipped_actions, env_ids)
+                for i, env_id in enumerate(env_ids):
+                    pending[env_id] = (actions[i], values[i], log_probs[i])
+
+            if not env.in_flight.any():
+                break
+
+            new_obs, rewards, dones, infos, env_ids = env.recv()
+
+            if dones.any():
+                self._record_scores([info for info, done in zip(infos, dones) if done])
+
+            self.num_timesteps += len(env_ids)
+
+            # Give access to local variables
+            callback.update_locals(locals())
+            if callback.on_step() is False:
+                return False
+
+            self._update_info_buffer(infos)
+
+            actions, values, log_probs = zip(*[pending.pop(env_id) for env_id in env_ids])
+            actions = np.stack(actions)
+            if isinstance(self.action_space, gym.spaces.Discrete):
+                # Reshape in case of discrete action
+                actions = actions.reshape(-1, 1)
+            rollout_buffer.add(
+                self._last_obs[env_ids],
+                actions,
+                rewards,
+                self._last_dones[env_ids],
+                th.stack(values),
+                th.stack(log_probs),
+                env_ids=env_ids,
+            )
+            self._last_obs[env_ids] = new_obs
+            self._last_dones[env_ids] = dones
+
+        with th.no_grad():
+            # Compute value for the last timestep of each env
+            obs_tensor = self.obs_transfer(self._last_obs)
+            _, values, _ = self.policy.forward(obs_tensor)
+
+        rollout_buffer.compute_returns_and_advantage(last_values=values, dones=self._last_dones)
+
+        callback.on_rollout_end()
+
+        return True
+
+    def _record_scores(self, infos: List[Dict[str, Any]]) -> None:
+        """
+        Record the score of the episodes that ended, and whether the average score is the best so far.
+
+        :param infos: the infos of the last step of the episodes
+        """
+        for info in infos:
+            goal_diff = info['l_score'] - info['r_score']
+            print(f"Rewards: {goal_diff} | Score: [{info['l_score']} : {info['r_score']}]")
+            self.scores.append(goal_diff)
+
+        avg_score = sum(self.scores) / len(self.scores)
+        print(f"Average Reward: {avg_score}")
+        print("")
+
+        if avg_score > self.best_score:
+            self.best_score = avg_score
+            self.save_best_model = True
+
+        if self.log_handler is not None:
+            self.log_handler.log({"Average Reward": avg_score})
+
     def train(self) -> None:
         """
         Consume current rollout data and update policy parameters.
@@ -348,6 +462,9 @@ class OnPolicyAlgorithm(BaseAlgorithm):
 
         return self
 
+    def _excluded_save_params(self) -> List[str]:
+        return super(OnPolicyAlgorithm, self)._excluded_save_params() + ["obs_transfer"]
+
     def _get_torch_save_params(self) -> Tuple[List[str], List[str]]:
         state_dicts = ["policy", "policy.optimizer"]
 
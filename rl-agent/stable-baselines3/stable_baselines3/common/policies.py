@@ -617,11 +617,24 @@ class ActorCriticPolicy(BasePolicy):
         :return: estimated value, log likelihood of taking those actions
             and entropy of the action distribution.
         """
+        values, log_prob, distribution = self.evaluate_actions_distribution(obs, actions)
+        return values, log_prob, distribution.entropy()
+
+    def evaluate_actions_distribution(self, obs: th.Tensor, actions: th.Tensor) -> Tuple[th.Tensor, th.Tensor, Distribution]:
+        """
+        Evaluate actions as ``evaluate_actions``, but return the action distribution
+        instead of its entropy, e.g. to compare it with the distribution of another policy.
+
+        :param obs:
+        :param actions:
+        :return: estimated value, log likelihood of taking those actions
+            and the action distribution.
+        """
         latent_pi, latent_vf, latent_sde = self._get_latent(obs)
         distribution = self._get_action_dist_from_latent(latent_pi, latent_sde)
         log_prob = distribution.log_prob(actions)
         values = self.value_net(latent_vf)
-        return values, log_prob, distribution.entropy()
+        return values, log_prob, distribution
 
     def get_distribution(self, obs: th.Tensor) -> th.Tensor:
         """
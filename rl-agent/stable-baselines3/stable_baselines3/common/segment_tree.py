@@ -0,0 +1,93 @@
+from typing import Callable, Union
+
+import numpy as np
+
+
+class SegmentTree(object):
+    """
+    Segment tree stored in an array, for the priorities of the ``PrioritizedReplayBuffer``.
+    The leaves hold the values, each node the reduction of its two children, and the root the reduction of all.
+    The values are set and queried by batches of indices: a batch updates the nodes level by level,
+    in ``log2(capacity)`` vectorized operations.
+
+    :param capacity: number of values, rounded up to a power of two
+    :param operation: the reduction of two arrays of values, e.g. ``np.add``
+    :param neutral_element: the neutral element of the operation, e.g. 0 for the sum
+    """
+
+    def __init__(self, capacity: int, operation: Callable[[np.ndarray, np.ndarray], np.ndarray], neutral_element: float):
+        assert capacity > 0, "The capacity must be positive"
+        self.capacity = 1 << int(np.ceil(np.log2(capacity)))
+        self.operation = operation
+        # the root is at index 1, the children of node i at 2i and 2i + 1, the leaves at capacity + index
+        self._values = np.full(2 * self.capacity, neutral_element, dtype=np.float64)
+
+    def reduce(self) -> float:
+        """
+        :return: the reduction of all the values
+        """
+        return float(self._values[1])
+
+    def __setitem__(self, indices: Union[int, np.ndarray], values: Union[float, np.ndarray]) -> None:
+        nodes = np.asarray(indices, dtype=np.int64).reshape(-1) + self.capacity
+        self._values[nodes] = values
+        # the ancestors of the leaves, level by level up to the root
+        nodes = np.unique(nodes // 2)
+        while nodes[0] >= 1:
+            self._values[nodes] = self.operation(self._values[2 * nodes], self._values[2 * nodes + 1])
+            nodes = np.unique(nodes // 2)
+
+    def __getitem__(self, indices: Union[int, np.ndarray]) -> np.ndarray:
+        return self._values[np.asarray(indices, dtype=np.int64) + self.capacity]
+
+
+class SumSegmentTree(SegmentTree):
+    """
+    Segment tree of the sums of the values, to sample indices in proportion to their values.
+
+    :param capacity: number of values, rounded up to a power of two
+    """
+
+    def __init__(self, capacity: int):
+        super(SumSegmentTree, self).__init__(capacity, np.add, 0.0)
+
+    def sum(self) -> float:
+        """
+        :return: the sum of all the values
+        """
+        return self.reduce()
+
+    def find_prefixsum_idx(self, prefixsums: np.ndarray) -> np.ndarray:
+        """
+        Find, for each prefix sum, the highest index such that the sum of the values before it is at most the prefix sum.
+        With prefix sums drawn uniformly in [0, sum()), the indices are drawn in proportion to their values.
+
+        :param prefixsums: a batch of prefix sums
+        :return: the index of each prefix sum
+        """
+        prefixsums = np.array(prefixsums, dtype=np.float64)
+        nodes = np.ones(len(prefixsums), dtype=np.int64)
+        # descend the tree from the root, all the nodes of the batch at once
+        while nodes[0] < self.capacity:
+            left_values = self._values[2 * nodes]
+            go_left = left_values > prefixsums
+            prefixsums = np.where(go_left, prefixsums, prefixsums - left_values)
+            nodes = np.where(go_left, 2 * nodes, 2 * nodes + 1)
+        return nodes - self.capacity
+
+
+class MinSegmentTree(SegmentTree):
+    """
+    Segment tree of the minimums of the values.
+
+    :param capacity: number of values, rounded up to a power of two
+    """
+
+    def __init__(self, capacity: int):
+        super(MinSegmentTree, self).__init__(capacity, np.minimum, float("inf"))
+
+    def min(self) -> float:
+        """
+        :return: the minimum of all the values
+        """
+        return self.reduce()
@@ -1,6 +1,6 @@
 """Common aliases for type hints"""
 
-from typing import Any, Callable, Dict, List, NamedTuple, Tuple, Union
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple, Union
 
 import gym
 import numpy as np
@@ -24,6 +24,8 @@ class RolloutBufferSamples(NamedTuple):
     old_log_prob: th.Tensor
     advantages: th.Tensor
     returns: th.Tensor
+    # the indices of the samples in the flattened rollout, to look up values computed once per rollout
+    indices: Optional[th.Tensor] = None
 
 
 class ReplayBufferSamples(NamedTuple):
@@ -32,6 +34,19 @@ class ReplayBufferSamples(NamedTuple):
     next_observations: th.Tensor
     dones: th.Tensor
     rewards: th.Tensor
+    # discount of the value of the next observations, for n-step returns (None for gamma)
+    discounts: Optional[th.Tensor] = None
+
+
+class PrioritizedReplayBufferSamples(NamedTuple):
+    observations: th.Tensor
+    actions: th.Tensor
+    next_observations: th.Tensor
+    dones: th.Tensor
+    rewards: th.Tensor
+    discounts: Optional[th.Tensor]
+    weights: th.Tensor
+    indices: np.ndarray
 
 
 class RolloutReturn(NamedTuple):
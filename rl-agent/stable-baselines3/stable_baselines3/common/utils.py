@@ -3,7 +3,7 @@ import os
 import random
 from collections import deque
 from itertools import zip_longest
-from typing import Callable, Iterable, Optional, Union
+from typing import Callable, Iterable, Optional, Tuple, Union
 
 import gym
 import numpy as np
@@ -53,6 +53,8 @@ def explained_variance(y_pred: np.ndarray, y_true: np.ndarray) -> np.ndarray:
     :param y_true: the expected value
     :return: explained variance of ypred and y
     """
+    if isinstance(y_pred, th.Tensor):
+        y_pred, y_true = y_pred.cpu().numpy(), y_true.cpu().numpy()
     assert y_true.ndim == 1 and y_pred.ndim == 1
     var_y = np.var(y_true)
     return np.nan if var_y == 0 else 1 - np.var(y_true - y_pred) / var_y
@@ -317,3 +319,57 @@ def polyak_update(params: Iterable[th.nn.Parameter], target_params: Iterable[th.
         for param, target_param in zip_strict(params, target_params):
             target_param.data.mul_(1 - tau)
             th.add(target_param.data, param.data, alpha=tau, out=target_param.data)
+
+
+def to_device(array: np.ndarray, device: th.device) -> th.Tensor:
+    """
+    Copy a NumPy array to the device in one transfer.
+    On a CUDA device, the array goes through pinned memory and the copy is non-blocking,
+    on CPU the tensor shares the memory of the array.
+
+    :param array: the array to copy
+    :param device: PyTorch device
+    :return: the tensor on the device
+    """
+    tensor = th.from_numpy(np.ascontiguousarray(array))
+    if device.type != "cuda":
+        return tensor.to(device)
+    return tensor.pin_memory().to(device, non_blocking=True)
+
+
+class DeviceTransfer:
+    """
+    Copies batches of NumPy arrays of a fixed shape to the device without allocating at each call.
+    The arrays are written to a pinned host staging buffer, then copied with a non-blocking copy into
+    a persistent device buffer. On CPU, the tensor returned shares the memory of the array instead.
+
+    The tensor returned is overwritten by the next call, it must be copied to be kept longer.
+
+    :param shape: the shape of the largest batch, the first dimension is the batch
+    :param dtype: the NumPy dtype of the arrays
+    :param device: PyTorch device
+    """
+
+    def __init__(self, shape: Tuple[int, ...], dtype: np.dtype, device: Union[th.device, str] = "auto"):
+        self.device = get_device(device)
+        self.use_staging = self.device.type == "cuda"
+        if self.use_staging:
+            self.host_buffer = th.from_numpy(np.zeros(shape, dtype=dtype)).pin_memory()
+            self.host_array = self.host_buffer.numpy()
+            self.device_buffer = th.empty_like(self.host_buffer, device=self.device)
+            # recorded after each copy, so that the staging buffer is not overwritten during a copy
+            self.copied = th.cuda.Event()
+
+    def __call__(self, array: np.ndarray) -> th.Tensor:
+        """
+        :param array: a batch, of at most the shape given at creation
+        :return: the batch on the device
+        """
+        if not self.use_staging:
+            return th.as_tensor(array).to(self.device)
+        n_batch = len(array)
+        self.copied.synchronize()
+        self.host_array[:n_batch] = array
+        self.device_buffer[:n_batch].copy_(self.host_buffer[:n_batch], non_blocking=True)
+        self.copied.record()
+        return self.device_buffer[:n_batch]
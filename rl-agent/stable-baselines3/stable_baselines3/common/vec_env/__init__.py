@@ -3,8 +3,11 @@ import typing
 from copy import deepcopy
 from typing import Optional, Type, Union
 
+from stable_baselines3.common.vec_env.async_vec_env import AsyncVecEnv
 from stable_baselines3.common.vec_env.base_vec_env import CloudpickleWrapper, VecEnv, VecEnvWrapper
 from stable_baselines3.common.vec_env.dummy_vec_env import DummyVecEnv
+from stable_baselines3.common.vec_env.grouped_subproc_vec_env import GroupedSubprocVecEnv
+from stable_baselines3.common.vec_env.shmem_vec_env import ShmemVecEnv
 from stable_baselines3.common.vec_env.subproc_vec_env import SubprocVecEnv
 from stable_baselines3.common.vec_env.vec_check_nan import VecCheckNan
 from stable_baselines3.common.vec_env.vec_frame_stack import VecFrameStack
@@ -0,0 +1,89 @@
+from multiprocessing.connection import wait
+from typing import Callable, List, Optional, Tuple
+
+import gym
+import numpy as np
+
+from stable_baselines3.common.vec_env.base_vec_env import VecEnvObs
+from stable_baselines3.common.vec_env.subproc_vec_env import SubprocVecEnv, _flatten_obs
+
+
+class AsyncVecEnv(SubprocVecEnv):
+    """
+    Creates a multiprocess vectorized wrapper that keeps the environments in flight independently,
+    in the style of EnvPool: ``send()`` steps a subset of the environments, and ``recv()`` returns the results
+    of the first ``batch_size`` environments to finish, with their ids. When the duration of a step varies
+    between the environments, the slowest ones no longer hold back the others.
+
+    The synchronous ``step()`` of ``VecEnv`` is still available when no environment is in flight.
+    ``OnPolicyAlgorithm.collect_rollouts`` uses ``send()`` and ``recv()`` when given an ``AsyncVecEnv``.
+
+    :param env_fns: Environments to run in subprocesses
+    :param batch_size: number of environments whose results are returned by ``recv()``,
+        defaults to all the environments
+    :param start_method: method used to start the subprocesses.
+           Must be one of the methods returned by multiprocessing.get_all_start_methods().
+           Defaults to 'forkserver' on available platforms, and 'spawn' otherwise.
+    """
+
+    def __init__(
+        self, env_fns: List[Callable[[], gym.Env]], batch_size: Optional[int] = None, start_method: Optional[str] = None
+    ):
+        super(AsyncVecEnv, self).__init__(env_fns, start_method)
+        self.batch_size = self.num_envs if batch_size is None else batch_size
+        assert 0 < self.batch_size <= self.num_envs, "The batch size must be between 1 and the number of environments"
+        self.in_flight = np.zeros(self.num_envs, dtype=bool)
+
+    def send(self, actions: np.ndarray, env_ids: np.ndarray) -> None:
+        """
+        Step the given environments, which must not be in flight.
+
+        :param actions: the action of each environment
+        :param env_ids: the ids of the environments
+        """
+        assert not self.in_flight[env_ids].any(), "An environment is already in flight"
+        for action, env_id in zip(actions, env_ids):
+            self.remotes[env_id].send(("step", action))
+        self.in_flight[env_ids] = True
+        self.waiting = True
+
+    def recv(self) -> Tuple[VecEnvObs, np.ndarray, np.ndarray, List[dict], np.ndarray]:
+        """
+        Wait for the first ``batch_size`` environments in flight to finish their step,
+        or for all of them if fewer are in flight.
+
+        :return: observations, rewards, dones, infos and ids of these environments, in the order they finished
+        """
+        remotes = {self.remotes[env_id]: env_id for env_id in np.flatnonzero(self.in_flight)}
+        n_ready = min(self.batch_size, len(remotes))
+        env_ids, results = [], []
+        while len(env_ids) < n_ready:
+            for remote in wait(list(remotes))[: n_ready - len(env_ids)]:
+                env_ids.append(remotes.pop(remote))
+                results.append(remote.recv())
+        self.in_flight[env_ids] = False
+        self.waiting = bool(self.in_flight.any())
+        obs, rews, dones, infos = zip(*results)
+        return _flatten_obs(obs, self.observation_space), np.stack(rews), np.stack(dones), infos, np.array(env_ids)
+
+    def step_async(self, actions: np.ndarray) -> None:
+        self.send(actions, np.arange(self.num_envs))
+
+    def step_wait(self):
+        # the results of all the environments, in the order of their ids
+        in_flight = np.flatnonzero(self.in_flight)
+        results = [self.remotes[env_id].recv() for env_id in in_flight]
+        self.in_flight[:] = False
+        self.waiting = False
+        obs, rews, dones, infos = zip(*results)
+        return _flatten_obs(obs, self.observation_space), np.stack(rews), np.stack(dones), infos
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        # only the environments in flight have a result to collect
+        for env_id in np.flatnonzero(self.in_flight):
+            self.remotes[env_id].recv()
+        self.in_flight[:] = False
+        self.waiting = False
+        super(AsyncVecEnv, self).close()
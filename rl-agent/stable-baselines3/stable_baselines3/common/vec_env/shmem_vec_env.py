@@ -0,0 +1,201 @@
+import multiprocessing as mp
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+import gym
+import numpy as np
+
+from stable_baselines3.common.vec_env.base_vec_env import CloudpickleWrapper, VecEnv, VecEnvObs, VecEnvStepReturn
+from stable_baselines3.common.vec_env.subproc_vec_env import SubprocVecEnv
+from stable_baselines3.common.vec_env.util import dict_to_obs, obs_space_info
+
+# number of buffers the observations, rewards and dones are written to in turn,
+# so that the arrays returned by a step are still valid during the next one
+N_BUFFERS = 2
+
+
+def _buffer_views(
+    buffers: Dict[Any, Any], shapes: Dict[Any, tuple], dtypes: Dict[Any, np.dtype], n_envs: int
+) -> Dict[Any, np.ndarray]:
+    """
+    NumPy views of shared memory buffers, of shape (N_BUFFERS, n_envs) + shape.
+
+    :param buffers: shared memory buffers by observation key
+    :param shapes: the shape of the observation of one environment by key
+    :param dtypes: the dtype of the observation by key
+    :param n_envs: number of environments
+    :return: the views by key
+    """
+    return OrderedDict(
+        [
+            (key, np.frombuffer(buffer, dtype=dtypes[key]).reshape((N_BUFFERS, n_envs) + shapes[key]))
+            for key, buffer in buffers.items()
+        ]
+    )
+
+
+def _write_obs(obs_views: Dict[Any, np.ndarray], buffer_index: int, env_index: int, observation: Any) -> None:
+    """
+    Copy the observation of an environment into the shared memory buffers.
+
+    :param obs_views: the views of the observation buffers by key, see ``_buffer_views``
+    :param buffer_index: the buffer to write to
+    :param env_index: the index of the environment
+    :param observation: the observation, a NumPy array, or a dict or tuple of NumPy arrays
+    """
+    for key, view in obs_views.items():
+        view[buffer_index, env_index] = observation if key is None else observation[key]
+
+
+def _shmem_worker(
+    remote: mp.connection.Connection,
+    parent_remote: mp.connection.Connection,
+    env_fn_wrapper: CloudpickleWrapper,
+    env_index: int,
+    n_envs: int,
+    obs_buffers: Dict[Any, Any],
+    obs_shapes: Dict[Any, tuple],
+    obs_dtypes: Dict[Any, np.dtype],
+    reward_buffer: Any,
+    done_buffer: Any,
+) -> None:
+    parent_remote.close()
+    env = env_fn_wrapper.var()
+    obs_views = _buffer_views(obs_buffers, obs_shapes, obs_dtypes, n_envs)
+    rewards = np.frombuffer(reward_buffer, dtype=np.float32).reshape(N_BUFFERS, n_envs)
+    dones = np.frombuffer(done_buffer, dtype=np.bool_).reshape(N_BUFFERS, n_envs)
+    while True:
+        try:
+            cmd, data = remote.recv()
+            if cmd == "step":
+                action, buffer_index = data
+                observation, reward, done, info = env.step(action)
+                if done:
+                    # save final observation where user can get it, then reset
+                    info["terminal_observation"] = observation
+                    observation = env.reset()
+                _write_obs(obs_views, buffer_index, env_index, observation)
+                rewards[buffer_index, env_index] = reward
+                dones[buffer_index, env_index] = done
+                remote.send(info)
+            elif cmd == "seed":
+                remote.send(env.seed(data))
+            elif cmd == "reset":
+                _write_obs(obs_views, data, env_index, env.reset())
+                remote.send(None)
+            elif cmd == "render":
+                remote.send(env.render(data))
+            elif cmd == "close":
+                env.close()
+                remote.close()
+                break
+            elif cmd == "get_spaces":
+                remote.send((env.observation_space, env.action_space))
+            elif cmd == "env_method":
+                method = getattr(env, data[0])
+                remote.send(method(*data[1], **data[2]))
+            elif cmd == "get_attr":
+                remote.send(getattr(env, data))
+            elif cmd == "set_attr":
+                remote.send(setattr(env, data[0], data[1]))
+            else:
+                raise NotImplementedError(f"`{cmd}` is not implemented in the worker")
+        except EOFError:
+            break
+
+
+class ShmemVecEnv(SubprocVecEnv):
+    """
+    Like ``SubprocVecEnv``, but the workers write their observations, rewards and dones into shared memory
+    instead of sending them back through a pipe, so that only the actions, the infos and the commands
+    are pickled. This is faster when the observations are large, e.g. maps of a board game.
+
+    The observations, rewards and dones returned by ``reset()`` and ``step()`` are views of the shared memory,
+    written to two buffers in turn: they are overwritten by the next but one call to ``reset()`` or ``step()``
+    and must be copied to be kept longer. The terminal observations in the infos are still sent through the pipe.
+
+    :param env_fns: Environments to run in subprocesses
+    :param start_method: method used to start the subprocesses.
+           Must be one of the methods returned by multiprocessing.get_all_start_methods().
+           Defaults to 'forkserver' on available platforms, and 'spawn' otherwise.
+    """
+
+    def __init__(self, env_fns: List[Callable[[], gym.Env]], start_method: Optional[str] = None):
+        self.waiting = False
+        self.closed = False
+        n_envs = len(env_fns)
+
+        if start_method is None:
+            # Fork is not a thread safe method (see issue #217)
+            forkserver_available = "forkserver" in mp.get_all_start_methods()
+            start_method = "forkserver" if forkserver_available else "spawn"
+        ctx = mp.get_context(start_method)
+
+        # the spaces are needed to allocate the buffers before starting the workers
+        dummy_env = env_fns[0]()
+        observation_space, action_space = dummy_env.observation_space, dummy_env.action_space
+        dummy_env.close()
+        del dummy_env
+        VecEnv.__init__(self, n_envs, observation_space, action_space)
+
+        self.keys, shapes, dtypes = obs_space_info(observation_space)
+        obs_buffers = OrderedDict(
+            [
+                (key, ctx.RawArray("b", N_BUFFERS * n_envs * int(np.prod(shapes[key])) * np.dtype(dtypes[key]).itemsize))
+                for key in self.keys
+            ]
+        )
+        reward_buffer = ctx.RawArray("b", N_BUFFERS * n_envs * np.dtype(np.float32).itemsize)
+        done_buffer = ctx.RawArray("b", N_BUFFERS * n_envs * np.dtype(np.bool_).itemsize)
+        self.buf_obs = _buffer_views(obs_buffers, shapes, dtypes, n_envs)
+        self.buf_rews = np.frombuffer(reward_buffer, dtype=np.float32).reshape(N_BUFFERS, n_envs)
+        self.buf_dones = np.frombuffer(done_buffer, dtype=np.bool_).reshape(N_BUFFERS, n_envs)
+        self.buffer_index = 0
+
+        self.remotes, self.work_remotes = zip(*[ctx.Pipe() for _ in range(n_envs)])
+        self.processes = []
+        for env_index, (work_remote, remote, env_fn) in enumerate(zip(self.work_remotes, self.remotes, env_fns)):
+            args = (
+                work_remote,
+                remote,
+                CloudpickleWrapper(env_fn),
+                env_index,
+                n_envs,
+                obs_buffers,
+                shapes,
+                dtypes,
+                reward_buffer,
+                done_buffer,
+            )
+            # daemon=True: if the main process crashes, we should not cause things to hang
+            process = ctx.Process(target=_shmem_worker, args=args, daemon=True)  # pytype:disable=attribute-error
+            process.start()
+            self.processes.append(process)
+            work_remote.close()
+
+    def step_async(self, actions: np.ndarray) -> None:
+        for remote, action in zip(self.remotes, actions):
+            remote.send(("step", (action, self.buffer_index)))
+        self.waiting = True
+
+    def step_wait(self) -> VecEnvStepReturn:
+        infos = [remote.recv() for remote in self.remotes]
+        self.waiting = False
+        buffer_index = self._next_buffer()
+        return self._obs_from_buf(buffer_index), self.buf_rews[buffer_index], self.buf_dones[buffer_index], infos
+
+    def reset(self) -> VecEnvObs:
+        for remote in self.remotes:
+            remote.send(("reset", self.buffer_index))
+        for remote in self.remotes:
+            remote.recv()
+        return self._obs_from_buf(self._next_buffer())
+
+    def _next_buffer(self) -> int:
+        # the buffer that was just written, the next call writes to the other one
+        buffer_index = self.buffer_index
+        self.buffer_index = (self.buffer_index + 1) % N_BUFFERS
+        return buffer_index
+
+    def _obs_from_buf(self, buffer_index: int) -> VecEnvObs:
+        return dict_to_obs(self.observation_space, OrderedDict([(key, self.buf_obs[key][buffer_index]) for key in self.keys]))
@@ -5,6 +5,7 @@ import torch as th
 from torch.nn import functional as F
 
 from stable_baselines3.common import logger
+from stable_baselines3.common.buffers import PrioritizedReplayBuffer, ReplayBuffer
 from stable_baselines3.common.off_policy_algorithm import OffPolicyAlgorithm
 from stable_baselines3.common.type_aliases import GymEnv, MaybeCallback
 from stable_baselines3.common.utils import get_linear_fn, polyak_update
@@ -38,6 +39,12 @@ class DQN(OffPolicyAlgorithm):
     :param optimize_memory_usage: Enable a memory efficient variant of the replay buffer
         at a cost of more complexity.
         See https://github.com/DLR-RM/stable-baselines3/issues/37#issuecomment-637501195
+    :param replay_buffer_class: Replay buffer class to use (e.g. ``CompressedReplayBuffer``),
+        ``ReplayBuffer`` by default. With a ``PrioritizedReplayBuffer``, the loss is weighted by the
+        importance sampling weights and the priorities are updated with the TD errors.
+    :param replay_buffer_kwargs: Keyword arguments to pass to the replay buffer on creation
+    :param n_steps: number of steps of the returns of the TD targets, computed by the replay buffer
+        when sampled, the TD targets are 1-step by default
     :param target_update_interval: update the target network every ``target_update_interval``
         environment steps.
     :param exploration_fraction: fraction of entire training period over which the exploration rate is reduced
@@ -69,6 +76,9 @@ class DQN(OffPolicyAlgorithm):
         gradient_steps: int = 1,
         n_episodes_rollout: int = -1,
         optimize_memory_usage: bool = False,
+        replay_buffer_class: Optional[Type[ReplayBuffer]] = None,
+        replay_buffer_kwargs: Optional[Dict[str, Any]] = None,
+        n_steps: int = 1,
         target_update_interval: int = 10000,
         exploration_fraction: float = 0.1,
         exploration_initial_eps: float = 1.0,
@@ -105,6 +115,9 @@ class DQN(OffPolicyAlgorithm):
             seed=seed,
             sde_support=False,
             optimize_memory_usage=optimize_memory_usage,
+            replay_buffer_class=replay_buffer_class,
+            replay_buffer_kwargs=replay_buffer_kwargs,
+            n_steps=n_steps,
         )
 
         self.exploration_initial_eps = exploration_initial_eps
@@ -147,6 +160,10 @@ class DQN(OffPolicyAlgorithm):
         # Update learning rate according to schedule
         self._update_learning_rate(self.policy.optimizer)
 
+        prioritized = isinstance(self.replay_buffer, PrioritizedReplayBuffer)
+        if prioritized:
+            self.replay_buffer.update_beta(self._current_progress_remaining)
+
         losses = []
         for gradient_step in range(gradient_steps):
             # Sample replay buffer
@@ -159,8 +176,9 @@ class DQN(OffPolicyAlgorithm):
                 target_q, _ = target_q.max(dim=1)
                 # Avoid potential broadcast issue
                 target_q = target_q.reshape(-1, 1)
-                # 1-step TD target
-                target_q = replay_data.rewards + (1 - replay_data.dones) * self.gamma * target_q
+                # TD target, n-step when the replay buffer returns the discounts of the n-step returns
+                discounts = self.gamma if replay_data.discounts is None else replay_data.discounts
+                target_q = replay_data.rewards + (1 - replay_data.dones) * discounts * target_q
 
             # Get current Q estimates
             current_q = self.q_net(replay_data.observations)
@@ -169,7 +187,13 @@ class DQN(OffPolicyAlgorithm):
             current_q = th.gather(current_q, dim=1, index=replay_data.actions.long())
 
             # Compute Huber loss (less sensitive to outliers)
-            loss = F.smooth_l1_loss(current_q, target_q)
+            if prioritized:
+                # weighted by the importance sampling weights, which correct the bias of the prioritized sampling
+                loss = (replay_data.weights * F.smooth_l1_loss(current_q, target_q, reduction="none")).mean()
+                td_errors = (current_q - target_q).detach().cpu().numpy()
+                self.replay_buffer.update_priorities(replay_data.indices, td_errors)
+            else:
+                loss = F.smooth_l1_loss(current_q, target_q)
             losses.append(loss.item())
 
             # Optimize the policy
@@ -184,6 +208,8 @@ class DQN(OffPolicyAlgorithm):
 
         logger.record("train/n_updates", self._n_updates, exclude="tensorboard")
         logger.record("train/loss", np.mean(losses))
+        if prioritized:
+            logger.record("train/prioritized_replay_beta", self.replay_buffer.beta)
 
     def predict(
         self,
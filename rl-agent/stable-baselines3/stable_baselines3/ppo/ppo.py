@@ -6,6 +6,7 @@ from gym import spaces
 from torch.nn import functional as F
 
 from stable_baselines3.common import logger
+from stable_baselines3.common.distributions import categorical_log_probs, kl_divergence
 from stable_baselines3.common.on_policy_algorithm import OnPolicyAlgorithm
 from stable_baselines3.common.policies import ActorCriticPolicy
 from stable_baselines3.common.type_aliases import GymEnv, MaybeCallback
@@ -60,6 +61,10 @@ class PPO(OnPolicyAlgorithm):
     :param device: Device (cpu, cuda, ...) on which the code should be run.
         Setting it to auto, the code will be run on the GPU if possible.
     :param _init_setup_model: Whether or not to build the network at the creation of the instance
+    :param use_prierarchy_loss: Whether to replace the entropy bonus by a KL divergence to the pretrained
+        (expert) policy, for ``Discrete`` and ``MultiDiscrete`` action spaces
+    :param cache_expert_outputs: Whether to compute the action distribution of the expert policy
+        once per rollout instead of once per minibatch and epoch (only with ``use_prierarchy_loss``)
     """
 
     def __init__(
@@ -91,6 +96,7 @@ class PPO(OnPolicyAlgorithm):
         model_checkpoints_path = None,
         pretrained_model = None,
         use_prierarchy_loss = False,
+        cache_expert_outputs: bool = False,
     ):
 
         super(PPO, self).__init__(
@@ -123,6 +129,7 @@ class PPO(OnPolicyAlgorithm):
         self.clip_range = clip_range
         self.clip_range_vf = clip_range_vf
         self.target_kl = target_kl
+        self.cache_expert_outputs = cache_expert_outputs
 
         if _init_setup_model:
             self._setup_model()
@@ -138,6 +145,28 @@ class PPO(OnPolicyAlgorithm):
 
             self.clip_range_vf = get_schedule_fn(self.clip_range_vf)
 
+        if self.use_prierarchy_loss:
+            assert isinstance(
+                self.action_space, (spaces.Discrete, spaces.MultiDiscrete)
+            ), "The prierarchy loss requires a Discrete or MultiDiscrete action space"
+
+    def _expert_log_probs(self, batch_size: int) -> th.Tensor:
+        """
+        Log probabilities of all the actions of the expert policy on the observations of the rollout,
+        in the order of the flattened rollout, computed by minibatches.
+
+        :param batch_size: the number of observations per forward pass
+        :return: the log probabilities, indexed by ``RolloutBufferSamples.indices``
+        """
+        observations = self.rollout_buffer.device_tensors["observations"]
+        with th.no_grad():
+            return th.cat(
+                [
+                    categorical_log_probs(self.expert_policy.get_distribution(observations[start : start + batch_size]))
+                    for start in range(0, len(observations), batch_size)
+                ]
+            )
+
     def train(self) -> None:
         """
         Update policy using the currently gathered rollout buffer.
@@ -153,6 +182,8 @@ class PPO(OnPolicyAlgorithm):
         entropy_losses, all_kl_divs = [], []
         pg_losses, value_losses = [], []
         clip_fractions = []
+        # the expert outputs on the current rollout, computed at the first minibatch
+        expert_log_probs = None
 
         # train for n_epochs epochs
         for epoch in range(self.n_epochs):
@@ -170,7 +201,13 @@ class PPO(OnPolicyAlgorithm):
                 if self.use_sde:
                     self.policy.reset_noise(self.batch_size)
 
-                values, log_prob, entropy = self.policy.evaluate_actions(rollout_data.observations, actions)
+                if self.use_prierarchy_loss:
+                    # the distribution of the policy over all the actions, from the same forward pass
+                    values, log_prob, posterior_distribution = self.policy.evaluate_actions_distribution(
+                        rollout_data.observations, actions
+                    )
+                else:
+                    values, log_prob, entropy = self.policy.evaluate_actions(rollout_data.observations, actions)
                 values = values.flatten()
                 # Normalize advantage
                 advantages = rollout_data.advantages
@@ -206,14 +243,19 @@ class PPO(OnPolicyAlgorithm):
                 # Priecharcy Loss
                 if self.use_prierarchy_loss:
 
-                    # Get logproba of all actions (shape: [32, 19])
-                    posterior_distribution = self.policy.get_distribution(rollout_data.observations)
-                    prior_distribution = self.expert_policy.get_distribution(rollout_data.observations)
-
-                    log_posterior = th.stack([posterior_distribution.log_prob(th.tensor([action]).to(self.device)) for action in range(19)]).permute(1,0).contiguous()
-                    log_prior = th.stack([prior_distribution.log_prob(th.tensor([action]).to(self.device)) for action in range(19)]).permute(1,0).contiguous()
+                    # The expert is not trained: its forward pass builds no graph
+                    if self.cache_expert_outputs:
+                        if expert_log_probs is None:
+                            expert_log_probs = self._expert_log_probs(self.batch_size or len(rollout_data.observations))
+                        prior_distribution = self.expert_policy.action_dist.proba_distribution(
+                            expert_log_probs[rollout_data.indices]
+                        )
+                    else:
+                        with th.no_grad():
+                            prior_distribution = self.expert_policy.get_distribution(rollout_data.observations)
 
-                    kl_loss = th.sum(log_posterior.exp() * (log_posterior - log_prior), dim=-1).mean()
+                    # KL(posterior || prior) from the log probabilities of all the actions at once
+                    kl_loss = kl_divergence(posterior_distribution, prior_distribution).mean()
 
                     loss = policy_loss + 0.1 * kl_loss + self.vf_coef * value_loss
 
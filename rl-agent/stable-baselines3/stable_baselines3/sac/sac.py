@@ -5,6 +5,7 @@ import torch as th
 from torch.nn import functional as F
 
 from stable_baselines3.common import logger
+from stable_baselines3.common.buffers import ReplayBuffer
 from stable_baselines3.common.noise import ActionNoise
 from stable_baselines3.common.off_policy_algorithm import OffPolicyAlgorithm
 from stable_baselines3.common.type_aliases import GymEnv, MaybeCallback
@@ -48,6 +49,11 @@ class SAC(OffPolicyAlgorithm):
     :param optimize_memory_usage: Enable a memory efficient variant of the replay buffer
         at a cost of more complexity.
         See https://github.com/DLR-RM/stable-baselines3/issues/37#issuecomment-637501195
+    :param replay_buffer_class: Replay buffer class to use (e.g. ``CompressedReplayBuffer``),
+        ``ReplayBuffer`` by default
+    :param replay_buffer_kwargs: Keyword arguments to pass to the replay buffer on creation
+    :param n_steps: number of steps of the returns of the TD targets, computed by the replay buffer
+        when sampled, the TD targets are 1-step by default
     :param ent_coef: Entropy regularization coefficient. (Equivalent to
         inverse of reward scale in the original SAC paper.)  Controlling exploration/exploitation trade-off.
         Set it to 'auto' to learn it automatically (and 'auto_0.1' for using 0.1 as initial value)
@@ -85,6 +91,9 @@ class SAC(OffPolicyAlgorithm):
         n_episodes_rollout: int = -1,
         action_noise: Optional[ActionNoise] = None,
         optimize_memory_usage: bool = False,
+        replay_buffer_class: Optional[Type[ReplayBuffer]] = None,
+        replay_buffer_kwargs: Optional[Dict[str, Any]] = None,
+        n_steps: int = 1,
         ent_coef: Union[str, float] = "auto",
         target_update_interval: int = 1,
         target_entropy: Union[str, float] = "auto",
@@ -124,6 +133,9 @@ class SAC(OffPolicyAlgorithm):
             sde_sample_freq=sde_sample_freq,
             use_sde_at_warmup=use_sde_at_warmup,
             optimize_memory_usage=optimize_memory_usage,
+            replay_buffer_class=replay_buffer_class,
+            replay_buffer_kwargs=replay_buffer_kwargs,
+            n_steps=n_steps,
         )
 
         self.target_entropy = target_entropy
@@ -227,7 +239,9 @@ class SAC(OffPolicyAlgorithm):
                 # add entropy term
                 target_q = target_q - ent_coef * next_log_prob.reshape(-1, 1)
                 # td error + entropy term
-                q_backup = replay_data.rewards + (1 - replay_data.dones) * self.gamma * target_q
+                # the discounts of n-step returns when the replay buffer computes them
+                discounts = self.gamma if replay_data.discounts is None else replay_data.discounts
+                q_backup = replay_data.rewards + (1 - replay_data.dones) * discounts * target_q
 
             # Get current Q estimates for each critic network
             # using action from the replay buffer
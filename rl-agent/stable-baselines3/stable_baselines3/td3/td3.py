@@ -5,6 +5,7 @@ import torch as th
 from torch.nn import functional as F
 
 from stable_baselines3.common import logger
+from stable_baselines3.common.buffers import ReplayBuffer
 from stable_baselines3.common.noise import ActionNoise
 from stable_baselines3.common.off_policy_algorithm import OffPolicyAlgorithm
 from stable_baselines3.common.type_aliases import GymEnv, MaybeCallback
@@ -43,6 +44,11 @@ class TD3(OffPolicyAlgorithm):
     :param optimize_memory_usage: Enable a memory efficient variant of the replay buffer
         at a cost of more complexity.
         See https://github.com/DLR-RM/stable-baselines3/issues/37#issuecomment-637501195
+    :param replay_buffer_class: Replay buffer class to use (e.g. ``CompressedReplayBuffer``),
+        ``ReplayBuffer`` by default
+    :param replay_buffer_kwargs: Keyword arguments to pass to the replay buffer on creation
+    :param n_steps: number of steps of the returns of the TD targets, computed by the replay buffer
+        when sampled, the TD targets are 1-step by default
     :param policy_delay: Policy and target networks will only be updated once every policy_delay steps
         per training steps. The Q values will be updated policy_delay more often (update every training step).
     :param target_policy_noise: Standard deviation of Gaussian noise added to target policy
@@ -73,6 +79,9 @@ class TD3(OffPolicyAlgorithm):
         n_episodes_rollout: int = 1,
         action_noise: Optional[ActionNoise] = None,
         optimize_memory_usage: bool = False,
+        replay_buffer_class: Optional[Type[ReplayBuffer]] = None,
+        replay_buffer_kwargs: Optional[Dict[str, Any]] = None,
+        n_steps: int = 1,
         policy_delay: int = 2,
         target_policy_noise: float = 0.2,
         target_noise_clip: float = 0.5,
@@ -107,6 +116,9 @@ class TD3(OffPolicyAlgorithm):
             seed=seed,
             sde_support=False,
             optimize_memory_usage=optimize_memory_usage,
+            replay_buffer_class=replay_buffer_class,
+            replay_buffer_kwargs=replay_buffer_kwargs,
+            n_steps=n_steps,
         )
 
         self.policy_delay = policy_delay
@@ -147,7 +159,9 @@ class TD3(OffPolicyAlgorithm):
                 # Compute the target Q value: min over all critics targets
                 targets = th.cat(self.critic_target(replay_data.next_observations, next_actions), dim=1)
                 target_q, _ = th.min(targets, dim=1, keepdim=True)
-                target_q = replay_data.rewards + (1 - replay_data.dones) * self.gamma * target_q
+                # the discounts of n-step returns when the replay buffer computes them
+                discounts = self.gamma if replay_data.discounts is None else replay_data.discounts
+                target_q = replay_data.rewards + (1 - replay_data.dones) * discounts * target_q
 
             # Get current Q estimates for each critic network
             current_q_estimates = self.critic(replay_data.observations, replay_data.actions)
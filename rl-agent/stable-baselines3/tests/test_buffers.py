@@ -0,0 +1,387 @@
+import gym
+import numpy as np
+import pytest
+import torch as th
+
+from stable_baselines3 import DQN, SAC, TD3
+from stable_baselines3.common.buffers import (
+    CompressedReplayBuffer,
+    DeviceRolloutBuffer,
+    MemmapReplayBuffer,
+    PrioritizedReplayBuffer,
+    ReplayBuffer,
+    RolloutBuffer,
+)
+from stable_baselines3.common.codecs import BitPackCodec, ChannelCodec, IdentityCodec, QuantizeCodec
+from stable_baselines3.common.segment_tree import MinSegmentTree, SumSegmentTree
+from stable_baselines3.common.utils import DeviceTransfer
+
+
+def _map_observations(n_observations, rng):
+    """Observations of 4 binary planes and 2 planes of values in [0, 1]"""
+    observations = np.zeros((n_observations, 6, 5, 5), dtype=np.float32)
+    observations[:, :4] = rng.rand(n_observations, 4, 5, 5) < 0.2
+    observations[:, 4:] = rng.rand(n_observations, 2, 5, 5)
+    return observations
+
+
+@pytest.mark.parametrize(
+    "codec, atol",
+    [
+        (IdentityCodec(np.float32), 0),
+        (QuantizeCodec(0, 1), 1 / 510),
+        (ChannelCodec({range(4): BitPackCodec(), (4, 5): QuantizeCodec(0, 1)}), 1 / 510),
+    ],
+)
+def test_codecs(codec, atol):
+    observations = _map_observations(3, np.random.RandomState(0))
+    encoded = np.zeros((3,) + codec.encoded_shape((6, 5, 5)), dtype=codec.encoded_dtype)
+    codec.encode(observations, encoded)
+    assert np.allclose(codec.decode(encoded, (6, 5, 5)), observations, atol=atol + 1e-6)
+
+
+def test_bit_pack_codec():
+    codec = BitPackCodec()
+    assert codec.nbytes((4, 5, 5)) == 13
+    planes = np.random.RandomState(0).rand(2, 4, 5, 5) < 0.5
+    encoded = np.zeros((2, 13), dtype=np.uint8)
+    codec.encode(planes, encoded)
+    assert (codec.decode(encoded, (4, 5, 5)) == planes).all()
+
+
+@pytest.mark.parametrize("optimize_memory_usage", [False, True])
+def test_compressed_replay_buffer(optimize_memory_usage):
+    """Test that the compressed buffer samples the transitions of the replay buffer, in less memory"""
+    buffer_size, rng = 10, np.random.RandomState(0)
+    observation_space = gym.spaces.Box(0, 1, (6, 5, 5))
+    codec = ChannelCodec({range(4): BitPackCodec(), (4, 5): QuantizeCodec(0, 1)})
+    buffers = [
+        ReplayBuffer(buffer_size, observation_space, gym.spaces.Discrete(3), optimize_memory_usage=optimize_memory_usage),
+        CompressedReplayBuffer(
+            buffer_size,
+            observation_space,
+            gym.spaces.Discrete(3),
+            optimize_memory_usage=optimize_memory_usage,
+            codecs={"observations": codec},
+        ),
+    ]
+    observations = _map_observations(buffer_size + 5, rng)
+    for step in range(buffer_size + 4):
+        for buffer in buffers:
+            buffer.add(observations[step : step + 1], observations[step + 1 : step + 2], [[step % 3]], [step], [False])
+
+    expected, compressed = buffers
+    assert compressed.observations.nbytes * 4 < expected.observations.nbytes
+    batch_inds = np.arange(buffer_size)
+    if optimize_memory_usage:
+        # the transition at the current position is invalid
+        batch_inds = batch_inds[batch_inds != expected.pos]
+    for expected_values, values in zip(expected._get_samples(batch_inds), compressed._get_samples(batch_inds)):
+        if expected_values is None:
+            # no discounts of 1-step returns
+            assert values is None
+            continue
+        assert np.allclose(values.numpy(), expected_values.numpy(), atol=1 / 510 + 1e-6)
+
+
+def test_replay_buffer_class():
+    model = DQN(
+        "MlpPolicy",
+        "CartPole-v1",
+        learning_starts=10,
+        buffer_size=100,
+        replay_buffer_class=CompressedReplayBuffer,
+        replay_buffer_kwargs=dict(codecs={"observations": QuantizeCodec(-5, 5)}),
+    )
+    assert isinstance(model.replay_buffer, CompressedReplayBuffer)
+    assert model.replay_buffer.observations.dtype == np.uint8
+    _fill_replay_buffer(model, 20)
+    model.train(gradient_steps=2, batch_size=8)
+
+
+def _fill_replay_buffer(model, n_steps):
+    env = model.get_env()
+    obs = env.reset()
+    for _ in range(n_steps):
+        action = np.array([env.action_space.sample()])
+        new_obs, reward, done, _ = env.step(action)
+        model.replay_buffer.add(obs, new_obs, action, reward, done)
+        obs = new_obs
+
+
+def test_memmap_replay_buffer(tmp_path):
+    """Test that the memmap buffer samples as the replay buffer, in the order of the indices"""
+    observation_space = gym.spaces.Box(-1, 1, (3,))
+    buffers = [
+        ReplayBuffer(20, observation_space, gym.spaces.Discrete(3)),
+        MemmapReplayBuffer(20, observation_space, gym.spaces.Discrete(3), optimize_memory_usage=False, path=str(tmp_path)),
+    ]
+    rng = np.random.RandomState(0)
+    for step in range(25):
+        transition = (rng.rand(1, 3), rng.rand(1, 3), [[step % 3]], [step], [step % 7 == 0])
+        for buffer in buffers:
+            buffer.add(*transition)
+    assert isinstance(buffers[1].observations, np.memmap)
+    with pytest.raises(ValueError, match="path"):
+        MemmapReplayBuffer(20, observation_space, gym.spaces.Discrete(3))
+
+    batch_inds = rng.randint(20, size=16)
+    for expected_values, values in zip(buffers[0]._get_samples(batch_inds), buffers[1]._get_samples(batch_inds)):
+        assert (values is None and expected_values is None) or th.allclose(values, expected_values)
+
+
+def test_memmap_replay_buffer_resume(tmp_path):
+    """Test that a DQN resumes with the buffer of the files, at their last flush"""
+    kwargs = dict(
+        learning_starts=10,
+        buffer_size=10000,
+        replay_buffer_class=MemmapReplayBuffer,
+        replay_buffer_kwargs=dict(path=str(tmp_path / "buffer"), flush_freq=10),
+    )
+    model = DQN("MlpPolicy", "CartPole-v1", **kwargs)
+    assert not model.replay_buffer.resumed
+    _fill_replay_buffer(model, 25)
+    observations = np.array(model.replay_buffer.observations[:20])
+
+    # a new run does not train on the transitions of another one
+    with pytest.raises(ValueError, match="resume=True"):
+        DQN("MlpPolicy", "CartPole-v1", **kwargs)
+    # nor reads files of another configuration
+    for other_kwargs in [dict(optimize_memory_usage=True), dict(codecs={"observations": QuantizeCodec(-5, 5)})]:
+        replay_buffer_kwargs = dict(kwargs["replay_buffer_kwargs"], resume=True, **other_kwargs)
+        with pytest.raises(ValueError, match="different configuration"):
+            DQN("MlpPolicy", "CartPole-v1", **dict(kwargs, replay_buffer_kwargs=replay_buffer_kwargs))
+
+    # a crashed run lost the transitions after the last flush
+    kwargs["replay_buffer_kwargs"]["resume"] = True
+    resumed_model = DQN("MlpPolicy", "CartPole-v1", **kwargs)
+    assert resumed_model.replay_buffer.resumed
+    assert resumed_model.replay_buffer.pos == 20
+    assert np.allclose(resumed_model.replay_buffer.observations[:20], observations)
+    resumed_model.train(gradient_steps=2, batch_size=8)
+
+    # only the path and the position are pickled
+    model.save_replay_buffer(tmp_path / "replay_buffer.pkl")
+    assert (tmp_path / "replay_buffer.pkl").stat().st_size < model.replay_buffer.observations.nbytes
+    resumed_model.load_replay_buffer(tmp_path / "replay_buffer.pkl")
+    assert resumed_model.replay_buffer.pos == 25
+    assert np.allclose(resumed_model.replay_buffer.observations[:20], observations)
+
+
+def _n_step_return(buffer, ind, n_steps, gamma):
+    """The n-step return of a transition, step by step"""
+    ret, discount = 0.0, 1.0
+    for step in range(n_steps):
+        idx = (ind + step) % buffer.buffer_size
+        ret += discount * buffer.rewards[idx, 0]
+        discount *= gamma
+        if buffer.dones[idx, 0] or (idx + 1) % buffer.buffer_size == buffer.pos:
+            break
+    return ret, discount, idx
+
+
+@pytest.mark.parametrize("buffer_class", [ReplayBuffer, CompressedReplayBuffer, PrioritizedReplayBuffer])
+@pytest.mark.parametrize("n_added", [7, 30])
+def test_n_step_returns(buffer_class, n_added):
+    """Test the n-step returns across episode ends, the end of the circular buffer and its current position"""
+    buffer_size, n_steps, gamma = 12, 4, 0.9
+    kwargs = dict(optimize_memory_usage=False) if buffer_class is CompressedReplayBuffer else {}
+    buffer = buffer_class(
+        buffer_size, gym.spaces.Box(0, 100, (1,)), gym.spaces.Discrete(2), n_steps=n_steps, gamma=gamma, **kwargs
+    )
+    for step in range(n_added):
+        buffer.add(np.array([[step]]), np.array([[step + 1]]), [[0]], [step + 1], [step % 5 == 4])
+
+    batch_inds = np.arange(buffer.size())
+    samples = buffer._get_samples(batch_inds)
+    for i, ind in enumerate(batch_inds):
+        expected_return, expected_discount, last_ind = _n_step_return(buffer, ind, n_steps, gamma)
+        assert np.isclose(samples.rewards[i, 0].item(), expected_return, rtol=1e-5)
+        assert np.isclose(samples.discounts[i, 0].item(), expected_discount, rtol=1e-5)
+        assert samples.dones[i, 0].item() == buffer.dones[last_ind, 0]
+        # the next observation of the last step bootstraps the return
+        assert samples.next_observations[i, 0].item() == buffer.observations[last_ind, 0, 0] + 1
+
+
+def test_dqn_n_step_returns():
+    model = DQN("MlpPolicy", "CartPole-v1", learning_starts=10, buffer_size=100, n_steps=3)
+    assert model.replay_buffer.n_steps == 3
+    _fill_replay_buffer(model, 30)
+    assert model.replay_buffer.sample(8).discounts is not None
+    model.train(gradient_steps=2, batch_size=8)
+
+
+@pytest.mark.parametrize("model_class", [SAC, TD3])
+def test_continuous_n_step_returns(model_class):
+    model = model_class("MlpPolicy", "Pendulum-v1", learning_starts=10, buffer_size=100, gamma=0.9, n_steps=3)
+    assert model.replay_buffer.n_steps == 3
+    assert model.replay_buffer.gamma == 0.9
+    _fill_replay_buffer(model, 30)
+    assert model.replay_buffer.sample(8).discounts is not None
+    model.train(gradient_steps=2, batch_size=8)
+
+
+def test_segment_trees():
+    rng = np.random.RandomState(0)
+    values = np.zeros(13)
+    sum_tree, min_tree = SumSegmentTree(13), MinSegmentTree(13)
+    assert sum_tree.capacity == 16
+    for _ in range(5):
+        indices = rng.randint(13, size=4)
+        new_values = rng.rand(4)
+        values[indices] = new_values
+        sum_tree[indices] = new_values
+        min_tree[indices] = new_values
+        assert np.isclose(sum_tree.sum(), values.sum())
+        assert np.isclose(min_tree.min(), values[values > 0].min())
+        assert np.allclose(sum_tree[np.arange(13)], values)
+
+    # each prefix sum falls into the value of its index
+    prefixsums = rng.rand(100) * values.sum()
+    indices = sum_tree.find_prefixsum_idx(prefixsums)
+    cumsum = np.cumsum(values)
+    assert ((cumsum[indices] - values[indices] <= prefixsums) & (prefixsums < cumsum[indices])).all()
+
+
+def test_prioritized_replay_buffer():
+    buffer = PrioritizedReplayBuffer(8, gym.spaces.Box(-1, 1, (2,)), gym.spaces.Discrete(2), alpha=1.0, beta=0.5)
+    for step in range(6):
+        buffer.add(np.full((1, 2), step), np.zeros((1, 2)), [[0]], [step], [False])
+    # the new transitions have the same priority
+    samples = buffer.sample(6)
+    assert np.allclose(samples.weights.numpy(), 1)
+
+    buffer.update_priorities(np.arange(6), np.array([1.0, 1.0, 1.0, 1.0, 1.0, 5.0]))
+    assert buffer.max_priority > 5
+    batch_inds = buffer.sample(1000).indices
+    assert batch_inds.max() < 6
+    # half of the total priority is on the last transition
+    assert 0.45 < np.mean(batch_inds == 5) < 0.55
+    samples = buffer.sample(10)
+    assert np.allclose(samples.observations[:, 0].numpy(), samples.indices)
+    expected_weights = (buffer.sum_tree[samples.indices] / buffer.min_tree.min()) ** -0.5
+    assert np.allclose(samples.weights.numpy().flatten(), expected_weights)
+
+    buffer.update_beta(progress_remaining=0.0)
+    assert buffer.beta == 1.0
+
+
+def test_dqn_prioritized_replay(tmp_path):
+    model = DQN(
+        "MlpPolicy",
+        "CartPole-v1",
+        learning_starts=10,
+        buffer_size=100,
+        replay_buffer_class=PrioritizedReplayBuffer,
+        replay_buffer_kwargs=dict(alpha=0.6),
+    )
+    _fill_replay_buffer(model, 30)
+    model.train(gradient_steps=3, batch_size=8)
+    # the sampled transitions got the priorities of their TD errors
+    priorities = model.replay_buffer.sum_tree[np.arange(30)]
+    assert len(np.unique(priorities)) > 1
+
+    model.save_replay_buffer(tmp_path / "replay_buffer.pkl")
+    model.load_replay_buffer(tmp_path / "replay_buffer.pkl")
+    assert isinstance(model.replay_buffer, PrioritizedReplayBuffer)
+    assert np.allclose(model.replay_buffer.sum_tree[np.arange(30)], priorities)
+    model.train(gradient_steps=1, batch_size=8)
+
+
+@pytest.mark.parametrize("buffer_class", [RolloutBuffer, DeviceRolloutBuffer])
+def test_rollout_buffer_env_ids(buffer_class):
+    """Test that envs stepped independently each fill their own column"""
+    n_steps, n_envs = 4, 3
+    buffer = buffer_class(n_steps, gym.spaces.Box(-1, 1, (2,)), gym.spaces.Discrete(2), n_envs=n_envs)
+
+    # env 1 is twice as fast as the others
+    for env_ids in [[0, 1], [1, 2], [1, 0], [1, 2], [0, 2], [0, 2]]:
+        env_ids = np.array(env_ids)
+        assert not buffer.full
+        buffer.add(
+            np.stack([np.full(2, env_id) for env_id in env_ids]),
+            np.ones((len(env_ids), 1)),
+            env_ids.astype(np.float32),
+            np.zeros(len(env_ids)),
+            th.as_tensor(env_ids, dtype=th.float32).reshape(-1, 1),
+            th.zeros(len(env_ids)),
+            env_ids=env_ids,
+        )
+    assert buffer.full
+    assert list(buffer.env_pos) == [n_steps] * n_envs
+    for env_id in range(n_envs):
+        assert (buffer.observations[:, env_id] == env_id).all()
+        assert (buffer.rewards[:, env_id] == env_id).all()
+        assert (buffer.values[:, env_id] == env_id).all()
+
+    buffer.compute_returns_and_advantage(last_values=th.zeros(n_envs), dones=np.zeros(n_envs))
+    samples = next(buffer.get())
+    assert samples.observations.shape == (n_steps * n_envs, 2)
+
+
+def test_rollout_buffer_device_samples():
+    """Test that the minibatches are slices of the rollout uploaded once to the device"""
+    n_steps, n_envs = 8, 2
+    buffer = RolloutBuffer(n_steps, gym.spaces.Box(-1, 1, (3,)), gym.spaces.Discrete(2), n_envs=n_envs)
+    for step in range(n_steps):
+        buffer.add(
+            np.full((n_envs, 3), step),
+            np.zeros((n_envs, 1)),
+            np.ones(n_envs),
+            np.zeros(n_envs),
+            th.zeros(n_envs, 1),
+            th.zeros(n_envs),
+        )
+    buffer.compute_returns_and_advantage(last_values=th.zeros(n_envs), dones=np.zeros(n_envs))
+
+    observations = th.cat([samples.observations for samples in buffer.get(batch_size=4)])
+    assert observations.shape == (n_steps * n_envs, 3)
+    assert sorted(observations[:, 0].tolist()) == sorted(list(range(n_steps)) * n_envs)
+    assert set(buffer.device_tensors) == {"observations", "actions", "values", "log_probs", "advantages", "returns"}
+    assert all(tensor.device == th.device(buffer.device) for tensor in buffer.device_tensors.values())
+
+
+@pytest.mark.parametrize("n_steps", [1, 5, 16])
+def test_device_rollout_buffer_gae(n_steps):
+    """Test that the GAE of the reverse scan matches the loop of RolloutBuffer"""
+    n_envs = 3
+    rng = np.random.RandomState(n_steps)
+    buffers = [
+        buffer_class(n_steps, gym.spaces.Box(-1, 1, (2,)), gym.spaces.Discrete(2), gae_lambda=0.95, n_envs=n_envs)
+        for buffer_class in [RolloutBuffer, DeviceRolloutBuffer]
+    ]
+    for _ in range(n_steps):
+        transition = (
+            rng.rand(n_envs, 2).astype(np.float32),
+            rng.randint(2, size=(n_envs, 1)),
+            rng.rand(n_envs).astype(np.float32),
+            rng.rand(n_envs) < 0.3,
+            th.as_tensor(rng.rand(n_envs, 1), dtype=th.float32),
+            th.as_tensor(rng.rand(n_envs), dtype=th.float32),
+        )
+        for buffer in buffers:
+            buffer.add(*transition)
+    last_values, dones = th.as_tensor(rng.rand(n_envs), dtype=th.float32), rng.rand(n_envs) < 0.3
+    for buffer in buffers:
+        buffer.compute_returns_and_advantage(last_values=last_values, dones=dones)
+
+    expected, device_buffer = buffers
+    assert isinstance(device_buffer.advantages, th.Tensor)
+    assert np.allclose(device_buffer.advantages.cpu().numpy(), expected.advantages, atol=1e-5)
+    assert np.allclose(device_buffer.returns.cpu().numpy(), expected.returns, atol=1e-5)
+
+    samples = next(device_buffer.get())
+    assert samples.observations.shape == (n_steps * n_envs, 2)
+    assert np.isclose(samples.advantages.sum().item(), expected.advantages.sum(), atol=1e-4)
+
+
+@pytest.mark.parametrize("device", ["cpu", "cuda"])
+def test_device_transfer(device):
+    if device == "cuda" and not th.cuda.is_available():
+        pytest.skip("CUDA not available")
+    transfer = DeviceTransfer((4, 2, 3), np.float32, device)
+    for n_batch in [4, 2]:
+        array = np.random.rand(n_batch, 2, 3).astype(np.float32)
+        tensor = transfer(array)
+        assert tensor.device.type == device
+        assert np.allclose(tensor.cpu().numpy(), array)
@@ -1,3 +1,6 @@
+import itertools
+
+import gym
 import pytest
 import torch as th
 
@@ -10,7 +13,10 @@ from stable_baselines3.common.distributions import (
     SquashedDiagGaussianDistribution,
     StateDependentNoiseDistribution,
     TanhBijector,
+    kl_divergence,
 )
+from stable_baselines3.common.identity_env import IdentityEnvMultiDiscrete
+from stable_baselines3.common.policies import ActorCriticPolicy
 from stable_baselines3.common.utils import set_random_seed
 
 N_ACTIONS = 2
@@ -111,3 +117,80 @@ def test_categorical(dist, CAT_ACTIONS):
     entropy = dist.entropy()
     log_prob = dist.log_prob(actions)
     assert th.allclose(entropy.mean(), -log_prob.mean(), rtol=5e-3)
+
+
+@pytest.mark.parametrize("action_dims", [[19], [2, 3, 4]])
+def test_kl_divergence(action_dims):
+    """Test the KL divergence against a sum over all the (joint) actions"""
+
+    def make_distribution():
+        if len(action_dims) == 1:
+            return CategoricalDistribution(action_dims[0])
+        return MultiCategoricalDistribution(action_dims)
+
+    set_random_seed(1)
+    n_samples = 32
+    dist_true = make_distribution().proba_distribution(th.randn(n_samples, sum(action_dims)))
+    dist_pred = make_distribution().proba_distribution(th.randn(n_samples, sum(action_dims)))
+    kl = kl_divergence(dist_true, dist_pred)
+    assert kl.shape == (n_samples,)
+
+    expected = th.zeros(n_samples)
+    for action in itertools.product(*[range(action_dim) for action_dim in action_dims]):
+        actions = th.tensor([action] * n_samples)
+        if len(action_dims) == 1:
+            actions = actions.flatten()
+        log_p, log_q = dist_true.log_prob(actions), dist_pred.log_prob(actions)
+        expected += log_p.exp() * (log_p - log_q)
+    assert th.allclose(kl, expected, atol=1e-5)
+
+    # the actions of probability 0 do not contribute, and give no NaN gradient
+    logits = th.randn(n_samples, sum(action_dims))
+    logits[:, 0] = -float("inf")
+    pred_logits = th.randn(n_samples, sum(action_dims), requires_grad=True)
+    kl = kl_divergence(make_distribution().proba_distribution(logits), make_distribution().proba_distribution(pred_logits))
+    kl.sum().backward()
+    assert th.isfinite(kl).all() and th.isfinite(pred_logits.grad).all()
+
+
+@pytest.mark.parametrize("env_id", ["CartPole-v1", "MultiDiscrete"])
+@pytest.mark.parametrize("cache_expert_outputs", [False, True])
+def test_ppo_prierarchy_loss(tmp_path, env_id, cache_expert_outputs):
+    """Test the KL divergence to the expert, which starts as a copy of the policy"""
+    if env_id == "MultiDiscrete":
+        env = IdentityEnvMultiDiscrete(3)
+    else:
+        env = gym.make(env_id)
+    policy = ActorCriticPolicy(env.observation_space, env.action_space, lambda _: 3e-4)
+    th.save(policy.state_dict(), tmp_path / "policy.pt")
+    model = PPO(
+        "MlpPolicy",
+        env,
+        n_steps=16,
+        batch_size=8,
+        n_epochs=2,
+        pretrained_model=tmp_path / "policy.pt",
+        use_prierarchy_loss=True,
+        cache_expert_outputs=cache_expert_outputs,
+    )
+
+    vec_env = model.get_env()
+    obs = vec_env.reset()
+    for _ in range(model.n_steps):
+        obs_tensor = th.as_tensor(obs).float()
+        with th.no_grad():
+            actions, values, log_probs = model.policy.forward(obs_tensor)
+        new_obs, rewards, dones, _ = vec_env.step(actions.numpy())
+        model.rollout_buffer.add(obs, actions.numpy(), rewards, dones, values, log_probs)
+        obs = new_obs
+    model.rollout_buffer.compute_returns_and_advantage(last_values=values, dones=dones)
+
+    rollout_data = next(model.rollout_buffer.get())
+    _, _, distribution = model.policy.evaluate_actions_distribution(rollout_data.observations, rollout_data.actions)
+    expert_distribution = model.expert_policy.get_distribution(rollout_data.observations)
+    assert th.allclose(kl_divergence(distribution, expert_distribution), th.zeros(model.n_steps), atol=1e-6)
+
+    params = [param.clone() for param in model.policy.parameters()]
+    model.train()
+    assert any(not th.allclose(param, new_param) for param, new_param in zip(params, model.policy.parameters()))
+    assert all(param.grad is None for param in model.expert_policy.parameters())
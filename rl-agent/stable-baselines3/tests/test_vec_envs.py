@@ -2,15 +2,35 @@ import collections
 import functools
 import itertools
 import multiprocessing
+import time
 
 import gym
 import numpy as np
 import pytest
-
-from stable_baselines3.common.vec_env import DummyVecEnv, SubprocVecEnv, VecFrameStack, VecNormalize
+import torch as th
+
+from stable_baselines3 import PPO
+from stable_baselines3.common.callbacks import BaseCallback
+from stable_baselines3.common.policies import ActorCriticPolicy
+from stable_baselines3.common.vec_env import (
+    AsyncVecEnv,
+    DummyVecEnv,
+    GroupedSubprocVecEnv,
+    ShmemVecEnv,
+    SubprocVecEnv,
+    VecFrameStack,
+    VecNormalize,
+)
 
 N_ENVS = 3
-VEC_ENV_CLASSES = [DummyVecEnv, SubprocVecEnv]
+# two workers, hosting two envs and one env
+VEC_ENV_CLASSES = [
+    DummyVecEnv,
+    SubprocVecEnv,
+    ShmemVecEnv,
+    functools.partial(GroupedSubprocVecEnv, n_envs_per_worker=2),
+    functools.partial(AsyncVecEnv, batch_size=2),
+]
 VEC_ENV_WRAPPERS = [None, VecNormalize, VecFrameStack]
 
 
@@ -299,6 +319,112 @@ def test_subproc_start_method():
         check_vecenv_spaces(vec_env_class, space, obs_assert)
 
 
+def test_grouped_subproc_start_method():
+    space = gym.spaces.Discrete(2)
+
+    def obs_assert(obs):
+        return check_vecenv_obs(obs, space)
+
+    all_methods = {"forkserver", "spawn", "fork"}
+    for start_method in [None] + list(all_methods.intersection(multiprocessing.get_all_start_methods())):
+        vec_env_class = functools.partial(GroupedSubprocVecEnv, n_envs_per_worker=2, start_method=start_method)
+        check_vecenv_spaces(vec_env_class, space, obs_assert)
+
+
+@pytest.mark.parametrize("n_envs_per_worker", [1, 2, 3, 4])
+def test_grouped_subproc_env_order(n_envs_per_worker):
+    """Test that the envs of all the workers are returned in order"""
+    step_nums = [i + 2 for i in range(N_ENVS)]
+    vec_env = GroupedSubprocVecEnv([functools.partial(StepEnv, n) for n in step_nums], n_envs_per_worker=n_envs_per_worker)
+    assert len(vec_env.processes) == -(-N_ENVS // n_envs_per_worker)
+    assert vec_env.get_attr("max_steps") == step_nums
+    assert vec_env.get_attr("max_steps", indices=[2, 0]) == [step_nums[2], step_nums[0]]
+
+    vec_env.reset()
+    _, _, dones, infos = vec_env.step(np.zeros((N_ENVS,), dtype="int"))
+    _, _, dones, infos = vec_env.step(np.zeros((N_ENVS,), dtype="int"))
+    assert list(dones) == [True] + [False] * (N_ENVS - 1)
+    assert infos[0]["terminal_observation"] == 1
+    vec_env.close()
+
+
+class SleepEnv(StepEnv):
+    def __init__(self, max_steps, step_time):
+        """Gym environment for testing that slow environments do not hold back the others"""
+        super().__init__(max_steps)
+        self.step_time = step_time
+
+    def step(self, action):
+        time.sleep(self.step_time)
+        return super().step(action)
+
+
+def test_async_vecenv_first_ready():
+    """Test that recv() returns the first environments to finish their step"""
+    step_times = [0.5, 0.0, 0.0]
+    vec_env = AsyncVecEnv([functools.partial(SleepEnv, 10, t) for t in step_times], batch_size=2)
+    vec_env.reset()
+    vec_env.send(np.zeros((N_ENVS,), dtype="int"), np.arange(N_ENVS))
+    obs, rewards, dones, infos, env_ids = vec_env.recv()
+    assert sorted(env_ids) == [1, 2]
+    assert obs.shape == (2, 1) and len(rewards) == len(dones) == len(infos) == 2
+    assert list(vec_env.in_flight) == [True, False, False]
+
+    # the fast environments keep stepping while the slow one is in flight
+    for _ in range(3):
+        vec_env.send(np.zeros((2,), dtype="int"), env_ids)
+        obs, _, _, _, env_ids = vec_env.recv()
+        assert sorted(env_ids) == [1, 2]
+    assert list(obs[:, 0]) == [3, 3]
+
+    # fewer environments in flight than the batch size
+    obs, _, _, _, env_ids = vec_env.recv()
+    assert list(env_ids) == [0] and obs[0, 0] == 0
+    assert not vec_env.in_flight.any()
+    vec_env.close()
+
+
+class ScoreSleepEnv(SleepEnv):
+    def step(self, action):
+        """The infos report the score, which the on-policy algorithms record at the end of an episode"""
+        obs, reward, done, info = super().step(action)
+        info.update(l_score=1, r_score=0)
+        return obs, reward, done, info
+
+
+class RolloutCheckCallback(BaseCallback):
+    def __init__(self):
+        super().__init__()
+        self.rollouts = []
+
+    def _on_step(self) -> bool:
+        return True
+
+    def _on_rollout_end(self) -> None:
+        buffer = self.model.rollout_buffer
+        self.rollouts.append((buffer.full, buffer.env_pos.copy(), self.model.num_timesteps))
+
+
+def test_async_vecenv_learn(tmp_path):
+    """Test that PPO fills a column of the rollout for each env of an AsyncVecEnv stepping at different speeds"""
+    step_times = [0.02, 0.0, 0.0]
+    n_steps = 8
+    vec_env = AsyncVecEnv([functools.partial(ScoreSleepEnv, 5, t) for t in step_times], batch_size=2)
+    policy = ActorCriticPolicy(vec_env.observation_space, vec_env.action_space, lambda _: 3e-4)
+    th.save(policy.state_dict(), tmp_path / "policy.pt")
+    model = PPO("MlpPolicy", vec_env, n_steps=n_steps, batch_size=8, n_epochs=1, pretrained_model=tmp_path / "policy.pt")
+
+    callback = RolloutCheckCallback()
+    model.learn(total_timesteps=2 * n_steps * N_ENVS, callback=callback)
+    assert len(callback.rollouts) == 2
+    for iteration, (full, env_pos, num_timesteps) in enumerate(callback.rollouts):
+        assert full
+        assert list(env_pos) == [n_steps] * N_ENVS
+        assert num_timesteps == (iteration + 1) * n_steps * N_ENVS
+    assert model.num_timesteps == 2 * n_steps * N_ENVS
+    vec_env.close()
+
+
 class CustomWrapperA(VecNormalize):
     def __init__(self, venv):
         VecNormalize.__init__(self, venv)
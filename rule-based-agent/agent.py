@@ -1,26 +1,78 @@
 import os
-import pickle
+import atexit
 import builtins as __builtin__
 import lux.annotate as annotate
 
 from lux.game import Game, Mission, Missions
 from lux.actions import *
 from lux.find_cluster import *
+from lux.snapshot import SnapshotWriter
+from lux.profiler import profiler, profile_phase
+from lux.time_budget import TimeBudget, COARSE_CANDIDATE_COUNT
 
 game_state = Game()
 missions = Missions()
 
+# degrades the game logic if the turn is at risk of exceeding the actTimeout and the overage time
+time_budget = TimeBudget()
 
-def game_logic(game_state: Game, missions: Missions, DEBUG=False):
+# set LUX_SNAPSHOT_DIR to save every turn for debugging, load them with lux.snapshot.load_snapshot
+snapshot_writer = SnapshotWriter(os.environ.get('LUX_SNAPSHOT_DIR', ''))
+
+# set LUX_PROFILE_DIR to time the phases of game_logic, the timings are saved at the end of the game
+profile_dir = os.environ.get('LUX_PROFILE_DIR', '')
+profiler.enabled = bool(profile_dir)
+if profiler.enabled:
+    atexit.register(lambda: profiler.dump(profile_dir, game_state.player_id))
+
+
+@profile_phase("game_logic")
+def game_logic(game_state: Game, missions: Missions, deterministic=False, DEBUG=False, time_budget: TimeBudget = None):
     if DEBUG:
         print = __builtin__.print
     else:
         print = lambda *args: None
 
-    game_state.calculate_features(missions)
+    # without a time budget the game logic is never degraded
+    # the degradations depend on the wall-clock time, so a deterministic game logic has no time budget
+    if time_budget is None or deterministic:
+        time_budget = TimeBudget(enabled=False)
+
+    # the time of the other features is small and counted towards the distance matrix
+    start_time = time.time()
+    game_state.calculate_features(
+        missions, max_distance_sources=time_budget.max_distance_sources())
+    sources = game_state.positions_to_calculate_distances_from - game_state.xy_out_of_map
+    searched_sources = game_state.searched_distance_sources - game_state.xy_out_of_map
+    time_budget.record_distance_matrix(time.time() - start_time, len(searched_sources))
+    if len(searched_sources) < len(sources):
+        time_budget.degrade("calculate_distance_matrix", "{} of {} sources use the manhattan distance".format(
+            len(sources) - len(searched_sources), len(sources)))
+
     actions_by_cities = make_city_actions(game_state, missions, DEBUG=DEBUG)
-    missions = make_unit_missions(game_state, missions, DEBUG=DEBUG)
+
+    unit_count = len(game_state.player.units)
+    mission_planning = time_budget.mission_planning(unit_count)
+    if mission_planning == "reuse":
+        time_budget.degrade("make_unit_missions", "missions of the last turn are kept")
+        # the missions of the units that have died or can no longer be carried out are still removed
+        missions.cleanup(game_state.player,
+                         game_state.player_city_tile_xy_set,
+                         game_state.opponent_city_tile_xy_set,
+                         game_state.convolved_collectable_tiles_xy_set)
+    else:
+        max_candidates = None
+        if mission_planning == "coarse":
+            max_candidates = COARSE_CANDIDATE_COUNT
+            time_budget.degrade("make_unit_missions", "{} candidate targets per unit".format(max_candidates))
+        start_time = time.time()
+        missions = make_unit_missions(
+            game_state, missions, deterministic=deterministic, max_candidates=max_candidates, DEBUG=DEBUG)
+        time_budget.record_missions(time.time() - start_time, unit_count)
+
     mission_annotations = print_and_annotate_missions(game_state, missions)
+    for _, phase, message in time_budget.degradations_this_turn():
+        mission_annotations.append(annotate.sidetext("{}: {}".format(phase, message)))
     missions, actions_by_units = make_unit_actions(
         game_state, missions, DEBUG=DEBUG)
     movement_annotations = annotate_movements(game_state, actions_by_units)
@@ -113,7 +165,7 @@ def agent(observation, configuration, DEBUG=False):
     else:
         print = lambda *args: None
 
-    del configuration  # unused
+    start_time = time.time()
     global game_state, missions
 
     if observation["step"] == 0:
@@ -126,16 +178,12 @@ def agent(observation, configuration, DEBUG=False):
         # actually rebuilt and recomputed from scratch
         game_state._update(observation["updates"])
 
-    # on Kaggle compete, do not save items
-    if not os.environ.get('GFOOTBALL_DATA_DIR', ''):
-        str_step = str(observation["step"]).zfill(3)
-        with open('snapshots/observation-{}-{}.pkl'.format(str_step, game_state.player_id), 'wb') as handle:
-            pickle.dump(observation, handle, protocol=pickle.HIGHEST_PROTOCOL)
-        with open('snapshots/game_state-{}-{}.pkl'.format(str_step, game_state.player_id), 'wb') as handle:
-            pickle.dump(game_state, handle, protocol=pickle.HIGHEST_PROTOCOL)
-        with open('snapshots/missions-{}-{}.pkl'.format(str_step, game_state.player_id), 'wb') as handle:
-            pickle.dump(missions, handle, protocol=pickle.HIGHEST_PROTOCOL)
-
     game_state.compute_start_time = time.time()
-    actions, game_state, missions = game_logic(game_state, missions)
+    time_budget.start_turn(observation, configuration, start_time)
+    profiler.start_turn(observation["step"])
+    snapshot_writer.save(observation, game_state, missions)
+    actions, game_state, missions = game_logic(game_state, missions, time_budget=time_budget)
+
+    if profiler.enabled and observation["step"] == GAME_CONSTANTS["PARAMETERS"]["MAX_DAYS"] - 1:
+        profiler.dump(profile_dir, game_state.player_id)
     return actions
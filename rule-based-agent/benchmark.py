@@ -0,0 +1,104 @@
+"""
+Time the game logic on a single turn.
+
+The turn is either loaded from the snapshots saved under snapshots/ (see lux/snapshot.py),
+or reconstructed by replaying a recorded episode from imitation-learning/lux-episodes.
+
+    python benchmark.py --episode ../imitation-learning/lux-episodes/26689645.json --step 300
+    python benchmark.py --snapshot 300
+"""
+import argparse
+import copy
+import json
+import time
+
+import numpy as np
+
+from agent import game_logic
+from lux.game import Game, Missions
+from lux.actions import make_city_actions, make_unit_missions, make_unit_actions
+from lux.snapshot import load_snapshot
+
+
+def load_from_episode(episode_path: str, step: int, player_id: int = 0):
+    # replay the recorded observations so that the missions carried into the turn are realistic
+    with open(episode_path) as f:
+        episode = json.load(f)
+
+    game_state = Game()
+    missions = Missions()
+    for observation in [steps[0]["observation"] for steps in episode["steps"][:step + 1]]:
+        if observation["step"] == 0:
+            game_state._initialize(observation["updates"])
+            game_state.player_id = player_id
+            game_state._update(observation["updates"][2:])
+            game_state.fix_iteration_order()
+        else:
+            game_state._update(observation["updates"])
+        if observation["step"] == step:
+            break
+        game_state.compute_start_time = time.time()
+        _, game_state, missions = game_logic(game_state, missions)
+
+    return game_state, missions
+
+
+def benchmark(game_state: Game, missions: Missions, repeats: int = 10):
+    timings = []
+    for _ in range(repeats):
+        game_state_copy, missions_copy = copy.deepcopy((game_state, missions))
+        game_state_copy.compute_start_time = time.time()
+        game_logic(game_state_copy, missions_copy)
+        timings.append(time.time() - game_state_copy.compute_start_time)
+    return np.array(timings)
+
+
+def benchmark_phase(game_state: Game, missions: Missions, phase: str, repeats: int = 10):
+    # the phases before are computed beforehand, only the given phase is timed
+    game_state, missions = copy.deepcopy((game_state, missions))
+    game_state.calculate_features(missions)
+    make_city_actions(game_state, missions)
+    if phase == "make_unit_actions":
+        make_unit_missions(game_state, missions)
+
+    timings = []
+    for _ in range(repeats):
+        game_state_copy, missions_copy = copy.deepcopy((game_state, missions))
+        start_time = time.time()
+        PHASES[phase](game_state_copy, missions_copy)
+        timings.append(time.time() - start_time)
+    return np.array(timings)
+
+
+PHASES = {
+    "make_unit_missions": make_unit_missions,
+    "make_unit_actions": make_unit_actions,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the game logic on a single turn")
+    parser.add_argument("--episode", type=str, help="path to a recorded episode json")
+    parser.add_argument("--snapshot", type=int, help="step of the snapshot saved in snapshots/")
+    parser.add_argument("--step", type=int, default=300, help="step to replay the episode up to")
+    parser.add_argument("--player", type=int, default=0)
+    parser.add_argument("--repeats", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.snapshot is not None:
+        _, game_state, missions = load_snapshot(args.snapshot, args.player)
+    elif args.episode:
+        game_state, missions = load_from_episode(args.episode, args.step, args.player)
+    else:
+        parser.error("either --episode or --snapshot is required")
+
+    print("map {}x{} turn {} units {} missions {}".format(
+        game_state.map_width, game_state.map_height, game_state.turn,
+        len(game_state.player.units), len(missions)))
+    timings = benchmark(game_state, missions, args.repeats)
+    print("{} mean {:.4f}s median {:.4f}s min {:.4f}s".format(
+        "game_logic", timings.mean(), np.median(timings), timings.min()))
+    for phase in PHASES:
+        timings = benchmark_phase(game_state, missions, phase, args.repeats)
+        print("{} mean {:.4f}s median {:.4f}s min {:.4f}s".format(
+            phase, timings.mean(), np.median(timings), timings.min()))
@@ -0,0 +1,228 @@
+"""
+Check that a change to the game kit keeps the features and actions of the agent identical.
+
+Recorded episodes from imitation-learning/lux-episodes are replayed as both players through two versions
+of the agent, each in its own process. Every turn, the matrices, the xy sets with their insertion order
+and the resource groups computed by calculate_features, and the actions of game_logic, must be identical.
+
+    python equivalence.py --baseline HEAD
+    python equivalence.py --baseline 00bcea4~1 --candidate 00bcea4 --episodes 26690069 26688997 26689365
+
+The versions are git revisions, the candidate defaults to the working tree.
+Attributes that only one version computes are listed, but not compared.
+
+tests/test_equivalence.py checks the working tree against hashes of the features and actions of one episode.
+After a change that is meant to change them, and has been checked with this script, the hashes are updated with
+
+    python equivalence.py --update-reference
+"""
+import argparse
+import gzip
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+
+import numpy as np
+
+EPISODE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "imitation-learning", "lux-episodes")
+# the episode replayed by tests/test_equivalence.py, with the hashes of its features and actions
+REFERENCE_EPISODE = "26689365"
+REFERENCE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tests", "data",
+                              "reference_{}.json.gz".format(REFERENCE_EPISODE))
+ANNOTATION_PREFIXES = ("dc ", "dx ", "dl ", "dt ", "dst ")
+
+
+def normalize(value):
+    # numpy scalars and python numbers of equal values compare equal, the order of the items is kept
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return tuple(normalize(item) for item in value)
+    if isinstance(value, dict):
+        return tuple((normalize(key), normalize(item)) for key, item in value.items())
+    return value
+
+
+def feature_digest(game_state):
+    '''
+    The arrays (by value, whatever their dtype), the sets (in insertion order) and the resource groups of the game state.
+    The lazily built xy sets of the class are included. Nothing is mutated, the disjoint sets are not searched.
+    '''
+    digest = {}
+    names = set(vars(game_state)) | {name for name in dir(type(game_state)) if name.endswith("_xy_set")}
+    for name in sorted(names):
+        if name.startswith("_") or name == "xy_sets":
+            continue
+        value = getattr(game_state, name)
+        if isinstance(value, np.ndarray):
+            data = np.ascontiguousarray(value, dtype=np.float64).tobytes()
+            digest[name] = ("array", value.shape, hashlib.sha1(data).hexdigest())
+        elif isinstance(value, (set, frozenset)):
+            digest[name] = ("set", normalize(value))
+        elif type(value).__name__ == "DisjointSet":
+            digest[name] = ("groups", normalize(value.parent), normalize(value.points))
+    return digest
+
+
+def replay(episode_path: str):
+    '''
+    The feature digests and the actions of each turn of the episode, replayed as both players by the agent that is imported.
+    '''
+    from agent import game_logic
+    from lux.game import Game, Missions
+
+    features = []
+    calculate_features = Game.calculate_features
+
+    def recorded_calculate_features(self, *args, **kwargs):
+        calculate_features(self, *args, **kwargs)
+        features.append(feature_digest(self))
+
+    kwargs = {"deterministic": True} if "deterministic" in inspect.signature(game_logic).parameters else {}
+    with open(episode_path) as f:
+        episode = json.load(f)
+
+    records = {}
+    Game.calculate_features = recorded_calculate_features
+    try:
+        for player_id in [0, 1]:
+            game_state, missions = Game(), Missions()
+            turns = []
+            # the last observation is the end of the game, when the agent is not called
+            for observation in [steps[0]["observation"] for steps in episode["steps"][:-1]]:
+                if observation["step"] == 0:
+                    game_state._initialize(observation["updates"])
+                    game_state.player_id = player_id
+                    game_state._update(observation["updates"][2:])
+                    game_state.fix_iteration_order()
+                else:
+                    game_state._update(observation["updates"])
+                game_state.compute_start_time = time.time()
+                del features[:]
+                actions, game_state, missions = game_logic(game_state, missions, **kwargs)
+                actions = [action for action in actions if not action.startswith(ANNOTATION_PREFIXES)]
+                turns.append((features[0], actions))
+            records[player_id] = turns
+    finally:
+        Game.calculate_features = calculate_features
+    return records
+
+
+def hashed(turns):
+    '''
+    The digests of the features and the actions of each turn as short hashes, as stored for the tests.
+    '''
+    def short_hash(value) -> str:
+        return hashlib.sha1(repr(value).encode()).hexdigest()[:12]
+
+    hashes = []
+    for features, actions in turns:
+        turn_hashes = {name: short_hash(value) for name, value in features.items()}
+        turn_hashes["actions"] = short_hash(tuple(actions))
+        hashes.append(turn_hashes)
+    return hashes
+
+
+def write_reference():
+    records = replay(os.path.join(EPISODE_DIR, "{}.json".format(REFERENCE_EPISODE)))
+    with gzip.open(REFERENCE_PATH, "wt") as f:
+        json.dump({str(player_id): hashed(turns) for player_id, turns in records.items()}, f, sort_keys=True)
+
+
+def dump(root: str, episode_paths, output: str):
+    # the version of the agent under root is imported instead of the one beside this file
+    sys.path.insert(0, root)
+    records = {}
+    for episode_path in episode_paths:
+        for player_id, turns in replay(episode_path).items():
+            records[os.path.basename(episode_path), player_id] = turns
+    with open(output, "wb") as f:
+        pickle.dump(records, f)
+
+
+def checkout(revision: str, directory: str) -> str:
+    # the files of rule-based-agent at the revision, extracted under the directory
+    repository = subprocess.check_output(["git", "rev-parse", "--show-toplevel"], text=True).strip()
+    os.makedirs(directory)
+    archive = os.path.join(directory, "archive.tar")
+    subprocess.check_call(["git", "-C", repository, "archive", "-o", archive, revision, "rule-based-agent"])
+    with tarfile.open(archive) as tar:
+        tar.extractall(directory)
+    return os.path.join(directory, "rule-based-agent")
+
+
+def run(root: str, episode_paths, output: str):
+    subprocess.check_call(
+        [sys.executable, os.path.abspath(__file__), "--dump", output, "--root", root] + ["--episode-paths"] + episode_paths)
+    with open(output, "rb") as f:
+        return pickle.load(f)
+
+
+def compare(baseline_records, candidate_records) -> int:
+    mismatches = 0
+    for key, baseline_turns in baseline_records.items():
+        candidate_turns = candidate_records[key]
+        only_one_side = set()
+        for turn, ((baseline_features, baseline_actions), (candidate_features, candidate_actions)) in \
+                enumerate(zip(baseline_turns, candidate_turns)):
+            only_one_side |= set(baseline_features) ^ set(candidate_features)
+            different = []
+            for name in sorted(set(baseline_features) & set(candidate_features)):
+                baseline_value, candidate_value = baseline_features[name], candidate_features[name]
+                if baseline_value == candidate_value:
+                    continue
+                if baseline_value[0] == "set" and set(baseline_value[1]) == set(candidate_value[1]):
+                    name += " (same items in another order)"
+                different.append(name)
+            if baseline_actions != candidate_actions:
+                different.append("actions")
+            if different:
+                # the missions diverge after the first mismatch, the later turns are not compared
+                print("{} player {} turn {}: {} differ".format(*key, turn, ", ".join(different)))
+                mismatches += 1
+                break
+        else:
+            print("{} player {}: {} turns identical".format(*key, len(baseline_turns)))
+        if only_one_side:
+            print("  not compared, computed by one version only: {}".format(", ".join(sorted(only_one_side))))
+    return mismatches
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that two versions of the agent compute identical features")
+    parser.add_argument("--baseline", type=str, default="HEAD", help="git revision of the baseline")
+    parser.add_argument("--candidate", type=str, default=None,
+                        help="git revision of the candidate, the working tree by default")
+    parser.add_argument("--episodes", type=str, nargs="+", default=["26690069", "26688997", "26689365"],
+                        help="ids of the episodes in imitation-learning/lux-episodes")
+    parser.add_argument("--update-reference", action="store_true",
+                        help="store the hashes of the features and actions of the working tree for the tests")
+    parser.add_argument("--dump", type=str, help=argparse.SUPPRESS)
+    parser.add_argument("--root", type=str, help=argparse.SUPPRESS)
+    parser.add_argument("--episode-paths", type=str, nargs="*", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.dump:
+        dump(args.root, args.episode_paths, args.dump)
+        sys.exit(0)
+    if args.update_reference:
+        write_reference()
+        sys.exit(0)
+
+    episode_paths = [os.path.abspath(os.path.join(EPISODE_DIR, "{}.json".format(episode))) for episode in args.episodes]
+    with tempfile.TemporaryDirectory() as directory:
+        baseline_root = checkout(args.baseline, os.path.join(directory, "baseline"))
+        if args.candidate is None:
+            candidate_root = os.path.dirname(os.path.abspath(__file__))
+        else:
+            candidate_root = checkout(args.candidate, os.path.join(directory, "candidate"))
+        baseline_records = run(baseline_root, episode_paths, os.path.join(directory, "baseline.pkl"))
+        candidate_records = run(candidate_root, episode_paths, os.path.join(directory, "candidate.pkl"))
+    sys.exit(1 if compare(baseline_records, candidate_records) else 0)
@@ -1,3 +1,5 @@
+import glob
+
 import nbformat
 import nbformat.v4 as nbf
 
@@ -54,15 +56,10 @@ The game kit has been edited to include more features for the agent to make deci
 
 cells.append(nbf.new_markdown_cell(preamble_kit))
 
-filenames = [
-    "lux/game.py",
-    "lux/game_map.py",
-    "lux/game_objects.py",
-    "lux/game_position.py",
-    "lux/game_constants.py",
-    "lux/constants.py",
-    "lux/annotate.py",
-]
+# every other module of the game kit, so that a module the agent imports cannot be left out
+agent_filenames = filenames
+filenames = ["lux/game.py"] + sorted(
+    set(glob.glob("lux/*.py")) - set(agent_filenames) - {"lux/game.py"})
 
 for filename in filenames:
     savefile_cell_magic = f"%%writefile {filename}\n"
@@ -84,7 +81,8 @@ cells.append(nbf.new_markdown_cell(preamble_rendering))
 
 
 runner_code = """\
-!mkdir snapshots
+import os
+os.environ["LUX_SNAPSHOT_DIR"] = "snapshots"
 from kaggle_environments import make
 env = make("lux_ai_2021", debug=True, configuration={"annotations": True, "width":12, "height":12})
 steps = env.run(["agent.py", "agent.py"])\
@@ -100,7 +98,7 @@ cells.append(nbf.new_code_cell(render_code, metadata={"_kg_hide-input": True}))
 
 preamble_debugging = """\
 # Debugging
-In the run, we have saved the game state and missions as Python pickle files.
+In the run, we have saved the observation and missions of every turn as snapshots.
 We can rerun the game logic and debug how missions are planned and actions are executed.
 For visualisation, we plot `convolved_collectable_tiles_matrix`.
 This matrix is used for estimating the best target position of a mission.
@@ -111,16 +109,13 @@ You could also print other attributes of `game_state`.
 cells.append(nbf.new_markdown_cell(preamble_debugging))
 
 debugging_code = """\
-import pickle
 import numpy as np
 import matplotlib.pyplot as plt
 from agent import game_logic
-str_step = "010"
+from lux.snapshot import load_snapshot
+step = 10
 player_id = 0
-with open(f'snapshots/game_state-{str_step}-{player_id}.pkl', 'rb') as handle:
-    game_state = pickle.load(handle)
-with open(f'snapshots/missions-{str_step}-{player_id}.pkl', 'rb') as handle:
-    missions = pickle.load(handle)
+observation, game_state, missions = load_snapshot(step, player_id)
 game_logic(game_state, missions, DEBUG=True)
 plt.imshow(game_state.convolved_collectable_tiles_matrix)
 plt.colorbar()
@@ -134,8 +129,8 @@ cells.append(nbf.new_code_cell(debugging_code,
 cells.append(nbf.new_markdown_cell("# Make Submission"))
 
 zip_code = """\
-!rm snapshots/*.pkl
-!tar --exclude='*.ipynb' --exclude="*.pyc" --exclude="*.pkl" -czf submission.tar.gz *
+!rm -rf snapshots/
+!tar --exclude='*.ipynb' --exclude="*.pyc" --exclude="*.pkl" --exclude="*.pkl.gz" -czf submission.tar.gz *
 !rm *.py && rm -rf __pycache__/ && rm -rf lux/\
 """
 cells.append(nbf.new_code_cell(zip_code, metadata={"_kg_hide-input": True}))
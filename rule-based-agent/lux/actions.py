@@ -4,11 +4,13 @@ from lux.game_objects import *
 from lux.constants import Constants
 from lux.game_constants import GAME_CONSTANTS
 from .find_cluster import *
+from .profiler import profile_phase
 
 
 DIRECTIONS = Constants.DIRECTIONS
 
 
+@profile_phase("make_city_actions")
 def make_city_actions(game_state: Game, missions: Missions, DEBUG=False) -> List[str]:
     if DEBUG:
         print = __builtin__.print
@@ -92,7 +94,8 @@ def make_city_actions(game_state: Game, missions: Missions, DEBUG=False) -> List
     return actions
 
 
-def make_unit_missions(game_state: Game, missions: Missions, DEBUG=False) -> Missions:
+@profile_phase("make_unit_missions")
+def make_unit_missions(game_state: Game, missions: Missions, deterministic=False, max_candidates: int = None, DEBUG=False) -> Missions:
     if DEBUG:
         print = __builtin__.print
     else:
@@ -103,8 +106,11 @@ def make_unit_missions(game_state: Game, missions: Missions, DEBUG=False) -> Mis
                      game_state.player_city_tile_xy_set,
                      game_state.opponent_city_tile_xy_set,
                      game_state.convolved_collectable_tiles_xy_set)
+    # the targets are kept up to date as missions are added, to avoid sharing the same target
+    game_state.repopulate_targets(missions)
 
     unit_ids_with_missions_assigned_this_turn = set()
+    units_to_assign: List[Unit] = []
 
     player.units.sort(key=lambda unit:
                       (unit.pos.x*game_state.x_order_coefficient, unit.pos.y*game_state.y_order_coefficient, unit.encode_tuple_for_cmp()))
@@ -114,9 +120,6 @@ def make_unit_missions(game_state: Game, missions: Missions, DEBUG=False) -> Mis
         current_mission: Mission = missions[unit.id] if unit.id in missions else None
         current_target_position = current_mission.target_position if current_mission else None
 
-        # avoid sharing the same target
-        game_state.repopulate_targets(missions)
-
         # if the unit is waiting for dawn at the side of resource
         stay_up_till_dawn = (unit.get_cargo_space_left() <= 4 and (
             not game_state.is_day_time or game_state.turn % 40 == 0))
@@ -143,11 +146,15 @@ def make_unit_missions(game_state: Game, missions: Missions, DEBUG=False) -> Mis
             # the mission will be recaluated if the unit fails to make a move after make_unit_actions
             continue
 
-        best_position, best_cell_value = find_best_cluster(
-            game_state, unit, DEBUG=DEBUG)
+        units_to_assign.append(unit)
+
+    # the remaining units are assigned their targets together, no two units share the same target
+    best_positions_and_values = find_best_clusters(
+        game_state, units_to_assign, deterministic=deterministic, max_candidates=max_candidates, DEBUG=DEBUG)
+
+    for unit in units_to_assign:
+        best_position, best_cell_value = best_positions_and_values[unit.id]
         # [TODO] what if best_cell_value is zero
-        distance_from_best_position = game_state.retrieve_distance(
-            unit.pos.x, unit.pos.y, best_position.x, best_position.y)
         print("plan mission adaptative", unit.id,
               unit.pos, "->", best_position)
         mission = Mission(unit.id, best_position, None)
@@ -161,6 +168,7 @@ def make_unit_missions(game_state: Game, missions: Missions, DEBUG=False) -> Mis
     return missions
 
 
+@profile_phase("make_unit_actions")
 def make_unit_actions(game_state: Game, missions: Missions, DEBUG=False) -> Tuple[Missions, List[str]]:
     if DEBUG:
         print = __builtin__.print
@@ -171,53 +179,49 @@ def make_unit_actions(game_state: Game, missions: Missions, DEBUG=False) -> Tupl
     actions = []
 
     units_with_mission_but_no_action = set(missions.keys())
-    prev_actions_len = -1
+    units_to_move: List[Unit] = []
+
+    for unit in player.units:
+        if not unit.can_act():
+            units_with_mission_but_no_action.discard(unit.id)
+            continue
 
-    # repeat attempting movements for the units until no additional movements can be added
-    while prev_actions_len < len(actions):
-        prev_actions_len = len(actions)
+        # if there is no mission, continue
+        if unit.id not in missions:
+            units_with_mission_but_no_action.discard(unit.id)
+            continue
 
-        for unit in player.units:
-            if not unit.can_act():
-                units_with_mission_but_no_action.discard(unit.id)
-                continue
+        mission: Mission = missions[unit.id]
+        print("attempting action for", unit.id,
+              unit.pos, "->", mission.target_position)
 
-            # if there is no mission, continue
-            if unit.id not in missions:
-                units_with_mission_but_no_action.discard(unit.id)
-                continue
+        # if the location is reached, take action
+        if unit.pos == mission.target_position:
+            units_with_mission_but_no_action.discard(unit.id)
+            print("location reached and make action", unit.id, unit.pos)
+            action = mission.target_action
 
-            mission: Mission = missions[unit.id]
-            print("attempting action for", unit.id,
-                  unit.pos, "->", mission.target_position)
-
-            # if the location is reached, take action
-            if unit.pos == mission.target_position:
-                units_with_mission_but_no_action.discard(unit.id)
-                print("location reached and make action", unit.id, unit.pos)
-                action = mission.target_action
-
-                # do not build city at last light
-                if action and action[:5] == "bcity" and game_state.turn % 40 == 30:
-                    del missions[unit.id]
-                    continue
-
-                if action:
-                    actions.append(action)
+            # do not build city at last light
+            if action and action[:5] == "bcity" and game_state.turn % 40 == 30:
                 del missions[unit.id]
                 continue
 
-            # attempt to move the unit
-            direction = attempt_direction_to(
-                game_state, unit, mission.target_position)
-            if direction != "c":
-                units_with_mission_but_no_action.discard(unit.id)
-                action = unit.move(direction)
-                print("make move", unit.id, unit.pos, direction)
+            if action:
                 actions.append(action)
-                continue
+            del missions[unit.id]
+            continue
+
+        units_to_move.append(unit)
 
-            # [TODO] make it possible for units to swap positions
+    # the movements of all the units are resolved together
+    directions = resolve_movements(game_state, units_to_move, missions)
+    for unit in units_to_move:
+        direction = directions[unit.id]
+        if direction != DIRECTIONS.CENTER:
+            units_with_mission_but_no_action.discard(unit.id)
+            action = unit.move(direction)
+            print("make move", unit.id, unit.pos, direction)
+            actions.append(action)
 
     # if the unit is not able to make an action, delete the mission
     for unit_id in units_with_mission_but_no_action:
@@ -229,25 +233,20 @@ def make_unit_actions(game_state: Game, missions: Missions, DEBUG=False) -> Tupl
     return missions, actions
 
 
-def attempt_direction_to(game_state: Game, unit: Unit, target_pos: Position) -> DIRECTIONS:
-
-    smallest_cost = [2, 2, 2, 2]
-    closest_dir = DIRECTIONS.CENTER
-    closest_pos = unit.pos
+def rank_directions_to(game_state: Game, unit: Unit, target_pos: Position, blocked_xy_set: Set[Tuple]) -> List[Tuple[List, DIRECTIONS, Position]]:
+    # directions that the unit can move to, the most preferred first
 
+    ranked_directions = []
     for direction in game_state.dirs:
+        if direction == DIRECTIONS.CENTER:
+            continue
         newpos = unit.pos.translate(direction, 1)
 
-        cost = [0, 0, 0, 0]
-
-        # do not go out of map
-        if tuple(newpos) in game_state.xy_out_of_map:
+        # do not go out of map, or into tiles occupied by units that are not moving
+        if tuple(newpos) in blocked_xy_set:
             continue
 
-        # discourage if new position is occupied
-        if tuple(newpos) in game_state.occupied_xy_set:
-            if tuple(newpos) not in game_state.player_city_tile_xy_set:
-                cost[0] = 2
+        cost = [0, 0, 0, 0]
 
         # discourage going into a city tile if you are carrying substantial wood
         if tuple(newpos) in game_state.player_city_tile_xy_set and unit.cargo.wood >= 60:
@@ -270,16 +269,89 @@ def attempt_direction_to(game_state: Game, unit: Unit, target_pos: Position) ->
         if tuple(unit.pos) in game_state.player_city_tile_xy_set:
             cost[1] = manhattan_dist
 
-        # update decision
-        if cost < smallest_cost:
-            smallest_cost = cost
-            closest_dir = direction
-            closest_pos = newpos
-
-    if closest_dir != DIRECTIONS.CENTER:
-        game_state.occupied_xy_set.discard(tuple(unit.pos))
-        if tuple(closest_pos) not in game_state.player_city_tile_xy_set:
-            game_state.occupied_xy_set.add(tuple(closest_pos))
-        unit.cooldown += 2
-
-    return closest_dir
+        ranked_directions.append((cost, direction, newpos))
+
+    # ties are resolved by the order of game_state.dirs
+    ranked_directions.sort(key=lambda cost_direction_newpos: cost_direction_newpos[0])
+    return ranked_directions
+
+
+def resolve_movements(game_state: Game, units: List[Unit], missions: Missions) -> Dict[str, DIRECTIONS]:
+    '''
+    Decide the directions of all the moving units at once.
+    Each unit reserves its most preferred tile that is not reserved yet, in the order of the units.
+    A unit moving into the tile of another moving unit only succeeds if that unit leaves,
+    so chains of units move together, as well as cycles and swaps.
+    Units that cannot move stay at the center.
+    '''
+    moving_unit_ids = set(unit.id for unit in units)
+
+    # tiles that cannot be entered this turn
+    # out of map, opponent units and citytiles, and your units that are not moving (unless in your city)
+    blocked_xy_set = game_state.xy_out_of_map | game_state.opponent_units_xy_set | \
+        game_state.opponent_city_tile_xy_set
+    for unit in game_state.player.units:
+        if unit.id not in moving_unit_ids:
+            blocked_xy_set.add(tuple(unit.pos))
+    blocked_xy_set -= game_state.player_city_tile_xy_set
+
+    # your city tiles can hold any number of units and are not reserved
+    reserved_xy_set: Set[Tuple] = set()
+    planned_moves: Dict[str, Tuple[DIRECTIONS, Tuple]] = {}
+    for unit in units:
+        target_pos = missions[unit.id].target_position
+        for cost, direction, newpos in rank_directions_to(game_state, unit, target_pos, blocked_xy_set):
+            if tuple(newpos) in reserved_xy_set:
+                continue
+            if tuple(newpos) not in game_state.player_city_tile_xy_set:
+                reserved_xy_set.add(tuple(newpos))
+            planned_moves[unit.id] = (direction, tuple(newpos))
+            break
+
+    # moving units that other units may be moving into
+    unit_id_from_xy: Dict[Tuple, str] = {}
+    for unit in units:
+        if tuple(unit.pos) not in game_state.player_city_tile_xy_set:
+            unit_id_from_xy[tuple(unit.pos)] = unit.id
+
+    # follow the chain of units moving into each other, every unit is visited once
+    move_succeeds: Dict[str, bool] = {}
+    for unit in units:
+        chain = []
+        unit_ids_in_chain = set()
+        unit_id = unit.id
+        while True:
+            if unit_id in move_succeeds:
+                succeeds = move_succeeds[unit_id]
+                break
+            if unit_id not in planned_moves:
+                # the unit stays, so the unit moving into its tile cannot move
+                succeeds = False
+                break
+            if unit_id in unit_ids_in_chain:
+                # the units in a cycle move together
+                succeeds = True
+                break
+            chain.append(unit_id)
+            unit_ids_in_chain.add(unit_id)
+            _, xy = planned_moves[unit_id]
+            if xy not in unit_id_from_xy:
+                # the tile is free, or is your city tile
+                succeeds = True
+                break
+            unit_id = unit_id_from_xy[xy]
+        for unit_id in chain:
+            move_succeeds[unit_id] = succeeds
+
+    directions: Dict[str, DIRECTIONS] = {}
+    for unit in units:
+        if move_succeeds.get(unit.id, False):
+            direction, xy = planned_moves[unit.id]
+            directions[unit.id] = direction
+
+            game_state.occupied_xy_set.discard(tuple(unit.pos))
+            if xy not in game_state.player_city_tile_xy_set:
+                game_state.occupied_xy_set.add(xy)
+        else:
+            directions[unit.id] = DIRECTIONS.CENTER
+    return directions
@@ -0,0 +1,87 @@
+import numpy as np
+
+try:
+    # much faster than the fallback below, available on the Kaggle docker image
+    from scipy.optimize import linear_sum_assignment as scipy_linear_sum_assignment
+except ImportError:
+    scipy_linear_sum_assignment = None
+
+
+def linear_sum_assignment(cost_matrix, deterministic=False):
+    '''
+    Min-cost assignment of rows to columns, each row and column used at most once.
+    Returns the row indices and column indices of the assignment, sorted by row.
+
+    With deterministic=True the built-in solver is always used,
+    so the result does not depend on the scipy version installed.
+    '''
+    cost_matrix = np.asarray(cost_matrix, dtype=float)
+    if cost_matrix.size == 0:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+
+    if scipy_linear_sum_assignment is not None and not deterministic:
+        row_ind, col_ind = scipy_linear_sum_assignment(cost_matrix)
+        return row_ind, col_ind
+
+    # the solver below requires at least as many columns as rows
+    if cost_matrix.shape[0] > cost_matrix.shape[1]:
+        col_ind, row_ind = hungarian(cost_matrix.T)
+        order = np.argsort(row_ind)
+        return row_ind[order], col_ind[order]
+    return hungarian(cost_matrix)
+
+
+def hungarian(cost_matrix):
+    '''
+    Shortest augmenting path Hungarian algorithm, O(rows^2 * cols).
+    The inner loop over columns is vectorized. Ties are resolved by the lowest column index.
+    '''
+    n, m = cost_matrix.shape
+    assert n <= m
+
+    # potentials of the rows and columns, index 0 is a dummy column
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    row_of_col = np.zeros(m + 1, dtype=int)  # 1-indexed, 0 if unassigned
+    way = np.zeros(m + 1, dtype=int)
+
+    for i in range(1, n + 1):
+        row_of_col[0] = i
+        j0 = 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+
+        # grow the alternating tree until a free column is reached
+        while True:
+            used[j0] = True
+            i0 = row_of_col[j0]
+            free = ~used[1:]
+
+            reduced_cost = cost_matrix[i0 - 1] - u[i0] - v[1:]
+            improved = free & (reduced_cost < minv[1:])
+            minv[1:][improved] = reduced_cost[improved]
+            way[1:][improved] = j0
+
+            candidates = np.where(free, minv[1:], np.inf)
+            j1 = int(np.argmin(candidates)) + 1
+            delta = candidates[j1 - 1]
+
+            used_cols = np.nonzero(used)[0]
+            u[row_of_col[used_cols]] += delta
+            v[used_cols] -= delta
+            minv[1:][free] -= delta
+
+            j0 = j1
+            if row_of_col[j0] == 0:
+                break
+
+        # flip the augmenting path
+        while j0:
+            j1 = way[j0]
+            row_of_col[j0] = row_of_col[j1]
+            j0 = j1
+
+    col_ind = np.nonzero(row_of_col[1:])[0]
+    row_ind = row_of_col[1:][col_ind] - 1
+    order = np.argsort(row_ind)
+    return row_ind[order], col_ind[order]
@@ -1,10 +1,15 @@
 import builtins as __builtin__
+import numpy as np
 
+from typing import Dict, List, Tuple
 from .game import Game
 from .game_map import Unit, Position
 from .annotate import *
+from .assignment import linear_sum_assignment
+from .profiler import profile_phase
 
 
+@profile_phase("find_best_cluster")
 def find_best_cluster(game_state: Game, unit: Unit, distance_multiplier=-0.5, DEBUG=False):
     if DEBUG:
         print = __builtin__.print
@@ -115,3 +120,156 @@ def find_best_cluster(game_state: Game, unit: Unit, distance_multiplier=-0.5, DE
         unit.pos)] = score_matrix_wrt_pos
 
     return best_position, best_cell_value
+
+
+@profile_phase("find_best_clusters")
+def find_best_clusters(game_state: Game, units: List[Unit], distance_multiplier=-0.5, deterministic=False, max_candidates: int = None, DEBUG=False) -> Dict[str, Tuple[Position, Tuple]]:
+    '''
+    Batched version of find_best_cluster.
+    Every unit is scored at once against the candidate targets within its travel range, with the same scoring function.
+    The targets are then assigned with a min-cost assignment, so that no two units target the same tile.
+    Units without any target are not to move.
+    With max_candidates, each unit only considers its best max_candidates tiles, which makes the assignment smaller.
+    '''
+    if DEBUG:
+        print = __builtin__.print
+    else:
+        print = lambda *args: None
+
+    if not units:
+        return {}
+
+    for unit in units:
+        unit.compute_travel_range(
+            (game_state.turns_to_night, game_state.turns_to_dawn, game_state.is_day_time),)
+
+    units_x = np.array([unit.pos.x for unit in units])
+    units_y = np.array([unit.pos.y for unit in units])
+    travel_range = np.array([unit.travel_range for unit in units])
+
+    # only the tiles with collectable resource on or beside them can score
+    index = game_state.get_candidate_target_index()
+
+    # the candidates within the travel range of each unit, as (unit, candidate) pairs
+    pair_candidates = [index.within(unit.pos.x, unit.pos.y, unit.travel_range) for unit in units]
+    pair_units = np.repeat(np.arange(len(units)), [len(candidates) for candidates in pair_candidates])
+    pair_candidates = np.concatenate(pair_candidates)
+    pair_leaders = index.leaders[pair_candidates]
+
+    # statistics of the clusters
+    leader_units_mining, leader_units_targeting_or_mining = \
+        game_state.count_units_by_leader(index.leader_ids)
+    current_leaders = index.leader_matrix[units_y, units_x]
+    consider_different_cluster = leader_units_mining[current_leaders] >= 1
+    consider_different_cluster_must = \
+        leader_units_mining[current_leaders] >= index.leader_points[current_leaders]
+
+    # cluster targeting logic
+    different_cluster = pair_leaders != current_leaders[pair_units]
+    different_cluster_bonus = np.where(
+        leader_units_targeting_or_mining[pair_leaders] == 0,
+        index.leader_points[pair_leaders] / (1 + leader_units_mining[pair_leaders]), 1)
+    different_cluster_bonus = different_cluster_bonus * \
+        np.where(consider_different_cluster_must, 100, 1)[pair_units]
+    target_bonus = np.where(
+        (consider_different_cluster | consider_different_cluster_must)[pair_units],
+        np.where(different_cluster, different_cluster_bonus, 1),
+        np.where(different_cluster, 1, 2))
+
+    # using path distance
+    distance = np.maximum(0.5, game_state.distance_matrix[
+        units_y[pair_units], units_x[pair_units], index.ys[pair_candidates], index.xs[pair_candidates]])
+
+    # what not to target
+    excluded_matrix = game_state.init_matrix(default_value=False)
+    for xy_set in [game_state.targeted_xy_set,
+                   game_state.targeted_for_building_xy_set,
+                   game_state.opponent_city_tile_xy_set,
+                   game_state.player_city_tile_xy_set]:
+        for x, y in xy_set:
+            excluded_matrix[y, x] = True
+    excluded = excluded_matrix[index.ys, index.xs]
+
+    # estimate target score, same as the cell_value tuple in find_best_cluster
+    resource_value = index.resource_value[pair_candidates] * distance ** distance_multiplier
+    distance_from_edge = index.distance_from_edge[pair_candidates]
+    opponent_distance = index.opponent_distance[pair_candidates]
+
+    # only targets scoring better than (0, 0, 0, 0) are considered
+    better_than_staying = (target_bonus > 0) | ((target_bonus == 0) & (
+        (resource_value > 0) | ((resource_value == 0) & (
+            (distance_from_edge > 0) | ((distance_from_edge == 0) & (opponent_distance > 0))))))
+    pair_feasible = better_than_staying & (distance <= travel_range[pair_units]) & \
+        ~excluded[pair_candidates]
+
+    pair_score = target_bonus*1000 + resource_value*100 + distance_from_edge*10 + opponent_distance
+    # the weighted sum is only shown in the debug matrices, the targets are ranked as the cell_value tuples
+    pair_rank = lexicographic_rank(target_bonus, resource_value, distance_from_edge, opponent_distance)
+
+    # for debugging
+    score_matrices = np.zeros((len(units), game_state.map_height, game_state.map_width))
+    score_matrices[pair_units, index.ys[pair_candidates], index.xs[pair_candidates]] = \
+        np.where(pair_feasible, pair_score, 0)
+    for unit, score_matrix_wrt_pos in zip(units, score_matrices):
+        game_state.heuristics_from_positions[tuple(unit.pos)] = score_matrix_wrt_pos
+
+    # the candidates are listed in the iteration order, so that ties are resolved symmetrically for both players
+    feasible = np.zeros((len(units), len(index)), dtype=bool)
+    score = np.zeros((len(units), len(index)))
+    pair_of_unit_and_candidate = np.full((len(units), len(index)), -1)
+    feasible[pair_units, pair_candidates] = pair_feasible
+    score[pair_units, pair_candidates] = pair_rank
+    pair_of_unit_and_candidate[pair_units, pair_candidates] = np.arange(len(pair_units))
+
+    # each unit is assigned one of its best len(units) targets in an optimal assignment
+    # equal scores are ranked in the iteration order
+    candidate_count = min(len(units), feasible.shape[1])
+    if max_candidates is not None:
+        candidate_count = min(candidate_count, max_candidates)
+    ranked_score = np.where(feasible, score, -np.inf)
+    top_candidates = np.argsort(-ranked_score, axis=1, kind="stable")[:, :candidate_count]
+    candidates = np.unique(top_candidates[np.isfinite(
+        np.take_along_axis(ranked_score, top_candidates, axis=1))])
+
+    # any feasible target is preferred to staying
+    feasible = feasible[:, candidates]
+    score = score[:, candidates]
+    offset = 1 + 2 * np.abs(score[feasible]).max() if feasible.any() else 0
+    cost_matrix = np.where(feasible, -(score + offset), 0)
+    row_ind, col_ind = linear_sum_assignment(cost_matrix, deterministic=deterministic)
+
+    best_positions_and_values = {}
+    for unit in units:
+        best_positions_and_values[unit.id] = (unit.pos, (0, 0, 0, 0))
+    for unit_idx, candidate_idx in zip(row_ind, col_ind):
+        if not feasible[unit_idx, candidate_idx]:
+            continue
+        unit = units[unit_idx]
+        target = candidates[candidate_idx]
+        pair = pair_of_unit_and_candidate[unit_idx, target]
+        x, y = index.xs[target], index.ys[target]
+        best_positions_and_values[unit.id] = (Position(int(x), int(y)), (
+            target_bonus[pair],
+            resource_value[pair],
+            distance_from_edge[pair],
+            opponent_distance[pair]))
+        print("assigned", unit.id, unit.pos, "->", best_positions_and_values[unit.id][0])
+
+    return best_positions_and_values
+
+
+def lexicographic_rank(*keys) -> np.ndarray:
+    '''
+    Dense rank, starting from 1, of the tuples formed by the keys, compared as tuples are.
+    A higher rank is a better tuple, and equal tuples have the same rank.
+    '''
+    keys = [np.asarray(key, dtype=float) for key in keys]
+    if len(keys[0]) == 0:
+        return np.zeros(0)
+    # np.lexsort sorts by the last key first
+    order = np.lexsort(keys[::-1])
+    sorted_keys = np.stack([key[order] for key in keys])
+    new_tuple = np.concatenate([[True], (sorted_keys[:, 1:] != sorted_keys[:, :-1]).any(axis=0)])
+    rank = np.empty(len(order))
+    rank[order] = np.cumsum(new_tuple)
+    return rank
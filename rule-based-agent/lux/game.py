@@ -9,6 +9,7 @@ from .game_map import RESOURCE_TYPES, GameMap
 from .game_objects import Player, Unit, City
 from .game_position import Position
 from .game_constants import GAME_CONSTANTS
+from .profiler import profile_phase
 
 
 INPUT_CONSTANTS = Constants.INPUT_CONSTANTS
@@ -26,10 +27,89 @@ class Mission:
         return " ".join([str(self.target_position), self.target_action])
 
 
+class MissionTargetIndex:
+    def __init__(self, xy_to_resource_group_id: "DisjointSet", excluded_xy_set: Set[Tuple]):
+        # targets of the missions, kept up to date as missions are added and deleted
+        # excluded_xy_set (your city tiles) are not considered as targeted tiles
+        self.xy_to_resource_group_id = xy_to_resource_group_id
+        self.excluded_xy_set = excluded_xy_set
+
+        self.targeted_xy_count: DefaultDict[Tuple, int] = defaultdict(int)
+        self.targeted_for_building_xy_count: DefaultDict[Tuple, int] = defaultdict(int)
+
+        self.targeted_leaders: Set = set()
+        self.targeted_cluster_count = 0
+        self.targeted_xy_set: Set = set()
+        self.targeted_for_building_xy_set: Set = set()
+        self.resource_leader_to_targeting_units: DefaultDict[Tuple, Set[str]] = defaultdict(
+            set)
+
+        # the buildable sites of the turn, claimed and released as the targets for building change
+        self.buildable_sites: "BuildableSiteIndex" = None
+
+    def add(self, mission: Mission):
+        target_position = tuple(mission.target_position)
+
+        leader = self.xy_to_resource_group_id.find(target_position)
+        if leader not in self.targeted_leaders:
+            self.targeted_leaders.add(leader)
+            self.targeted_cluster_count += self.xy_to_resource_group_id.get_point(
+                leader) > 0
+        self.resource_leader_to_targeting_units[leader].add(mission.unit_id)
+
+        if target_position in self.excluded_xy_set:
+            return
+        self.targeted_xy_count[target_position] += 1
+        self.targeted_xy_set.add(target_position)
+        if mission.target_action and mission.target_action[:5] == "bcity":
+            self.targeted_for_building_xy_count[target_position] += 1
+            self.targeted_for_building_xy_set.add(target_position)
+            if self.buildable_sites is not None:
+                self.buildable_sites.claim(target_position)
+
+    def remove(self, mission: Mission):
+        target_position = tuple(mission.target_position)
+
+        leader = self.xy_to_resource_group_id.find(target_position)
+        self.resource_leader_to_targeting_units[leader].discard(
+            mission.unit_id)
+        if not self.resource_leader_to_targeting_units[leader]:
+            self.targeted_leaders.discard(leader)
+            self.targeted_cluster_count -= self.xy_to_resource_group_id.get_point(
+                leader) > 0
+
+        if target_position in self.excluded_xy_set:
+            return
+        self.targeted_xy_count[target_position] -= 1
+        if self.targeted_xy_count[target_position] == 0:
+            self.targeted_xy_set.discard(target_position)
+        if mission.target_action and mission.target_action[:5] == "bcity":
+            self.targeted_for_building_xy_count[target_position] -= 1
+            if self.targeted_for_building_xy_count[target_position] == 0:
+                self.targeted_for_building_xy_set.discard(target_position)
+                if self.buildable_sites is not None:
+                    self.buildable_sites.release(target_position)
+
+
 class Missions(defaultdict):
+    # rebuilt every turn by Game.repopulate_targets, not carried over when pickled
+    target_index: MissionTargetIndex = None
+
     def __init__(self):
         self: DefaultDict[str, Mission] = defaultdict(Mission)
 
+    def __setitem__(self, unit_id: str, mission: Mission):
+        if self.target_index is not None:
+            if unit_id in self:
+                self.target_index.remove(self[unit_id])
+            self.target_index.add(mission)
+        super().__setitem__(unit_id, mission)
+
+    def __delitem__(self, unit_id: str):
+        if self.target_index is not None:
+            self.target_index.remove(self[unit_id])
+        super().__delitem__(unit_id)
+
     def add(self, mission: Mission):
         self[mission.unit_id] = mission
 
@@ -128,11 +208,168 @@ class DisjointSet:
         return sum(self.points[leader] > 1 for leader in self.get_groups().keys())
 
 
+class CandidateTargetIndex:
+    '''
+    The tiles that may be targeted in the turn, which are those with a collectable resource on or beside them.
+    The candidates are listed in the iteration order, with the parts of the target score that do not depend on the unit.
+    They are also bucketed by position, to look up the candidates within the travel range of a unit.
+    '''
+
+    def __init__(self, game: "Game", bucket_size: int = 4):
+        self.map_width, self.map_height = game.map_width, game.map_height
+        self.bucket_size = bucket_size
+
+        xy_list = game.nonzero_xy(game.convolved_collectable_tiles_mask)
+        self.xs = np.array([x for x, _ in xy_list], dtype=int)
+        self.ys = np.array([y for _, y in xy_list], dtype=int)
+
+        # the cluster of every candidate
+        self.leader_matrix, self.leader_ids, self.leader_points = game.calculate_leader_matrix()
+        self.leaders = self.leader_matrix[self.ys, self.xs]
+
+        # prefer empty tile because you can build afterwards quickly
+        # no empty tile preference if resource is not wood
+        distance_from_buildable_tile = game.distance_from_buildable_tile[self.ys, self.xs]
+        wood_adjacent = (game.convolve(game.wood_amount_matrix > 0) > 0)[self.ys, self.xs]
+        empty_tile_bonus = np.where(
+            wood_adjacent,
+            1 / (0.5 + distance_from_buildable_tile),
+            1 / (0.5 + np.maximum(1, distance_from_buildable_tile)))
+
+        # the resource value is yet to be scaled by the distance from the unit
+        self.resource_value = empty_tile_bonus * \
+            game.convolved_collectable_tiles_matrix[self.ys, self.xs]
+        self.distance_from_edge = game.distance_from_edge[self.ys, self.xs]
+        self.opponent_distance = -game.distance_from_opponent_assets[self.ys, self.xs]
+
+        buckets: DefaultDict[Tuple, List[int]] = defaultdict(list)
+        for candidate, (x, y) in enumerate(xy_list):
+            buckets[x // bucket_size, y // bucket_size].append(candidate)
+        self.buckets: Dict[Tuple, np.ndarray] = {
+            bucket: np.array(candidates, dtype=int) for bucket, candidates in buckets.items()}
+
+    def __len__(self):
+        return len(self.xs)
+
+    def within(self, x: int, y: int, travel_range) -> np.ndarray:
+        # candidates within the manhattan distance, as the path distance is never shorter, in the iteration order
+        if travel_range < 0:
+            return np.zeros(0, dtype=int)
+        reach = int(travel_range)
+        min_bx, max_bx = max(0, x - reach) // self.bucket_size, min(self.map_width - 1, x + reach) // self.bucket_size
+        min_by, max_by = max(0, y - reach) // self.bucket_size, min(self.map_height - 1, y + reach) // self.bucket_size
+
+        candidates = [self.buckets[bx, by]
+                      for by in range(min_by, max_by + 1)
+                      for bx in range(min_bx, max_bx + 1)
+                      if (bx, by) in self.buckets]
+        if not candidates:
+            return np.zeros(0, dtype=int)
+        candidates = np.sort(np.concatenate(candidates))
+        in_range = np.abs(self.xs[candidates] - x) + np.abs(self.ys[candidates] - y) <= travel_range
+        return candidates[in_range]
+
+
+class BuildableSiteIndex:
+    '''
+    The tiles where a city tile may be built in the turn, which are the buildable tiles beside a collectable resource,
+    in the iteration order. The sites targeted for building are claimed, as the missions are added and deleted.
+    The nearest site from a position is memoized until the claims change.
+    '''
+
+    def __init__(self, game: "Game", targeted_for_building_xy_set: Set[Tuple]):
+        xy_list = game.nonzero_xy(
+            game.buildable_tile_mask & (game.distance_from_collectable_resource == 1))
+        self.xs = np.array([x for x, _ in xy_list], dtype=int)
+        self.ys = np.array([y for _, y in xy_list], dtype=int)
+        self.site_of_xy: Dict[Tuple, int] = {xy: site for site, xy in enumerate(xy_list)}
+        self.distance_matrix = game.distance_matrix
+
+        self.claimed = np.zeros(len(xy_list), dtype=bool)
+        for xy in targeted_for_building_xy_set:
+            if xy in self.site_of_xy:
+                self.claimed[self.site_of_xy[xy]] = True
+
+        # (x, y, current target) -> (x, y of the nearest site or None, distance)
+        self.nearest_sites: Dict[Tuple, Tuple] = {}
+
+    def claim(self, xy: Tuple):
+        if xy not in self.site_of_xy:
+            return
+        self.claimed[self.site_of_xy[xy]] = True
+        # only the results at the claimed site are changed, and the results without a current target are not
+        self.nearest_sites = {key: result for key, result in self.nearest_sites.items()
+                              if key[2] is None or result[0] != xy}
+
+    def release(self, xy: Tuple):
+        if xy not in self.site_of_xy:
+            return
+        self.claimed[self.site_of_xy[xy]] = False
+        self.nearest_sites = {key: result for key, result in self.nearest_sites.items() if key[2] is None}
+
+    def nearest(self, x: int, y: int, current_target_xy: Tuple = None) -> Tuple[Tuple, int]:
+        # the site with the shortest path distance, the first in the iteration order if tied
+        # claimed sites are only avoided by a unit with a current target, which may keep its own target
+        key = (x, y, current_target_xy)
+        if key not in self.nearest_sites:
+            allowed = np.ones(len(self.claimed), dtype=bool)
+            if current_target_xy is not None:
+                allowed = ~self.claimed
+                if current_target_xy in self.site_of_xy:
+                    allowed[self.site_of_xy[current_target_xy]] = True
+            sites = np.nonzero(allowed)[0]
+            if len(sites) == 0:
+                self.nearest_sites[key] = (None, 10**9+7)
+            else:
+                distances = self.distance_matrix[y, x, self.ys[sites], self.xs[sites]]
+                site = sites[np.argmin(distances)]
+                self.nearest_sites[key] = ((int(self.xs[site]), int(self.ys[site])), distances.min())
+        return self.nearest_sites[key]
+
+
+class XYSet:
+    '''
+    The set of (x, y) where the mask of the turn is True, with the items added in the iteration order.
+    It is only built when it is first accessed, and rebuilt when the mask is replaced.
+    '''
+
+    def __init__(self, mask_name: str):
+        self.mask_name = mask_name
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, game: "Game", owner=None) -> Set[Tuple]:
+        if game is None:
+            return self
+        mask = getattr(game, self.mask_name)
+        xy_sets = game.__dict__.setdefault("xy_sets", {})
+        if self.name not in xy_sets or xy_sets[self.name][0] is not mask:
+            xy_sets[self.name] = (mask, set(game.nonzero_xy(mask)))
+        return xy_sets[self.name][1]
+
+    def __set__(self, game: "Game", value):
+        raise AttributeError("{} is built from {}".format(self.name, self.mask_name))
+
+
 class Game:
 
     # counted from the time after the objects are saved to disk
     compute_start_time = -1
 
+    # built from the masks computed in calculate_matrix and calculate_resource_matrix
+    wood_exist_xy_set = XYSet("wood_exist_mask")
+    coal_exist_xy_set = XYSet("coal_exist_mask")
+    uranium_exist_xy_set = XYSet("uranium_exist_mask")
+    player_city_tile_xy_set = XYSet("player_city_tile_mask")
+    opponent_city_tile_xy_set = XYSet("opponent_city_tile_mask")
+    player_units_xy_set = XYSet("player_units_mask")
+    opponent_units_xy_set = XYSet("opponent_units_mask")
+    empty_tile_xy_set = XYSet("empty_tile_mask")
+    buildable_tile_xy_set = XYSet("buildable_tile_mask")
+    collectable_tiles_xy_set = XYSet("collectable_tiles_mask")
+    convolved_collectable_tiles_xy_set = XYSet("convolved_collectable_tiles_mask")
+
     def _initialize(self, messages):
         """
         initialize state
@@ -272,7 +509,7 @@ class Game:
         self.player.make_index_units_by_id()
         self.opponent.make_index_units_by_id()
 
-    def calculate_features(self, missions: Missions):
+    def calculate_features(self, missions: Missions, max_distance_sources: int = None):
 
         # load constants into object
         self.wood_fuel_rate = GAME_CONSTANTS["PARAMETERS"]["RESOURCE_TO_FUEL_RATE"][RESOURCE_TYPES.WOOD.upper(
@@ -304,84 +541,89 @@ class Game:
         self.calculate_matrix()
         self.calculate_resource_matrix()
         self.calculate_resource_groups()
-        self.calculate_distance_matrix()
+        self.calculate_distance_matrix(max_sources=max_distance_sources)
 
         self.repopulate_targets(missions)
 
         self.heuristics_from_positions: Dict = dict()
+        self.candidate_target_index: CandidateTargetIndex = None
+        self.buildable_site_index: BuildableSiteIndex = None
 
-    def init_matrix(self, default_value=0):
+    def init_matrix(self, default_value=0, dtype=None):
         # [TODO] check if order of map_height and map_width is correct
-        return np.full((self.map_height, self.map_width), default_value)
+        return np.full((self.map_height, self.map_width), default_value, dtype=dtype)
+
+    def init_mask(self, xy_list: List[Tuple]):
+        # boolean matrix that is True at the given (x, y)
+        mask = self.init_matrix(False, dtype=bool)
+        if xy_list:
+            xs, ys = zip(*xy_list)
+            mask[ys, xs] = True
+        return mask
 
+    @profile_phase("calculate_matrix")
     def calculate_matrix(self):
+        # the matrices are filled from the resources, units and city tiles of the turn
+        # without visiting every cell, 0/1 matrices are stored as int8
 
         # amount of resources left on the tile
-        self.wood_amount_matrix = self.init_matrix()
-        self.coal_amount_matrix = self.init_matrix()
-        self.uranium_amount_matrix = self.init_matrix()
-        self.all_resource_amount_matrix = self.init_matrix()
+        self.wood_amount_matrix = self.init_matrix(dtype=np.int32)
+        self.coal_amount_matrix = self.init_matrix(dtype=np.int32)
+        self.uranium_amount_matrix = self.init_matrix(dtype=np.int32)
+
+        resource_cells = [cell for cell in self.map.resource_cells if cell.has_resource()]
+        for resource_type, amount_matrix in [
+                [RESOURCE_TYPES.WOOD,       self.wood_amount_matrix],
+                [RESOURCE_TYPES.COAL,       self.coal_amount_matrix],
+                [RESOURCE_TYPES.URANIUM,    self.uranium_amount_matrix]]:
+            cells = [cell for cell in resource_cells if cell.resource.type == resource_type]
+            if cells:
+                xs = [cell.pos.x for cell in cells]
+                ys = [cell.pos.y for cell in cells]
+                amount_matrix[ys, xs] = [cell.resource.amount for cell in cells]
+
+        self.all_resource_amount_matrix = self.wood_amount_matrix + \
+            self.coal_amount_matrix + self.uranium_amount_matrix
+
+        # boolean masks, the xy sets are built from these
+        self.wood_exist_mask = self.wood_amount_matrix > 0
+        self.coal_exist_mask = self.coal_amount_matrix > 0
+        self.uranium_exist_mask = self.uranium_amount_matrix > 0
+        all_resource_exist_mask = self.all_resource_amount_matrix > 0
+
+        self.player_units_mask = self.init_mask(
+            [tuple(unit.pos) for unit in self.player.units])
+        self.opponent_units_mask = self.init_mask(
+            [tuple(unit.pos) for unit in self.opponent.units])
+
+        # a tile with resource is not counted as a city tile
+        self.player_city_tile_mask = self.init_mask(
+            [tuple(citytile.pos) for city in self.player.cities.values() for citytile in city.citytiles]) \
+            & ~all_resource_exist_mask
+        self.opponent_city_tile_mask = self.init_mask(
+            [tuple(citytile.pos) for city in self.opponent.cities.values() for citytile in city.citytiles]) \
+            & ~all_resource_exist_mask
 
-        self.player_city_tile_matrix = self.init_matrix()
-        self.opponent_city_tile_matrix = self.init_matrix()
-
-        self.player_units_matrix = self.init_matrix()
-        self.opponent_units_matrix = self.init_matrix()
+        # if you can build on tile (a unit may be on the tile)
+        self.buildable_tile_mask = ~(all_resource_exist_mask |
+                                     self.player_city_tile_mask | self.opponent_city_tile_mask)
 
         # if there is nothing on tile
-        self.empty_tile_matrix = self.init_matrix()
+        self.empty_tile_mask = self.buildable_tile_mask & \
+            ~(self.player_units_mask | self.opponent_units_mask)
 
-        # if you can build on tile (a unit may be on the tile)
-        self.buildable_tile_matrix = self.init_matrix()
-
-        for y in self.y_iteration_order:
-            for x in self.x_iteration_order:
-                cell = self.map.get_cell(x, y)
-
-                is_empty = True
-                is_buildable = True
-
-                if cell.unit:
-                    is_empty = False
-                    if cell.unit.team == self.player_id:
-                        self.player_units_matrix[y, x] += 1
-                    else:   # unit belongs to opponent
-                        self.opponent_units_matrix[y, x] += 1
-
-                if cell.has_resource():
-                    is_empty = False
-                    is_buildable = False
-                    if cell.resource.type == RESOURCE_TYPES.WOOD:
-                        self.wood_amount_matrix[y, x] += cell.resource.amount
-                    if cell.resource.type == RESOURCE_TYPES.COAL:
-                        self.coal_amount_matrix[y, x] += cell.resource.amount
-                    if cell.resource.type == RESOURCE_TYPES.URANIUM:
-                        self.uranium_amount_matrix[y,
-                                                   x] += cell.resource.amount
-                    self.all_resource_amount_matrix[y,
-                                                    x] += cell.resource.amount
-
-                elif cell.citytile:
-                    is_empty = False
-                    is_buildable = False
-                    if cell.citytile.team == self.player_id:
-                        self.player_city_tile_matrix[y, x] += 1
-                    else:   # city tile belongs to opponent
-                        self.opponent_city_tile_matrix[y, x] += 1
-
-                if is_empty:
-                    self.empty_tile_matrix[y, x] += 1
-
-                if is_buildable:
-                    self.buildable_tile_matrix[y, x] += 1
+        self.player_city_tile_matrix = self.player_city_tile_mask.astype(np.int8)
+        self.opponent_city_tile_matrix = self.opponent_city_tile_mask.astype(np.int8)
+        self.player_units_matrix = self.player_units_mask.astype(np.int8)
+        self.opponent_units_matrix = self.opponent_units_mask.astype(np.int8)
+        self.empty_tile_matrix = self.empty_tile_mask.astype(np.int8)
+        self.buildable_tile_matrix = self.buildable_tile_mask.astype(np.int8)
 
         # binary matrices
-        self.wood_exist_matrix = (self.wood_amount_matrix > 0).astype(int)
-        self.coal_exist_matrix = (self.coal_amount_matrix > 0).astype(int)
-        self.uranium_exist_matrix = (
-            self.uranium_amount_matrix > 0).astype(int)
-        self.all_resource_exist_matrix = (
-            self.all_resource_amount_matrix > 0).astype(int)
+        self.wood_exist_matrix = self.wood_exist_mask.astype(np.int8)
+        self.coal_exist_matrix = self.coal_exist_mask.astype(np.int8)
+        self.uranium_exist_matrix = self.uranium_exist_mask.astype(np.int8)
+        self.all_resource_exist_matrix = all_resource_exist_mask.astype(np.int8)
 
         # positive if on empty cell and beside the resource
         self.wood_side_matrix = self.convolve(
@@ -393,37 +635,18 @@ class Game:
 
         self.convert_into_sets()
 
+    def nonzero_xy(self, matrix) -> List[Tuple]:
+        # (x, y) of the nonzero items in the matrix, in the iteration order
+        ys, xs = np.nonzero(matrix[np.ix_(self.y_iteration_order, self.x_iteration_order)])
+        return list(zip(np.take(self.x_iteration_order, xs).tolist(),
+                        np.take(self.y_iteration_order, ys).tolist()))
+
     def populate_set(self, matrix, set_object):
         # modifies the set_object in place and add nonzero items in the matrix
-        for y in self.y_iteration_order:
-            for x in self.x_iteration_order:
-                if matrix[y, x] > 0:
-                    set_object.add((x, y))
+        set_object.update(self.nonzero_xy(matrix))
 
     def convert_into_sets(self):
-        self.wood_exist_xy_set = set()
-        self.coal_exist_xy_set = set()
-        self.uranium_exist_xy_set = set()
-        self.player_city_tile_xy_set = set()
-        self.opponent_city_tile_xy_set = set()
-        self.player_units_xy_set = set()
-        self.opponent_units_xy_set = set()
-        self.empty_tile_xy_set = set()
-        self.buildable_tile_xy_set = set()
-
-        for set_object, matrix in [
-            [self.wood_exist_xy_set,            self.wood_exist_matrix],
-            [self.coal_exist_xy_set,            self.coal_exist_matrix],
-            [self.uranium_exist_xy_set,         self.uranium_exist_matrix],
-            [self.player_city_tile_xy_set,      self.player_city_tile_matrix],
-            [self.opponent_city_tile_xy_set,    self.opponent_city_tile_matrix],
-            [self.player_units_xy_set,          self.player_units_matrix],
-            [self.opponent_units_xy_set,        self.opponent_units_matrix],
-            [self.empty_tile_xy_set,            self.empty_tile_matrix],
-                [self.buildable_tile_xy_set,        self.buildable_tile_matrix]]:
-
-            self.populate_set(matrix, set_object)
-
+        # the xy sets of the masks, such as player_city_tile_xy_set, are built when accessed, see XYSet
         self.xy_out_of_map: Set = set()
         for y in [-1, self.map_height]:
             for x in range(self.map_width):
@@ -437,11 +660,13 @@ class Game:
         # occupied by enemy units or city - yes
         # occupied by self unit not in city - yes
         # occupied by self city - no (even if there are units)
+        # built from the xy sets rather than the masks, so that the iteration order is unchanged
         self.occupied_xy_set = (self.player_units_xy_set | self.opponent_units_xy_set |
                                 self.opponent_city_tile_xy_set | self.xy_out_of_map) \
             - self.player_city_tile_xy_set
 
-    def calculate_distance_matrix(self, blockade_multiplier_value=100):
+    @profile_phase("calculate_distance_matrix")
+    def calculate_distance_matrix(self, blockade_multiplier_value=100, max_sources: int = None):
         self.distance_from_edge = self.init_matrix(
             self.map_height + self.map_width)
         for y in range(self.map_height):
@@ -502,9 +727,27 @@ class Game:
         self.distance_matrix = np.full(
             (self.map_height, self.map_width, self.map_height, self.map_width), 1001)
 
+        # if the time is short, only the first max_sources positions in the order of the units are searched
+        # the distances from the other positions are estimated with the manhattan distance
+        self.searched_distance_sources = self.positions_to_calculate_distances_from
+        if max_sources is not None:
+            self.searched_distance_sources = set()
+            for unit in self.player.units:
+                x, y = tuple(unit.pos)
+                for xy in [(x, y), (x+1, y), (x-1, y), (x, y+1), (x, y-1)]:
+                    if len(self.searched_distance_sources) >= max_sources:
+                        break
+                    if xy in self.positions_to_calculate_distances_from and xy not in self.xy_out_of_map:
+                        self.searched_distance_sources.add(xy)
+
+            ys, xs = np.indices((self.map_height, self.map_width))
+            for sx, sy in self.positions_to_calculate_distances_from - self.searched_distance_sources:
+                if (sx, sy) not in self.xy_out_of_map:
+                    self.distance_matrix[sy, sx] = np.abs(ys - sy) + np.abs(xs - sx)
+
         for sy in range(self.map_height):
             for sx in range(self.map_width):
-                if (sx, sy) not in self.positions_to_calculate_distances_from:
+                if (sx, sy) not in self.searched_distance_sources:
                     continue
                 blockade_multiplier_value_for_syx = blockade_multiplier_value
                 if (sx, sy) in self.player_units_xy_set:
@@ -549,6 +792,7 @@ class Game:
         new_matrix[:, 1:] += matrix[:, :-1]
         return new_matrix
 
+    @profile_phase("calculate_resource_matrix")
     def calculate_resource_matrix(self):
         # calculate value of the resource considering the reasearch level
         self.collectable_tiles_matrix = self.wood_exist_matrix
@@ -563,96 +807,120 @@ class Game:
         self.convolved_collectable_tiles_matrix = self.convolve(
             self.collectable_tiles_matrix)
 
-        self.collectable_tiles_xy_set = set()  # exclude adjacent
-        self.populate_set(self.collectable_tiles_matrix,
-                          self.collectable_tiles_xy_set)
-        self.convolved_collectable_tiles_xy_set = set()  # include adjacent
-        self.populate_set(self.convolved_collectable_tiles_matrix,
-                          self.convolved_collectable_tiles_xy_set)
+        # collectable_tiles_xy_set excludes adjacent, convolved_collectable_tiles_xy_set includes adjacent
+        self.collectable_tiles_mask = self.collectable_tiles_matrix > 0
+        self.convolved_collectable_tiles_mask = self.convolved_collectable_tiles_matrix > 0
 
+    @profile_phase("calculate_resource_groups")
     def calculate_resource_groups(self):
         # compute join the resource cluster and calculate the amount of resource
         self.xy_to_resource_group_id: DisjointSet = DisjointSet()
-        for y in self.y_iteration_order:
-            for x in self.x_iteration_order:
-                if (x, y) in self.collectable_tiles_xy_set:
-                    if (x, y) in self.wood_exist_xy_set or (x, y) in self.uranium_exist_xy_set:
-                        self.xy_to_resource_group_id.find((x, y), point=5)
-                    else:
-                        self.xy_to_resource_group_id.find((x, y), point=1)
-
-        for y in self.y_iteration_order:
-            for x in self.x_iteration_order:
-                if (x, y) in self.collectable_tiles_xy_set:
-                    for dy, dx in [(1, 0), (0, 1), (-1, 0), (0, -1)]:
-                        xx, yy = x+dx, y+dy
-                        if 0 <= yy < self.map_height and 0 <= xx < self.map_width:
-                            self.xy_to_resource_group_id.union(
-                                (x, y), (xx, yy))
+        collectable_xy_list = self.nonzero_xy(self.collectable_tiles_mask)
+        for x, y in collectable_xy_list:
+            if self.wood_exist_mask[y, x] or self.uranium_exist_mask[y, x]:
+                self.xy_to_resource_group_id.find((x, y), point=5)
+            else:
+                self.xy_to_resource_group_id.find((x, y), point=1)
+
+        for x, y in collectable_xy_list:
+            for dy, dx in [(1, 0), (0, 1), (-1, 0), (0, -1)]:
+                xx, yy = x+dx, y+dy
+                if 0 <= yy < self.map_height and 0 <= xx < self.map_width:
+                    self.xy_to_resource_group_id.union(
+                        (x, y), (xx, yy))
+
+    def calculate_leader_matrix(self):
+        # index the cluster leader of every tile, and the points of every cluster
+        leader_ids: Dict[Tuple, int] = {}
+        leader_matrix = self.init_matrix()
+        for y in range(self.map_height):
+            for x in range(self.map_width):
+                leader = self.xy_to_resource_group_id.find((x, y))
+                leader_matrix[y, x] = leader_ids.setdefault(
+                    leader, len(leader_ids))
+
+        leader_points = np.zeros(len(leader_ids))
+        for leader, leader_id in leader_ids.items():
+            leader_points[leader_id] = self.xy_to_resource_group_id.points[leader]
+
+        return leader_matrix, leader_ids, leader_points
+
+    def count_units_by_leader(self, leader_ids: Dict[Tuple, int]):
+        # the units mining, and the units targeting or mining, on every cluster
+        leader_units_mining = np.zeros(len(leader_ids), dtype=int)
+        leader_units_targeting_or_mining = np.zeros(len(leader_ids), dtype=int)
+        for leader in set(self.resource_leader_to_locating_units) | set(self.resource_leader_to_targeting_units):
+            if leader not in leader_ids:
+                continue
+            locating_units = self.resource_leader_to_locating_units.get(
+                leader, set())
+            targeting_units = self.resource_leader_to_targeting_units.get(
+                leader, set())
+            leader_units_mining[leader_ids[leader]] = len(
+                locating_units & targeting_units)
+            leader_units_targeting_or_mining[leader_ids[leader]] = len(
+                locating_units | targeting_units)
+
+        return leader_units_mining, leader_units_targeting_or_mining
+
+    def get_candidate_target_index(self) -> CandidateTargetIndex:
+        # built on the first use in the turn, after the clusters and the distances are calculated
+        if self.candidate_target_index is None:
+            self.candidate_target_index = CandidateTargetIndex(self)
+        return self.candidate_target_index
+
+    def get_buildable_site_index(self) -> BuildableSiteIndex:
+        # built on the first use in the turn, the targets for building are then kept up to date by the missions
+        if self.buildable_site_index is None:
+            self.buildable_site_index = BuildableSiteIndex(self, self.targeted_for_building_xy_set)
+            self.mission_target_index.buildable_sites = self.buildable_site_index
+        return self.buildable_site_index
 
     def repopulate_targets(self, missions: Missions):
         # with missions, populate the following objects for use
         # probably these attributes belong to missions, but left it here to avoid circular imports
-        pos_list = missions.get_targets()
-        self.targeted_leaders: Set = set(
-            self.xy_to_resource_group_id.find(tuple(pos)) for pos in pos_list)
-        self.targeted_cluster_count = sum(self.xy_to_resource_group_id.get_point(
-            (x, y)) > 0 for x, y in self.targeted_leaders)
-        self.targeted_xy_set: Set = set(
-            tuple(pos) for pos in pos_list) - self.player_city_tile_xy_set
-
-        pos_and_action_list = missions.get_targets_and_actions()
-        self.targeted_for_building_xy_set: Set = \
-            set(tuple(pos) for pos,
-                action in pos_and_action_list if action and action[:5] == "bcity") - self.player_city_tile_xy_set
-
-        self.resource_leader_to_locating_units: DefaultDict[Tuple, Set[str]] = defaultdict(
-            set)
-        for unit_id in self.player.units_by_id:
-            unit: Unit = self.player.units_by_id[unit_id]
-            current_position = tuple(unit.pos)
-            leader = self.xy_to_resource_group_id.find(current_position)
-            if leader:
-                self.resource_leader_to_locating_units[leader].add(unit_id)
-
-        self.resource_leader_to_targeting_units: DefaultDict[Tuple, Set[str]] = defaultdict(
-            set)
-        for unit_id in missions:
-            mission: Mission = missions[unit_id]
-            target_position = tuple(mission.target_position)
-            leader = self.xy_to_resource_group_id.find(target_position)
-            if leader:
-                self.resource_leader_to_targeting_units[leader].add(unit_id)
+        # the index is rebuilt once per turn, afterwards Missions keeps it up to date
+        # and the attributes below are views of the index
+        index = missions.target_index
+        if index is None or index.xy_to_resource_group_id is not self.xy_to_resource_group_id:
+            index = MissionTargetIndex(
+                self.xy_to_resource_group_id, self.player_city_tile_xy_set)
+            for mission in missions.values():
+                index.add(mission)
+            missions.target_index = index
+
+            self.resource_leader_to_locating_units: DefaultDict[Tuple, Set[str]] = defaultdict(
+                set)
+            for unit_id in self.player.units_by_id:
+                unit: Unit = self.player.units_by_id[unit_id]
+                current_position = tuple(unit.pos)
+                leader = self.xy_to_resource_group_id.find(current_position)
+                if leader:
+                    self.resource_leader_to_locating_units[leader].add(unit_id)
+
+        self.mission_target_index: MissionTargetIndex = index
+        self.targeted_leaders: Set = index.targeted_leaders
+        self.targeted_xy_set: Set = index.targeted_xy_set
+        self.targeted_for_building_xy_set: Set = index.targeted_for_building_xy_set
+        self.resource_leader_to_targeting_units: DefaultDict[Tuple, Set[str]] = \
+            index.resource_leader_to_targeting_units
+
+    @property
+    def targeted_cluster_count(self) -> int:
+        return self.mission_target_index.targeted_cluster_count
 
     def get_nearest_empty_tile_and_distance(self, current_position: Position, current_target: Position = None) -> Tuple[Position, int]:
         if self.all_resource_amount_matrix[current_position.y, current_position.x] == 0:
             if tuple(current_position) not in self.player_city_tile_xy_set:
                 return current_position, 0
 
-        nearest_distance = 10**9+7
-        nearest_position: Position = current_position
-
-        for y in self.y_iteration_order:
-            for x in self.x_iteration_order:
-                if (x, y) not in self.buildable_tile_xy_set:
-                    continue
-
-                if (x, y) in self.targeted_for_building_xy_set:
-                    # we allow units to build at a tile that is targeted but not for building
-                    if current_target and (x, y) != tuple(current_target):
-                        continue
-
-                # only build beside a collectable resource
-                if self.distance_from_collectable_resource[y, x] != 1:
-                    continue
-
-                position = Position(x, y)
-                distance = self.retrieve_distance(
-                    current_position.x, current_position.y, position.x, position.y)
-
-                # update best location
-                if distance < nearest_distance:
-                    nearest_distance = distance
-                    nearest_position = position
+        # only build beside a collectable resource
+        # with a current target, the tiles targeted for building by other units are avoided
+        current_target_xy = tuple(current_target) if current_target else None
+        nearest_xy, nearest_distance = self.get_buildable_site_index().nearest(
+            current_position.x, current_position.y, current_target_xy)
 
+        nearest_position: Position = current_position
+        if nearest_xy is not None:
+            nearest_position = Position(*nearest_xy)
         return nearest_position, nearest_distance
@@ -34,6 +34,8 @@ class GameMap:
             self.map[y] = [None] * width
             for x in range(0, self.width):
                 self.map[y][x] = Cell(x, y)
+        # cells that were given a resource, to avoid visiting every cell
+        self.resource_cells: List[Cell] = []
 
     def get_cell_by_pos(self, pos) -> Cell:
         return self.map[pos.y][pos.x]
@@ -47,3 +49,4 @@ class GameMap:
         """
         cell = self.get_cell(x, y)
         cell.resource = Resource(r_type, amount)
+        self.resource_cells.append(cell)
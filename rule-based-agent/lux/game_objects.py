@@ -2,7 +2,7 @@ import random
 from typing import Dict
 
 from .constants import Constants
-from .game_map import Position
+from .game_position import Position
 from .game_constants import GAME_CONSTANTS
 
 UNIT_TYPES = Constants.UNIT_TYPES
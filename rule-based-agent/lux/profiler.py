@@ -0,0 +1,99 @@
+import csv
+import functools
+import json
+import os
+import time
+
+import numpy as np
+
+from collections import defaultdict
+from typing import DefaultDict, Dict, List
+
+
+# upper edges of the histogram bins in seconds, the last bins are around the actTimeout of 3 seconds
+HISTOGRAM_BINS = [0, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 3, float("inf")]
+
+
+class Profiler:
+    '''
+    Times the phases of game_logic in every turn, decorate a phase with profile_phase.
+    When disabled, a profiled call costs an attribute lookup.
+    '''
+
+    def __init__(self):
+        self.enabled = False
+        self.phases: List[str] = []
+        self.turns: List[int] = []
+        self.durations: List[DefaultDict[str, float]] = []
+        self.calls: List[DefaultDict[str, int]] = []
+
+    def start_turn(self, turn: int):
+        if not self.enabled:
+            return
+        self.turns.append(turn)
+        self.durations.append(defaultdict(float))
+        self.calls.append(defaultdict(int))
+
+    def record(self, phase: str, duration: float):
+        if phase not in self.phases:
+            self.phases.append(phase)
+        if not self.turns:
+            # called outside of the agent, e.g. from a notebook
+            self.start_turn(-1)
+        self.durations[-1][phase] += duration
+        self.calls[-1][phase] += 1
+
+    def summary(self) -> Dict[str, Dict]:
+        # distribution of the time spent on each phase per turn
+        summary = {}
+        for phase in self.phases:
+            durations = np.array([durations[phase] for durations in self.durations])
+            histogram, _ = np.histogram(durations, bins=HISTOGRAM_BINS)
+            summary[phase] = {
+                "calls": sum(calls[phase] for calls in self.calls),
+                "total": float(durations.sum()),
+                "mean": float(durations.mean()),
+                "median": float(np.median(durations)),
+                "p90": float(np.percentile(durations, 90)),
+                "p99": float(np.percentile(durations, 99)),
+                "max": float(durations.max()),
+                "histogram_bins": HISTOGRAM_BINS[1:],
+                "histogram_counts": histogram.tolist(),
+            }
+        return summary
+
+    def dump(self, profile_dir: str, player_id: int = 0):
+        # writes the summary as json and the time of each phase per turn as csv
+        if not self.turns:
+            return
+        os.makedirs(profile_dir, exist_ok=True)
+
+        with open(os.path.join(profile_dir, "profile-{}.json".format(player_id)), "w") as f:
+            json.dump(self.summary(), f, indent=2)
+
+        with open(os.path.join(profile_dir, "profile-{}.csv".format(player_id)), "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["turn"] + self.phases)
+            for turn, durations in zip(self.turns, self.durations):
+                writer.writerow([turn] + ["{:.6f}".format(durations[phase]) for phase in self.phases])
+
+    def reset(self):
+        self.phases, self.turns, self.durations, self.calls = [], [], [], []
+
+
+profiler = Profiler()
+
+
+def profile_phase(phase: str):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not profiler.enabled:
+                return func(*args, **kwargs)
+            start_time = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profiler.record(phase, time.perf_counter() - start_time)
+        return wrapper
+    return decorator
@@ -0,0 +1,111 @@
+import atexit
+import gzip
+import os
+import pickle
+import queue
+import threading
+
+from .game import Game, Missions
+
+
+# the attributes that are not rebuilt by Game._update, everything else is recomputed from the observation
+INITIAL_ATTRIBUTES = [
+    "player_id",
+    "turn",
+    "map_width",
+    "map_height",
+    "x_iteration_order",
+    "y_iteration_order",
+    "x_order_coefficient",
+    "y_order_coefficient",
+    "dirs",
+    "dirs_dxdy",
+]
+
+
+def snapshot_path(step: int, player_id: int, snapshot_dir: str = "snapshots") -> str:
+    str_step = str(step).zfill(3)
+    return os.path.join(snapshot_dir, 'snapshot-{}-{}.pkl.gz'.format(str_step, player_id))
+
+
+class SnapshotWriter:
+    '''
+    Saves the observation and the missions of every turn to snapshot_dir, for debugging.
+    Saving is disabled if snapshot_dir is empty.
+
+    The game state is not saved, as it is rebuilt from the observation by load_snapshot.
+    The snapshot is serialised when queued and compressed and written from a background thread.
+    If the queue is full the snapshot is dropped rather than delaying the turn.
+    '''
+
+    def __init__(self, snapshot_dir: str = "", max_queue_size: int = 16):
+        self.snapshot_dir = snapshot_dir
+        self.enabled = bool(snapshot_dir)
+        self.dropped_count = 0
+
+        self.queue: queue.Queue = queue.Queue(maxsize=max_queue_size)
+        if self.enabled:
+            os.makedirs(snapshot_dir, exist_ok=True)
+            self.thread = threading.Thread(target=self._write_snapshots, daemon=True)
+            self.thread.start()
+            atexit.register(self.flush)
+
+    def save(self, observation, game_state: Game, missions: Missions):
+        if not self.enabled:
+            return
+
+        # serialised now, because the missions are modified during the turn
+        snapshot = {
+            "observation": dict(observation),
+            "game_state": {attribute: getattr(game_state, attribute) for attribute in INITIAL_ATTRIBUTES},
+            "missions": missions,
+        }
+        data = pickle.dumps(snapshot, protocol=pickle.HIGHEST_PROTOCOL)
+        path = snapshot_path(observation["step"], game_state.player_id, self.snapshot_dir)
+
+        try:
+            self.queue.put_nowait((path, data))
+        except queue.Full:
+            self.dropped_count += 1
+
+    def flush(self):
+        # wait until the queued snapshots are written
+        if self.enabled:
+            self.queue.join()
+
+    def _write_snapshots(self):
+        while True:
+            path, data = self.queue.get()
+            try:
+                with open(path, 'wb') as handle:
+                    handle.write(gzip.compress(data, compresslevel=6))
+            finally:
+                self.queue.task_done()
+
+
+def load_snapshot(step: int, player_id: int = 0, snapshot_dir: str = "snapshots"):
+    '''
+    Returns the observation, the game state and the missions at the start of the turn,
+    as they were passed to game_logic.
+    '''
+    with open(snapshot_path(step, player_id, snapshot_dir), 'rb') as handle:
+        snapshot = pickle.loads(gzip.decompress(handle.read()))
+
+    observation = snapshot["observation"]
+    game_state_attributes = snapshot["game_state"]
+
+    game_state = Game()
+    game_state._initialize([
+        str(game_state_attributes["player_id"]),
+        "{} {}".format(game_state_attributes["map_width"], game_state_attributes["map_height"])])
+    for attribute, value in game_state_attributes.items():
+        setattr(game_state, attribute, value)
+
+    # replay the update of the turn
+    game_state.turn -= 1
+    if observation["step"] == 0:
+        game_state._update(observation["updates"][2:])
+    else:
+        game_state._update(observation["updates"])
+
+    return observation, game_state, snapshot["missions"]
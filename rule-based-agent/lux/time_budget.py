@@ -0,0 +1,114 @@
+import logging
+import time
+
+from typing import List, Optional, Tuple
+
+from .game_constants import GAME_CONSTANTS
+
+
+logger = logging.getLogger(__name__)
+
+# Kaggle defaults, used when the observation or configuration do not provide them
+DEFAULT_ACT_TIMEOUT = 3
+DEFAULT_OVERAGE_TIME = 60
+
+# seconds kept in reserve for the unit actions, the annotations and the overhead of the environment
+SAFETY_MARGIN = 0.5
+
+# share of the time left that the distance matrix may use, the rest is left for the missions and actions
+DISTANCE_MATRIX_SHARE = 0.5
+
+# the missions are planned with a coarse candidate set if their estimated time exceeds this share of the time left
+MISSIONS_SHARE = 0.5
+
+# number of candidate targets for each unit when planning coarsely
+COARSE_CANDIDATE_COUNT = 2
+
+# weight of the latest measurement in the running estimates
+ESTIMATE_WEIGHT = 0.5
+
+
+class TimeBudget:
+    '''
+    Keeps track of the time allowed for the turn, from the actTimeout and the overage time left,
+    and decides how much of the game logic the turn can afford.
+
+    The costs of the distance matrix and of the mission planning are estimated from the previous turns.
+    When the turn cannot afford them, game_logic degrades in this order
+    - fewer Dijkstra sources for the distance matrix, the other sources use the manhattan distance
+    - a coarse candidate set of targets in find_best_clusters
+    - the missions of the last turn are kept and no new missions are planned
+    Every degradation is logged, and kept in degradations.
+    '''
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.turn = -1
+        self.deadline = float("inf")
+        self.degradations: List[Tuple[int, str, str]] = []
+
+        # running estimates, None until measured
+        self.seconds_per_distance_source: Optional[float] = None
+        self.seconds_per_unit_mission: Optional[float] = None
+
+    def start_turn(self, observation, configuration=None, start_time: float = None):
+        # start_time is when the observation was received
+        if start_time is None:
+            start_time = time.time()
+        self.turn = observation["step"]
+
+        act_timeout = DEFAULT_ACT_TIMEOUT
+        if configuration is not None and "actTimeout" in configuration:
+            act_timeout = configuration["actTimeout"]
+        remaining_overage_time = observation.get("remainingOverageTime", DEFAULT_OVERAGE_TIME)
+
+        # the overage time is spread over the turns left
+        turns_left = max(1, GAME_CONSTANTS["PARAMETERS"]["MAX_DAYS"] - self.turn)
+        self.deadline = start_time + act_timeout + remaining_overage_time / turns_left - SAFETY_MARGIN
+
+    def time_left(self) -> float:
+        return self.deadline - time.time()
+
+    def max_distance_sources(self) -> Optional[int]:
+        # number of Dijkstra sources that can be afforded, None if there is no limit
+        if not self.enabled or self.seconds_per_distance_source is None:
+            return None
+        allowed_time = max(0, self.time_left()) * DISTANCE_MATRIX_SHARE
+        return int(allowed_time / self.seconds_per_distance_source)
+
+    def record_distance_matrix(self, duration: float, source_count: int):
+        if source_count > 0:
+            self.seconds_per_distance_source = self.update_estimate(
+                self.seconds_per_distance_source, duration / source_count)
+
+    def mission_planning(self, unit_count: int) -> str:
+        # "full", "coarse" or "reuse"
+        if not self.enabled or self.seconds_per_unit_mission is None:
+            return "full"
+        time_left = self.time_left()
+        if time_left <= 0:
+            return "reuse"
+        estimated_time = self.seconds_per_unit_mission * unit_count
+        if estimated_time > time_left:
+            return "reuse"
+        if estimated_time > time_left * MISSIONS_SHARE:
+            return "coarse"
+        return "full"
+
+    def record_missions(self, duration: float, unit_count: int):
+        if unit_count > 0:
+            self.seconds_per_unit_mission = self.update_estimate(
+                self.seconds_per_unit_mission, duration / unit_count)
+
+    def degrade(self, phase: str, message: str):
+        self.degradations.append((self.turn, phase, message))
+        logger.warning("turn %d %s degraded: %s (%.3fs left)", self.turn, phase, message, self.time_left())
+
+    def degradations_this_turn(self) -> List[Tuple[int, str, str]]:
+        return [degradation for degradation in self.degradations if degradation[0] == self.turn]
+
+    @staticmethod
+    def update_estimate(estimate: Optional[float], measurement: float) -> float:
+        if estimate is None:
+            return measurement
+        return ESTIMATE_WEIGHT * measurement + (1 - ESTIMATE_WEIGHT) * estimate
@@ -1,3 +1,3 @@
 [ -e submission.tar.gz ] && rm -- submission.tar.gz
-tar --exclude='*.ipynb' --exclude="*.pyc" --exclude="*.pkl" -czf submission.tar.gz *
+tar --exclude='*.ipynb' --exclude="*.pyc" --exclude="*.pkl" --exclude="*.pkl.gz" -czf submission.tar.gz *
 python3 generate_notebook.py
\ No newline at end of file
@@ -0,0 +1,52 @@
+import copy
+import os
+
+import pytest
+
+from agent import game_logic
+from benchmark import load_from_episode
+from lux.game import Mission
+from lux.game_map import Position
+from lux.time_budget import TimeBudget
+
+EPISODE_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "imitation-learning", "lux-episodes", "26690069.json")
+
+
+def exhausted_time_budget(step: int) -> TimeBudget:
+    # a budget that cannot afford to plan the missions of any unit
+    time_budget = TimeBudget()
+    time_budget.start_turn({"step": step, "remainingOverageTime": 0})
+    time_budget.seconds_per_unit_mission = 1e9
+    return time_budget
+
+
+@pytest.fixture(scope="module")
+def recorded_turn():
+    return load_from_episode(EPISODE_PATH, 40)
+
+
+@pytest.fixture
+def turn(recorded_turn):
+    return copy.deepcopy(recorded_turn)
+
+
+def test_reused_missions_of_dead_units(turn):
+    """Test that the missions of the last turn are kept without the missions of the units that have died"""
+    game_state, missions = turn
+    unit = game_state.player.units[0]
+    missions.add(Mission("u_dead", Position(unit.pos.x, unit.pos.y)))
+    time_budget = exhausted_time_budget(game_state.turn)
+
+    actions, game_state, missions = game_logic(game_state, missions, time_budget=time_budget)
+    assert [phase for _, phase, _ in time_budget.degradations_this_turn()] == ["make_unit_missions"]
+    assert "u_dead" not in missions
+    assert set(missions) <= set(game_state.player.units_by_id)
+    assert not any("u_dead" in action for action in actions)
+
+
+def test_deterministic_game_logic_is_not_degraded(turn):
+    """Test that a deterministic game logic does not depend on the time left"""
+    game_state, missions = turn
+    time_budget = exhausted_time_budget(game_state.turn)
+    game_logic(game_state, missions, deterministic=True, time_budget=time_budget)
+    assert time_budget.degradations == []
@@ -0,0 +1,25 @@
+import gzip
+import json
+import os
+
+from equivalence import EPISODE_DIR, REFERENCE_EPISODE, REFERENCE_PATH, hashed, replay
+
+
+def test_features_and_actions_match_reference():
+    """
+    Test that the matrices, the xy sets in insertion order, the resource groups and the actions of each turn
+    of a recorded episode are identical to the stored reference, see equivalence.py
+    """
+    with gzip.open(REFERENCE_PATH, "rt") as f:
+        reference = json.load(f)
+
+    records = replay(os.path.join(EPISODE_DIR, "{}.json".format(REFERENCE_EPISODE)))
+
+    for player_id, turns in records.items():
+        reference_turns = reference[str(player_id)]
+        assert len(turns) == len(reference_turns)
+        for turn, (turn_hashes, reference_hashes) in enumerate(zip(hashed(turns), reference_turns)):
+            different = sorted(name for name, value in reference_hashes.items() if turn_hashes.get(name) != value)
+            # the missions diverge after the first mismatch, the later turns are not compared
+            assert not different, "player {} turn {}: {} differ from the reference".format(
+                player_id, turn, ", ".join(different))
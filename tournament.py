@@ -0,0 +1,313 @@
+"""
+Play a local tournament between two agents on seeded maps, with the games run in parallel.
+
+An agent is given as path/to/agent.py:function, as a directory containing agent.py,
+or as a submission snapshot made with rule-based-agent/submission.sh (submission.tar.gz).
+Each agent runs in its own process, so agents with different lux packages can play each other.
+Every map is played twice, with the agents swapping sides.
+
+    python tournament.py rule-based-agent/agent.py:agent imitation-learning/agent.py:agent --games 20 --workers 4
+
+The games are played with kaggle_environments (see setup.sh), which runs offline.
+A row is appended to games.csv and games.jsonl as each game finishes, and summary.json is
+rewritten with the win rate, city tiles and per-turn latency of each agent.
+"""
+import argparse
+import concurrent.futures
+import csv
+import importlib.util
+import json
+import os
+import select
+import subprocess
+import sys
+import tarfile
+import time
+import traceback
+
+import numpy as np
+
+from typing import Dict, List, Tuple
+
+
+# upper edges of the latency histogram bins in seconds, the actTimeout is 3 seconds
+LATENCY_BINS = [0, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 3, float("inf")]
+
+# seconds to wait for an agent beyond its actTimeout and overage time before giving up on it
+RESPONSE_SLACK = 5
+
+CSV_FIELDS = [
+    "game", "seed", "width", "height", "turns", "winner",
+    "agent_0", "agent_1", "status_0", "status_1", "reward_0", "reward_1",
+    "city_tiles_0", "city_tiles_1", "units_0", "units_1",
+    "latency_mean_0", "latency_mean_1", "latency_max_0", "latency_max_1",
+]
+
+
+def resolve_agent(spec: str, snapshot_dir: str) -> str:
+    # returns the absolute path/to/agent.py:function of the agent, snapshots are unpacked into snapshot_dir
+    function_name = "agent"
+    if ":" in spec:
+        spec, function_name = spec.rsplit(":", 1)
+
+    if spec.endswith(".tar.gz"):
+        directory = os.path.join(snapshot_dir, os.path.basename(spec)[:-len(".tar.gz")])
+        with tarfile.open(spec) as archive:
+            archive.extractall(directory)
+        spec = directory
+
+    if os.path.isdir(spec):
+        spec = os.path.join(spec, "agent.py")
+    if not os.path.isfile(spec):
+        raise FileNotFoundError("agent not found: {}".format(spec))
+    return "{}:{}".format(os.path.abspath(spec), function_name)
+
+
+class Observation(dict):
+    # the kaggle observation allows attribute access, e.g. observation.player
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+def serve(spec: str):
+    '''
+    Runs an agent in this process, one json observation per line in, one json list of actions per line out.
+    The agent is imported from its own directory, as on Kaggle, and its prints are sent to stderr.
+    '''
+    module_path, function_name = spec.rsplit(":", 1)
+    directory = os.path.dirname(module_path)
+    os.chdir(directory)
+    sys.path.insert(0, directory)
+
+    protocol = sys.stdout
+    sys.stdout = sys.stderr
+
+    module_spec = importlib.util.spec_from_file_location("agent", module_path)
+    module = importlib.util.module_from_spec(module_spec)
+    sys.modules["agent"] = module
+    module_spec.loader.exec_module(module)
+    agent = getattr(module, function_name)
+
+    for line in sys.stdin:
+        request = json.loads(line)
+        try:
+            response = {"actions": agent(Observation(request["observation"]), Observation(request["configuration"]))}
+        except Exception:
+            response = {"error": traceback.format_exc()}
+        protocol.write(json.dumps(response) + "\n")
+        protocol.flush()
+
+
+class AgentProcess:
+    '''
+    A kaggle_environments agent that forwards the observations to an agent served in a subprocess.
+    Records the time taken for every turn.
+    '''
+
+    def __init__(self, spec: str, log_path: str):
+        self.spec = spec
+        self.log = open(log_path, "w")
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--serve", spec],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=self.log,
+            text=True, bufsize=1)
+        self.latencies: List[float] = []
+
+    def __call__(self, observation, configuration):
+        timeout = configuration.get("actTimeout", 3) + observation.get("remainingOverageTime", 60) + RESPONSE_SLACK
+        start_time = time.time()
+        self.process.stdin.write(json.dumps({
+            "observation": dict(observation), "configuration": dict(configuration)}) + "\n")
+        self.process.stdin.flush()
+
+        ready, _, _ = select.select([self.process.stdout], [], [], timeout)
+        line = self.process.stdout.readline() if ready else ""
+        self.latencies.append(time.time() - start_time)
+        if not line:
+            raise RuntimeError("{} did not respond, see {}".format(self.spec, self.log.name))
+
+        response = json.loads(line)
+        if "error" in response:
+            raise RuntimeError(response["error"])
+        return response["actions"]
+
+    def close(self):
+        self.process.kill()
+        self.process.wait()
+        self.log.close()
+
+
+def count_city_tiles_and_units(updates: List[str]) -> Tuple[List[int], List[int]]:
+    city_tiles, units = [0, 0], [0, 0]
+    for update in updates:
+        strs = update.split(" ")
+        if strs[0] == "ct":
+            city_tiles[int(strs[1])] += 1
+        elif strs[0] == "u":
+            units[int(strs[2])] += 1
+    return city_tiles, units
+
+
+def play_game(game: Dict) -> Dict:
+    '''
+    Plays one game between the agents in game["agents"], the first agent is player 0.
+    Returns a row of the report, with the per-turn latencies of both players.
+    '''
+    from kaggle_environments import make
+
+    configuration = {"seed": game["seed"], "loglevel": 0, "annotations": False}
+    if game["size"]:
+        configuration.update({"width": game["size"], "height": game["size"]})
+    env = make("lux_ai_2021", configuration=configuration, debug=False)
+
+    players = [AgentProcess(spec, os.path.join(game["log_dir"], "game-{}-{}.log".format(game["game"], player_id)))
+               for player_id, spec in enumerate(game["agents"])]
+    try:
+        steps = env.run(players)
+    finally:
+        for player in players:
+            player.close()
+
+    final_observation = steps[-1][0]["observation"]
+    city_tiles, units = count_city_tiles_and_units(final_observation["updates"])
+    rewards = [state["reward"] if state["reward"] is not None else -1 for state in steps[-1]]
+
+    winner = "draw"
+    if rewards[0] != rewards[1]:
+        winner = game["names"][int(np.argmax(rewards))]
+
+    row = {
+        "game": game["game"],
+        "seed": game["seed"],
+        "width": final_observation["width"],
+        "height": final_observation["height"],
+        "turns": len(steps) - 1,
+        "winner": winner,
+    }
+    for player_id, player in enumerate(players):
+        latencies = np.array(player.latencies or [0])
+        row.update({
+            "agent_{}".format(player_id): game["names"][player_id],
+            "status_{}".format(player_id): steps[-1][player_id]["status"],
+            "reward_{}".format(player_id): rewards[player_id],
+            "city_tiles_{}".format(player_id): city_tiles[player_id],
+            "units_{}".format(player_id): units[player_id],
+            "latency_mean_{}".format(player_id): float(latencies.mean()),
+            "latency_max_{}".format(player_id): float(latencies.max()),
+        })
+    row["latencies"] = [player.latencies for player in players]
+    return row
+
+
+def summarize(rows: List[Dict], names: List[str]) -> Dict:
+    summary = {"games": len(rows), "agents": {}}
+    for name in names:
+        wins = draws = 0
+        city_tiles, latencies = [], []
+        for row in rows:
+            for player_id in [0, 1]:
+                if row["agent_{}".format(player_id)] != name:
+                    continue
+                wins += row["winner"] == name
+                draws += row["winner"] == "draw"
+                city_tiles.append(row["city_tiles_{}".format(player_id)])
+                latencies.extend(row["latencies"][player_id])
+
+        games = len(city_tiles)
+        city_tiles, latencies = np.array(city_tiles or [0]), np.array(latencies or [0])
+        histogram, _ = np.histogram(latencies, bins=LATENCY_BINS)
+        summary["agents"][name] = {
+            "games": games,
+            "wins": wins,
+            "draws": draws,
+            "losses": games - wins - draws,
+            "win_rate": wins / games if games else 0,
+            "city_tiles_mean": float(city_tiles.mean()),
+            "city_tiles_median": float(np.median(city_tiles)),
+            "latency_mean": float(latencies.mean()),
+            "latency_median": float(np.median(latencies)),
+            "latency_p90": float(np.percentile(latencies, 90)),
+            "latency_p99": float(np.percentile(latencies, 99)),
+            "latency_max": float(latencies.max()),
+            "latency_histogram_bins": LATENCY_BINS[1:],
+            "latency_histogram_counts": histogram.tolist(),
+        }
+    return summary
+
+
+def run_tournament(specs: List[str], games: int, workers: int, seed: int, size: int, out_dir: str) -> Dict:
+    names = list(specs)
+    if names[0] == names[1]:
+        names = [names[0] + "#0", names[1] + "#1"]
+
+    log_dir = os.path.join(out_dir, "logs")
+    os.makedirs(log_dir, exist_ok=True)
+    specs = [resolve_agent(spec, os.path.join(out_dir, "snapshots-{}".format(i))) for i, spec in enumerate(specs)]
+
+    # each map is played with both sides, so that neither agent benefits from the side
+    schedule = []
+    for game_index in range(games):
+        order = [0, 1] if game_index % 2 == 0 else [1, 0]
+        schedule.append({
+            "game": game_index,
+            "seed": seed + game_index // 2,
+            "size": size,
+            "agents": [specs[i] for i in order],
+            "names": [names[i] for i in order],
+            "log_dir": log_dir,
+        })
+
+    rows = []
+    with open(os.path.join(out_dir, "games.csv"), "w", newline="") as csv_file, \
+            open(os.path.join(out_dir, "games.jsonl"), "w") as jsonl_file:
+        writer = csv.DictWriter(csv_file, fieldnames=CSV_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(play_game, game): game for game in schedule}
+            for future in concurrent.futures.as_completed(futures):
+                game = futures[future]
+                try:
+                    row = future.result()
+                except Exception:
+                    print("game {} failed\n{}".format(game["game"], traceback.format_exc()), file=sys.stderr)
+                    continue
+
+                rows.append(row)
+                writer.writerow(row)
+                csv_file.flush()
+                jsonl_file.write(json.dumps({key: value for key, value in row.items() if key != "latencies"}) + "\n")
+                jsonl_file.flush()
+
+                summary = summarize(rows, names)
+                with open(os.path.join(out_dir, "summary.json"), "w") as f:
+                    json.dump(summary, f, indent=2)
+                print("game {} seed {} {} vs {}: {} ({} - {} city tiles)".format(
+                    row["game"], row["seed"], row["agent_0"], row["agent_1"], row["winner"],
+                    row["city_tiles_0"], row["city_tiles_1"]))
+
+    return summarize(rows, names)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "--serve":
+        serve(sys.argv[2])
+        sys.exit()
+
+    parser = argparse.ArgumentParser(description="Play a local tournament between two agents")
+    parser.add_argument("agents", nargs=2, help="path/to/agent.py:function, an agent directory or a submission.tar.gz")
+    parser.add_argument("--games", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first map")
+    parser.add_argument("--size", type=int, default=0, help="map size, random if not given")
+    parser.add_argument("--out", type=str, default="tournament", help="directory of the reports")
+    args = parser.parse_args()
+
+    summary = run_tournament(args.agents, args.games, args.workers, args.seed, args.size, args.out)
+    for name, result in summary["agents"].items():
+        print("{} win rate {:.2f} ({}/{}/{}) city tiles {:.1f} latency median {:.3f}s p99 {:.3f}s".format(
+            name, result["win_rate"], result["wins"], result["draws"], result["losses"],
+            result["city_tiles_mean"], result["latency_median"], result["latency_p99"]))